@@ -0,0 +1,360 @@
+"""
+Benchmarks of the packaging code paths: util.make_zip, util.unzip, chrome_store.repack_crx and FFStore.parse_manifest.
+
+Synthetic extension trees are generated from a fixed seed, so the numbers of two runs (e.g. of two commits) are
+comparable. Every benchmark runs in a fresh process so that its peak RSS is not influenced by the others.
+
+Run from the root of the repository::
+
+   python benchmarks/packaging.py --output before.json
+   git checkout <other commit>
+   python benchmarks/packaging.py --compare before.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import random
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from webstore_manager import logging_helper, util  # noqa: E402
+from webstore_manager.chrome_store import chrome_store  # noqa: E402
+from webstore_manager.firefox_store import firefox_store  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+SEED = 20170129
+MiB = 1024 * 1024
+
+WORDS = ("function var let const return if else for while this new null true false undefined document window "
+         "chrome browser runtime tabs storage local sync addListener sendMessage querySelector innerHTML style "
+         "length push map filter reduce then catch async await class extends import export default").split()
+
+CASES = ('make_zip', 'unzip', 'repack_crx', 'parse_manifest')
+
+
+def _text_pool(rng, size=MiB):
+    """ Source-code-like text, compressible about as well as real extension scripts. """
+    words = []
+    length = 0
+    while length < size:
+        word = rng.choice(WORDS)
+        if rng.random() < 0.1:
+            word += str(rng.randrange(1000))
+        words.append(word)
+        length += len(word) + 1
+    return ' '.join(words).encode()
+
+
+def _text(rng, pool, size):
+    chunks = []
+    while size > 0:
+        chunk_size = min(size, rng.randrange(256, 4096))
+        start = rng.randrange(len(pool) - chunk_size)
+        chunks.append(pool[start:start + chunk_size])
+        size -= chunk_size
+    return b''.join(chunks)
+
+
+def _random_bytes(rng, size):
+    """ Incompressible data, standing in for images, fonts and other already compressed assets. """
+    return rng.getrandbits(size * 8).to_bytes(size, 'little')
+
+
+def _write(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+def _write_manifest(root, name):
+    manifest = {
+        'manifest_version': 2,
+        'name': name,
+        'version': '1.0.0',
+        'applications': {'gecko': {'id': '{}@benchmark'.format(name)}},
+    }
+    _write(os.path.join(root, 'manifest.json'), json.dumps(manifest, indent=2).encode())
+
+
+def generate_small_files(root, scale, rng, pool):
+    """ Many small scripts and stylesheets in nested folders. """
+    for i in range(max(1, int(2000 * scale))):
+        path = os.path.join(root, 'src', 'module{}'.format(i // 50), 'file{}.js'.format(i))
+        _write(path, _text(rng, pool, rng.randrange(512, 4096)))
+
+
+def generate_big_files(root, scale, rng, pool):
+    """ A few large bundles. """
+    for i in range(4):
+        _write(os.path.join(root, 'dist', 'bundle{}.js'.format(i)), _text(rng, pool, int(8 * MiB * scale)))
+
+
+def generate_precompressed(root, scale, rng, pool):
+    """ Images and fonts, which do not shrink when compressed. """
+    for i in range(max(1, int(40 * scale))):
+        extension = ('png', 'woff2', 'jpg')[i % 3]
+        path = os.path.join(root, 'assets', 'asset{}.{}'.format(i, extension))
+        _write(path, _random_bytes(rng, rng.randrange(128 * 1024, 384 * 1024)))
+
+
+CORPORA = {
+    'small_files': generate_small_files,
+    'big_files': generate_big_files,
+    'precompressed': generate_precompressed,
+}
+
+
+def generate_corpus(name, root, scale):
+    """
+    Generate a synthetic extension tree. The same name and scale always generate the same files.
+
+    Args:
+        name(str): One of CORPORA.
+        root(str): Folder to generate the tree into.
+        scale(float): Multiplier of the number or size of files.
+
+    Returns:
+        int: Total size of the generated files in bytes.
+    """
+    rng = random.Random('{}-{}'.format(SEED, name))
+    CORPORA[name](root, scale, rng, _text_pool(rng))
+    _write_manifest(root, name)
+    return _folder_size(root)
+
+
+def _folder_size(path):
+    return sum(os.path.getsize(os.path.join(root, file)) for root, _, files in os.walk(path) for file in files)
+
+
+def _write_crx(zip_name, crx_name):
+    """ Wrap a zip archive into a CRX3 file with a dummy header. """
+    header = b'\0' * 64
+    with open(crx_name, 'wb') as crx, open(zip_name, 'rb') as zip_file:
+        crx.write(chrome_store.CRX_MAGIC + struct.pack('<II', 3, len(header)) + header)
+        crx.write(zip_file.read())
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024  # kilobytes on Linux
+
+
+def _run_case(case, corpus, work_dir, repeat, jobs):
+    """
+    Run a single benchmark. Executed in a fresh process.
+
+    Returns:
+        dict: Best time in seconds, input and output sizes in bytes and peak RSS in bytes.
+    """
+    logging_helper.set_level(logging.WARNING)
+    zip_name = os.path.join(work_dir, 'corpus.zip')
+    crx_name = os.path.join(work_dir, 'corpus.crx')
+    out_dir = os.path.join(work_dir, 'out')
+    os.makedirs(out_dir, exist_ok=True)
+
+    if case == 'make_zip':
+        input_size = _folder_size(corpus)
+        output = os.path.join(out_dir, 'made.zip')
+        run = lambda: util.make_zip(output, corpus, jobs=jobs)  # noqa: E731
+    elif case == 'unzip':
+        input_size = os.path.getsize(zip_name)
+        output = os.path.join(out_dir, 'unzipped')
+        run = lambda: util.unzip(zip_name, output)  # noqa: E731
+    elif case == 'repack_crx':
+        input_size = os.path.getsize(crx_name)
+        output = os.path.join(out_dir, 'corpus.zip')
+        run = lambda: chrome_store.repack_crx(crx_name, out_dir)  # noqa: E731
+    elif case == 'parse_manifest':
+        input_size = os.path.getsize(zip_name)
+        output = None
+
+        def run():
+            firefox_store._manifest_cache.clear()  # measure the cold path
+            firefox_store.FFStore.parse_manifest(zip_name)
+    else:
+        raise ValueError("Unknown benchmark: {}".format(case))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        run()
+        times.append(time.perf_counter() - start)
+
+    if output is None:
+        output_size = None
+    elif os.path.isdir(output):
+        output_size = _folder_size(output)
+    else:
+        output_size = os.path.getsize(output)
+
+    util.scratch_space.wait()
+    return {
+        'seconds': min(times),
+        'input_bytes': input_size,
+        'output_bytes': output_size,
+        'peak_rss': _peak_rss(),
+    }
+
+
+def _report_case(connection, *args):
+    """ Run a benchmark and send (result, None) or (None, formatted traceback) back to the parent process. """
+    try:
+        connection.send((_run_case(*args), None))
+    except BaseException:
+        connection.send((None, traceback.format_exc()))
+    finally:
+        connection.close()
+
+
+def _run_in_process(context, *args):
+    """
+    Run a benchmark in a fresh process. It is a plain process rather than a pool worker - pool workers are daemonic
+    and could not start the compressing processes of make_zip.
+    """
+    receiver, sender = context.Pipe(duplex=False)
+    process = context.Process(target=_report_case, args=(sender,) + args)
+    process.start()
+    sender.close()
+    try:
+        result, error = receiver.recv()
+    except EOFError:  # killed before sending anything
+        result, error = None, None
+    finally:
+        receiver.close()
+        process.join()
+    if result is None and error is None:
+        error = "Process exited with code {}.".format(process.exitcode)
+    if error:
+        raise RuntimeError("Benchmark {} failed:\n{}".format(args[0], error))
+    return result
+
+
+def run_benchmarks(corpora, cases, scale=1.0, repeat=3, jobs=1):
+    """
+    Generate the corpora and run benchmarks on them.
+
+    Args:
+        corpora(:obj:`list` of :obj:`str`): Names of corpora to use, see CORPORA.
+        cases(:obj:`list` of :obj:`str`): Benchmarks to run, see CASES.
+        scale(float, optional): Multiplier of the corpora sizes.
+        repeat(int, optional): Number of repetitions of every benchmark, the best time is reported.
+        jobs(int, optional): Number of compressing processes of make_zip.
+
+    Returns:
+        dict: Results keyed by "corpus/case".
+    """
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    with tempfile.TemporaryDirectory(prefix='webstoremgr-bench-') as base_dir:
+        for corpus_name in corpora:
+            work_dir = os.path.join(base_dir, corpus_name)
+            corpus = os.path.join(work_dir, 'corpus')
+            print("Generating corpus {}...".format(corpus_name), file=sys.stderr)
+            generate_corpus(corpus_name, corpus, scale)
+            util.make_zip(os.path.join(work_dir, 'corpus.zip'), corpus)
+            _write_crx(os.path.join(work_dir, 'corpus.zip'), os.path.join(work_dir, 'corpus.crx'))
+
+            for case in cases:
+                result = _run_in_process(context, case, corpus, work_dir, repeat, jobs)
+                results['{}/{}'.format(corpus_name, case)] = result
+                print(format_result(corpus_name, case, result), file=sys.stderr)
+    return results
+
+
+def format_result(corpus, case, result):
+    throughput = result['input_bytes'] / result['seconds'] / MiB if result['seconds'] else float('inf')
+    return "{:<14} {:<15} {:>9.4f} s {:>9.1f} MiB/s  out {:>12}  rss {:>9}".format(
+        corpus, case, result['seconds'], throughput,
+        '-' if result['output_bytes'] is None else '{:.2f} MiB'.format(result['output_bytes'] / MiB),
+        '-' if result['peak_rss'] is None else '{:.1f} MiB'.format(result['peak_rss'] / MiB))
+
+
+def compare(results, baseline, threshold):
+    """
+    Print relative changes against results of a previous run.
+
+    Args:
+        results(dict): Results of this run.
+        baseline(dict): Results of a previous run.
+        threshold(float): Relative slowdown, growth of peak RSS or of output size considered a regression.
+
+    Returns:
+        bool: True if there is any regression.
+    """
+    regressed = False
+    for key, result in sorted(results.items()):
+        previous = baseline.get(key)
+        if not previous:
+            continue
+
+        changes = []
+        for metric in ('seconds', 'peak_rss', 'output_bytes'):
+            if not previous.get(metric) or result.get(metric) is None:
+                continue
+            change = result[metric] / previous[metric] - 1
+            flag = ''
+            if change > threshold:
+                flag = ' REGRESSION'
+                regressed = True
+            changes.append("{} {:+.1%}{}".format(metric, change, flag))
+        print("{:<30} {}".format(key, ', '.join(changes)))
+    return regressed
+
+
+def _git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main(argv=None):
+    arg_parser = argparse.ArgumentParser(description="Benchmark packaging of extensions.")
+    arg_parser.add_argument('--corpus', action='append', choices=sorted(CORPORA),
+                            help="Corpus to use. May be repeated. Defaults to all.")
+    arg_parser.add_argument('--case', action='append', choices=CASES,
+                            help="Benchmark to run. May be repeated. Defaults to all.")
+    arg_parser.add_argument('--scale', type=float, default=1.0, help="Multiplier of the corpora sizes.")
+    arg_parser.add_argument('--repeat', type=int, default=3, help="Repetitions of every benchmark.")
+    arg_parser.add_argument('--jobs', type=int, default=1, help="Compressing processes of make_zip.")
+    arg_parser.add_argument('--output', help="Write results into this JSON file.")
+    arg_parser.add_argument('--compare', help="JSON file with results of a previous run to compare with.")
+    arg_parser.add_argument('--threshold', type=float, default=0.1,
+                            help="Relative change considered a regression when comparing. Default 0.1 (10%%).")
+    args = arg_parser.parse_args(argv)
+    logging_helper.set_level(logging.WARNING)
+
+    results = run_benchmarks(args.corpus or sorted(CORPORA), args.case or list(CASES), args.scale, args.repeat,
+                             args.jobs)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'revision': _git_revision(), 'scale': args.scale, 'results': results}, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('scale') != args.scale:
+            print("Warning: baseline was run with scale {}.".format(baseline.get('scale')), file=sys.stderr)
+        if compare(results, baseline['results'], args.threshold):
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
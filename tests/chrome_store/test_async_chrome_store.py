@@ -0,0 +1,92 @@
+import asyncio
+import threading
+import time
+
+import pytest
+from flexmock import flexmock
+
+from webstore_manager.chrome_store.async_chrome_store import AsyncChromeStore, ChromeStoreError
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.constants import ErrorCodes
+
+
+def test_bounded_concurrency(monkeypatch):
+    lock = threading.Lock()
+    running = [0]
+    peak = [0]
+
+    def get_uploaded_version(self):
+        with lock:
+            running[0] += 1
+            peak[0] = max(peak[0], running[0])
+        time.sleep(0.02)
+        with lock:
+            running[0] -= 1
+        return 'version of ' + self.app_id
+
+    monkeypatch.setattr(ChromeStore, 'get_uploaded_version', get_uploaded_version)
+
+    async def check(app_ids):
+        async with AsyncChromeStore('id', 'secret', 'refresh', concurrency=4) as store:
+            return await asyncio.gather(*(store.get_uploaded_version(app_id) for app_id in app_ids))
+
+    app_ids = ['app{}'.format(i) for i in range(20)]
+    assert asyncio.run(check(app_ids)) == ['version of ' + app_id for app_id in app_ids]
+    assert peak[0] <= 4
+
+
+def test_reused_in_another_loop(monkeypatch):
+    monkeypatch.setattr(ChromeStore, 'get_uploaded_version', lambda self: 'version of ' + self.app_id)
+    store = AsyncChromeStore('id', 'secret', 'refresh', concurrency=2)
+
+    async def check(app_ids):
+        return await asyncio.gather(*(store.get_uploaded_version(app_id) for app_id in app_ids))
+
+    try:
+        for _ in range(2):
+            assert asyncio.run(check(['a', 'b', 'c'])) == ['version of a', 'version of b', 'version of c']
+    finally:
+        store.close()
+
+
+def test_token_shared():
+    flexmock(ChromeStore).should_receive('refresh_access_token').and_return(('token', 3600)).once()
+
+    async def tokens():
+        async with AsyncChromeStore('id', 'secret', 'refresh') as store:
+            return await asyncio.gather(*(store.generate_access_token() for _ in range(10)))
+
+    assert asyncio.run(tokens()) == ['token'] * 10
+
+
+def test_failure_raised():
+    flexmock(ChromeStore).should_receive('publish').and_raise(SystemExit(ErrorCodes.chrome_publish_bad_status))
+
+    async def publish():
+        async with AsyncChromeStore('id', 'secret', 'refresh') as store:
+            await store.publish('app', ChromeStore.TARGET_PUBLIC)
+
+    with pytest.raises(ChromeStoreError) as error:
+        asyncio.run(publish())
+    assert error.value.code == ErrorCodes.chrome_publish_bad_status
+
+
+def test_close_does_not_block_loop(monkeypatch):
+    monkeypatch.setattr(ChromeStore, 'publish', lambda self, target: time.sleep(0.2))
+
+    async def ticker(ticks):
+        while True:
+            ticks.append(1)
+            await asyncio.sleep(0.01)
+
+    async def close_while_running():
+        ticks = []
+        async with AsyncChromeStore('id', 'secret', 'refresh') as store:
+            asyncio.ensure_future(store.publish('app', ChromeStore.TARGET_PUBLIC))
+            await asyncio.sleep(0.01)
+            ticking = asyncio.ensure_future(ticker(ticks))
+        ticking.cancel()
+        return len(ticks)
+
+    # The pending publish keeps close waiting for about 0.2 seconds, the loop keeps running meanwhile.
+    assert asyncio.run(close_while_running()) > 5
@@ -0,0 +1,101 @@
+import asyncio
+import json
+import os
+
+import pytest
+from click.testing import CliRunner
+from flexmock import flexmock
+
+from webstore_manager.chrome_store import bulk
+from webstore_manager.chrome_store.async_chrome_store import AsyncChromeStore
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.constants import ErrorCodes
+from webstore_manager.manager import main
+from webstore_manager.util import temp_dir
+
+jobs_dir = 'tests/files/temp_test_bulk'
+
+
+def _write(name, content):
+    path = os.path.join(jobs_dir, name)
+    with open(path, 'w') as f:
+        f.write(content)
+    return path
+
+
+def test_read_jobs():
+    with temp_dir(jobs_dir):
+        csv_jobs = bulk.read_jobs(_write('jobs.csv', 'app_id,file,target,comment\na, a.zip ,public,x\nb,b.zip,\n'))
+        json_jobs = bulk.read_jobs(_write('jobs.json', json.dumps({'jobs': [
+            {'app_id': 'a', 'file': 'a.zip', 'target': 'public'},
+            {'app_id': 'b', 'file': 'b.zip'},
+        ]})))
+
+    assert csv_jobs == json_jobs == [{'app_id': 'a', 'file': 'a.zip', 'target': 'public'},
+                                     {'app_id': 'b', 'file': 'b.zip', 'target': ''}]
+
+
+def test_validate_jobs():
+    bulk.validate_jobs([{'app_id': 'a', 'file': '', 'target': ''}])
+
+    with pytest.raises(bulk.InvalidJobError):
+        bulk.validate_jobs([{'app_id': '', 'file': 'a.zip', 'target': ''}])
+    with pytest.raises(bulk.InvalidJobError):
+        bulk.validate_jobs([{'app_id': 'a', 'file': '', 'target': ''}], require_file=True)
+    with pytest.raises(bulk.InvalidJobError):
+        bulk.validate_jobs([{'app_id': 'a', 'file': '', 'target': 'everyone'}])
+
+
+def test_upload_many(monkeypatch):
+    uploaded = []
+    published = []
+
+    def upload(self, filename, new_item=False, chunk_size=None, progress=None, force=False):
+        if self.app_id == 'bad':
+            exit(ErrorCodes.chrome_upload_app_not_found)
+        uploaded.append((self.app_id, filename))
+        return self.app_id
+
+    monkeypatch.setattr(ChromeStore, 'upload', upload)
+    monkeypatch.setattr(ChromeStore, 'publish', lambda self, target: published.append((self.app_id, target)))
+
+    jobs = [{'app_id': 'a', 'file': 'a.zip', 'target': 'trusted'},
+            {'app_id': 'bad', 'file': 'bad.zip', 'target': 'public'},
+            {'app_id': 'c', 'file': 'c.zip', 'target': ''}]
+    store = AsyncChromeStore('id', 'secret', 'refresh', concurrency=2)
+    results = asyncio.run(bulk.upload_many(store, jobs))
+    store.close()
+
+    assert sorted(uploaded) == [('a', 'a.zip'), ('c', 'c.zip')]
+    assert published == [('a', ChromeStore.TARGET_TRUSTED)]
+
+    summary = bulk.summarize(results)
+    assert summary['succeeded'] == 2
+    assert summary['failed'] == 1
+    assert [result['status'] for result in summary['results']] == ['success', 'failure', 'success']
+    assert summary['results'][1]['error_code'] == ErrorCodes.chrome_upload_app_not_found
+
+
+def test_publish_many_cli():
+    flexmock(ChromeStore).should_receive('publish').and_return('item').times(2)
+
+    with temp_dir(jobs_dir):
+        jobs_file = _write('jobs.csv', 'app_id,target\na,\nb,public\n')
+        output = os.path.join(jobs_dir, 'summary.json')
+        result = CliRunner().invoke(main, ['chrome', '--no-token-store', 'publish-many', 'id', 'secret', 'refresh',
+                                           jobs_file, '--target', 'trusted', '--output', output])
+        with open(output) as f:
+            summary = json.load(f)
+
+    assert result.exit_code == 0
+    assert summary['succeeded'] == 2
+    assert [r['target'] for r in summary['results']] == ['trusted', 'public']
+
+
+def test_publish_many_cli_missing_target():
+    with temp_dir(jobs_dir):
+        jobs_file = _write('jobs.csv', 'app_id,target\na,\n')
+        result = CliRunner().invoke(main, ['chrome', '--no-token-store', 'publish-many', 'id', 'secret', 'refresh',
+                                           jobs_file])
+
+    assert result.exit_code == ErrorCodes.bulk_invalid_jobs
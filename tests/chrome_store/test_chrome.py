@@ -1,12 +1,18 @@
+import io
 import os
 import shutil
+import struct
 import zipfile
+import zlib
 
 import pytest
 
 from webstore_manager.chrome_store.chrome_store import ChromeStore
-from webstore_manager.chrome_store.chrome_store import repack_crx
+from webstore_manager.archive import RawZipWriter
+from webstore_manager.chrome_store.chrome_store import InvalidCrxError, crx_payload_offset
+from webstore_manager.chrome_store.chrome_store import repack_crx, repack_crx_buffer
 from webstore_manager.constants import ErrorCodes
+from webstore_manager.util import temp_dir
 
 
 def test_redeem_code(betamax_session, auth):
@@ -115,3 +121,85 @@ def test_repack_crx():
 
     archive.close()
     shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def test_repack_crx_buffer():
+    fn = os.path.join('tests', 'files', 'sample_crx.crx')
+
+    buffer = repack_crx_buffer(fn)
+    archive = zipfile.ZipFile(buffer, 'r')
+
+    txt = archive.read('hello').decode("utf-8")
+    assert txt.find("Sample content") != -1
+
+    txt = archive.read('manifest.json').decode("utf-8")
+    assert txt.find('"name": "Melkamar') != -1
+
+    archive.close()
+    buffer.close()
+
+
+def _crx3(payload_writer):
+    """ Build a CRX3 file in memory. The payload_writer is given the file with the header already written. """
+    crx_header = b'\x0a\x04fake'
+    crx = io.BytesIO()
+    crx.write(b'Cr24' + struct.pack('<II', 3, len(crx_header)) + crx_header)
+    payload_writer(crx)
+    return crx.getvalue()
+
+
+def test_crx_payload_offset():
+    with open(os.path.join('tests', 'files', 'sample_crx.crx'), 'rb') as f:
+        offset = crx_payload_offset(f)
+        f.seek(offset)
+        assert f.read(4) == b'PK\x03\x04'
+
+    with pytest.raises(InvalidCrxError):
+        with open(os.path.join('tests', 'files', 'sample_zip.zip'), 'rb') as f:
+            crx_payload_offset(f)
+
+
+@pytest.mark.parametrize('header', [
+    b'Cr24' + struct.pack('<II', 3, 10 ** 9) + b'\x0a\x04fake',
+    b'Cr24' + struct.pack('<III', 2, 4, 10 ** 9) + b'keysignature',
+])
+def test_crx_truncated_header(header):
+    with pytest.raises(InvalidCrxError):
+        crx_payload_offset(io.BytesIO(header))
+
+    tmp_dir = os.path.join('tests', 'files', 'temp_crx3')
+    with temp_dir(tmp_dir):
+        crx_fn = os.path.join(tmp_dir, 'test.crx')
+        with open(crx_fn, 'wb') as f:
+            f.write(header)
+        with pytest.raises(InvalidCrxError):
+            repack_crx_buffer(crx_fn)
+
+
+@pytest.mark.parametrize('absolute_offsets', [False, True])
+def test_crx3_to_zip(absolute_offsets):
+    """ Zip archive in the crx may use offsets relative to itself or to the beginning of the crx file. """
+    def write_payload(crx):
+        with RawZipWriter(crx) as writer:
+            if absolute_offsets:
+                writer.offset = crx.tell()
+            for name, content in [('manifest.json', b'{"name": "Melkamar"}' * 10), ('js/app.js', b'var a = 1;')]:
+                zip_info = zipfile.ZipInfo(name)
+                zip_info.CRC = zlib.crc32(content)
+                zip_info.file_size = len(content)
+                writer.write_raw(zip_info, content)
+
+    tmp_dir = os.path.join('tests', 'files', 'temp_crx3')
+    with temp_dir(tmp_dir):
+        crx_fn = os.path.join(tmp_dir, 'test.crx')
+        with open(crx_fn, 'wb') as f:
+            f.write(_crx3(write_payload))
+
+        buffer = repack_crx_buffer(crx_fn)
+        assert buffer.read(4) == b'PK\x03\x04'
+        with zipfile.ZipFile(buffer) as archive:
+            assert archive.testzip() is None
+            assert archive.infolist()[0].header_offset == 0
+            assert archive.read('js/app.js') == b'var a = 1;'
+            assert archive.read('manifest.json') == b'{"name": "Melkamar"}' * 10
+        buffer.close()
@@ -0,0 +1,153 @@
+import io
+import json
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from webstore_manager.chrome_store import chrome_store
+from webstore_manager.chrome_store.chrome_store import ChromeStore, UPLOAD_CHUNK_ALIGNMENT
+
+SESSION_URL = 'https://upload.example/session'
+
+
+def _response(status, headers=None, body=None):
+    response = requests.Response()
+    response.status_code = status
+    response.headers.update(headers or {})
+    response._content = json.dumps(body).encode() if body is not None else b''
+    return response
+
+
+class FakeUploadServer:
+    """ Mimics the resumable upload protocol. Connections fail on requests listed in fail_on. """
+
+    def __init__(self, fail_on=()):
+        self.received = b''
+        self.total = None
+        self.fail_on = set(fail_on)
+        self.requests = 0
+        self.chunks = []
+
+    def request(self, method, url, params=None, headers=None, **kwargs):
+        assert params == {'uploadType': 'resumable'}
+        self.total = int(headers['X-Upload-Content-Length'])
+        return _response(200, {'Location': SESSION_URL})
+
+    def put(self, url, headers=None, data=None):
+        assert url == SESSION_URL
+        self.requests += 1
+        content_range = headers['Content-Range']
+
+        if not content_range.startswith('bytes */'):
+            start = int(content_range.split(' ')[1].split('-')[0])
+            assert start == len(self.received)
+            self.chunks.append(content_range)
+            if self.requests in self.fail_on:
+                raise requests.ConnectionError("connection reset")
+            self.received += data
+
+        if len(self.received) == self.total:
+            return _response(200, body={'uploadState': 'SUCCESS', 'id': 'appid', 'crxVersion': '1.2.3'})
+        if not self.received:
+            return _response(308)
+        return _response(308, {'Range': 'bytes=0-{}'.format(len(self.received) - 1)})
+
+
+def _store(server):
+    store = ChromeStore('id', 'secret', 'refresh', app_id='appid')
+    store.session = server
+    flexmock(store).should_receive('generate_access_token').and_return('token')
+    return store
+
+
+def test_chunked_upload():
+    payload = bytes(range(256)) * (UPLOAD_CHUNK_ALIGNMENT * 2 // 256 + 100)
+    server = FakeUploadServer()
+    progress = []
+
+    assert _store(server).upload(io.BytesIO(payload), chunk_size=UPLOAD_CHUNK_ALIGNMENT,
+                                 progress=lambda sent, total: progress.append(sent)) == 'appid'
+    assert server.received == payload
+    assert len(server.chunks) == 3
+    assert progress[-1] == len(payload)
+
+
+def test_chunked_upload_resumes():
+    flexmock(chrome_store.time).should_receive('sleep')
+    payload = b'x' * (UPLOAD_CHUNK_ALIGNMENT * 3)
+    server = FakeUploadServer(fail_on={2})
+
+    assert _store(server).upload(io.BytesIO(payload), chunk_size=UPLOAD_CHUNK_ALIGNMENT) == 'appid'
+    assert server.received == payload
+    # The failed chunk is sent again after a status query, the completed one is not.
+    assert server.chunks == ['bytes 0-262143/786432', 'bytes 262144-524287/786432', 'bytes 262144-524287/786432',
+                             'bytes 524288-786431/786432']
+
+
+def test_chunked_upload_gives_up():
+    flexmock(chrome_store.time).should_receive('sleep')
+    server = FakeUploadServer(fail_on=set(range(1, 100)))
+
+    with pytest.raises(requests.ConnectionError):
+        _store(server).upload(io.BytesIO(b'x' * 10), chunk_size=UPLOAD_CHUNK_ALIGNMENT)
+
+
+def test_chunked_upload_without_progress_gives_up():
+    sleeps = []
+    flexmock(chrome_store.time).should_receive('sleep').replace_with(sleeps.append)
+    server = FakeUploadServer()
+    session = flexmock(request=server.request)
+    session.should_receive('put').and_return(_response(308, {'Range': 'bytes=0-262143'}))
+    store = _store(server)
+    store.session = session
+
+    with pytest.raises(requests.ConnectionError, match='did not receive'):
+        store.upload(io.BytesIO(b'x' * (UPLOAD_CHUNK_ALIGNMENT * 2)), chunk_size=UPLOAD_CHUNK_ALIGNMENT)
+    assert len(sleeps) == chrome_store.UPLOAD_RETRIES
+    assert sleeps == sorted(sleeps)
+
+
+def test_upload_result():
+    store = _store(FakeUploadServer())
+    result = store.upload(io.BytesIO(b'x' * 10), chunk_size=UPLOAD_CHUNK_ALIGNMENT)
+
+    assert result == result.id == 'appid'
+    assert result.version == '1.2.3'
+    assert result.state == 'SUCCESS'
+    assert store.last_upload is result
+
+
+def test_chunk_size_validated():
+    with pytest.raises(ValueError):
+        _store(FakeUploadServer()).upload(io.BytesIO(b'x'), chunk_size=1000)
+
+
+@pytest.mark.parametrize('chunk_size', [None, UPLOAD_CHUNK_ALIGNMENT])
+def test_upload_retried_with_new_token(chunk_size):
+    payload = b'x' * (UPLOAD_CHUNK_ALIGNMENT + 10)
+    server = FakeUploadServer()
+    request, put = server.request, server.put
+    tokens = []
+
+    def authorized(send):
+        def check(*args, headers=None, **kwargs):
+            tokens.append(headers['Authorization'])
+            if headers['Authorization'] == 'Bearer revoked':
+                return _response(401)
+            return send(*args, headers=headers, **kwargs)
+        return check
+
+    def put_whole(url, headers=None, data=None):
+        server.received = data.read()
+        return _response(200, body={'uploadState': 'SUCCESS', 'id': 'appid', 'crxVersion': '1.2.3'})
+
+    server.request = authorized(request)
+    server.put = authorized(put if chunk_size else put_whole)
+    store = ChromeStore('id', 'secret', 'refresh', app_id='appid')
+    store.session = server
+    flexmock(store).should_receive('_refresh_access_token').and_return(('revoked', 3600)).and_return(('fresh', 3600))
+
+    assert store.upload(io.BytesIO(payload), chunk_size=chunk_size).version == '1.2.3'
+    assert server.received == payload
+    assert tokens[:2] == ['Bearer revoked', 'Bearer fresh']
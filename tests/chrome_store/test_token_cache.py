@@ -0,0 +1,79 @@
+import threading
+import time
+
+from flexmock import flexmock
+
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.chrome_store.token_cache import AccessTokenCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_reused_until_expiry():
+    clock = FakeClock()
+    cache = AccessTokenCache(refresh_margin=60, clock=clock)
+    tokens = iter(['first', 'second'])
+
+    def fetch():
+        return next(tokens), 3600
+
+    assert cache.get('key', fetch) == 'first'
+    clock.now = 3500
+    assert cache.get('key', fetch) == 'first'
+    clock.now = 3541  # within the refresh margin
+    assert cache.get('key', fetch) == 'second'
+
+
+def test_invalidate():
+    cache = AccessTokenCache()
+    tokens = iter(['first', 'second'])
+
+    def fetch():
+        return next(tokens), 3600
+
+    assert cache.get('key', fetch) == 'first'
+    cache.invalidate('key')
+    assert cache.get('key', fetch) == 'second'
+
+
+def test_single_refresh_in_flight():
+    cache = AccessTokenCache()
+    calls = []
+
+    def fetch():
+        calls.append(1)
+        time.sleep(0.05)
+        return 'token', 3600
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get('key', fetch))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert results == ['token'] * 8
+    assert len(calls) == 1
+
+
+def test_store_exchanges_token_once():
+    flexmock(ChromeStore).should_receive('refresh_access_token').and_return(('token', 3600)).once()
+    store = ChromeStore('client_id', 'client_secret', 'refresh_token')
+
+    for _ in range(5):
+        assert store.generate_access_token() == 'token'
+
+
+def test_stores_share_cache():
+    flexmock(ChromeStore).should_receive('refresh_access_token').and_return(('token', 3600)).once()
+    cache = AccessTokenCache()
+    first = ChromeStore('client_id', 'client_secret', 'refresh_token', token_cache=cache)
+    second = ChromeStore('client_id', 'client_secret', 'refresh_token', token_cache=cache)
+
+    assert first.generate_access_token() == second.generate_access_token() == 'token'
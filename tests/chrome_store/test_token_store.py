@@ -0,0 +1,129 @@
+import json
+import os
+import stat
+import threading
+import time
+
+import requests
+from flexmock import flexmock
+
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.chrome_store.token_store import PersistentTokenStore
+from webstore_manager.util import temp_dir
+
+token_dir = 'tests/files/temp_test_token_store'
+
+
+def _fetcher(calls, token='token', expires_in=3600):
+    def fetch():
+        calls.append(1)
+        return token, expires_in
+
+    return fetch
+
+
+def test_token_reused_across_stores():
+    with temp_dir(token_dir):
+        calls = []
+        first = PersistentTokenStore(token_dir)
+        second = PersistentTokenStore(token_dir)
+
+        assert first.get('id', 'secret', 'refresh', _fetcher(calls))[0] == 'token'
+        token, expires_in = second.get('id', 'secret', 'refresh', _fetcher(calls, 'other'))
+        assert token == 'token'
+        assert 3500 < expires_in <= 3600
+        assert len(calls) == 1
+
+
+def test_readable_by_user_only():
+    with temp_dir(token_dir):
+        os.chmod(token_dir, 0o755)
+        store = PersistentTokenStore(token_dir)
+        store.get('id', 'secret', 'refresh', _fetcher([], 'very-secret-access-token'))
+
+        entries = [name for name in os.listdir(token_dir) if name.endswith('.token')]
+        assert len(entries) == 1
+        assert stat.S_IMODE(os.stat(token_dir).st_mode) == 0o700
+        assert stat.S_IMODE(os.stat(os.path.join(token_dir, entries[0])).st_mode) == 0o600
+
+
+def test_corrupted_entry_ignored():
+    with temp_dir(token_dir):
+        calls = []
+        store = PersistentTokenStore(token_dir)
+        store.get('id', 'secret', 'refresh', _fetcher(calls))
+        with open(store._entry_path('id', 'refresh'), 'w') as f:
+            f.write('{not json')
+
+        assert store.get('id', 'secret', 'refresh', _fetcher(calls, 'new'))[0] == 'new'
+        assert len(calls) == 2
+
+
+def test_keyed_by_credentials():
+    with temp_dir(token_dir):
+        calls = []
+        store = PersistentTokenStore(token_dir)
+        store.get('id', 'secret', 'refresh', _fetcher(calls))
+        store.get('id', 'secret', 'other refresh', _fetcher(calls))
+        store.get('other id', 'secret', 'refresh', _fetcher(calls))
+        assert len(calls) == 3
+
+        # Entry does not match a wrong secret, a new token is obtained instead.
+        assert store.get('id', 'wrong secret', 'refresh', _fetcher(calls, 'new'))[0] == 'new'
+        assert len(calls) == 4
+
+
+def test_expired_token_refreshed():
+    with temp_dir(token_dir):
+        calls = []
+        store = PersistentTokenStore(token_dir, refresh_margin=60)
+        store.get('id', 'secret', 'refresh', _fetcher(calls, 'old', expires_in=30))
+        assert store.get('id', 'secret', 'refresh', _fetcher(calls, 'new'))[0] == 'new'
+        assert len(calls) == 2
+
+        store.invalidate('id', 'refresh')
+        assert store.get('id', 'secret', 'refresh', _fetcher(calls, 'newest'))[0] == 'newest'
+
+
+def test_single_exchange_when_concurrent():
+    with temp_dir(token_dir):
+        calls = []
+
+        def fetch():
+            calls.append(1)
+            time.sleep(0.05)
+            return 'token', 3600
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(
+            PersistentTokenStore(token_dir).get('id', 'secret', 'refresh', fetch)[0])) for _ in range(6)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert results == ['token'] * 6
+        assert len(calls) == 1
+
+
+def test_rejected_token_replaced():
+    with temp_dir(token_dir):
+        tokens = iter(['revoked', 'fresh'])
+        flexmock(ChromeStore).should_receive('refresh_access_token').replace_with(
+            lambda *args, **kwargs: (next(tokens), 3600))
+        sent = []
+
+        def get(url, headers=None):
+            sent.append(headers['Authorization'])
+            response = requests.Response()
+            response.status_code = 401 if headers['Authorization'] == 'Bearer revoked' else 200
+            response._content = json.dumps({'crxVersion': '1.0', 'uploadState': 'SUCCESS'}).encode()
+            return response
+
+        store = ChromeStore('id', 'secret', 'refresh', app_id='app', token_store=PersistentTokenStore(token_dir))
+        store.session = flexmock(get=get)
+
+        assert store.get_uploaded_version() == '1.0'
+        assert sent == ['Bearer revoked', 'Bearer fresh']
+        assert store.generate_access_token() == 'fresh'
+        assert PersistentTokenStore(token_dir).get('id', 'secret', 'refresh', _fetcher([], 'other'))[0] == 'fresh'
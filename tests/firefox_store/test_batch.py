@@ -0,0 +1,95 @@
+import threading
+import time
+
+from webstore_manager.firefox_store import batch
+from webstore_manager.firefox_store.firefox_store import FFStore, ValidationResults
+
+
+class FakeStore:
+    """
+    Store signing every addon sign_delay seconds after its upload. Files are named '<addon>-<version>.xpi' and
+    their contents are the addon ID, unless listed in broken (value is how the addon fails).
+    """
+
+    def __init__(self, sign_delay=0.0, broken=None):
+        self.sign_delay = sign_delay
+        self.broken = broken or {}
+        self.uploaded = {}
+        self.polls = []
+        self.downloaded = []
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def parse_manifest(filename):
+        return filename.split('-')[0], filename.split('-')[1][:-len('.xpi')]
+
+    def upload(self, filename, addon_id, addon_version, force=False):
+        if self.broken.get(addon_id) == 'upload':
+            exit(3)
+        with self.lock:
+            self.uploaded[addon_id] = time.monotonic()
+        return True
+
+    def _get_addon_status(self, addon_id, addon_version):
+        with self.lock:
+            self.polls.append(addon_id)
+        if self.broken.get(addon_id) == 'validation':
+            return False, [], ValidationResults(False, 1, 0, []), []
+        if self.broken.get(addon_id) == 'never':
+            return False, [], None, []
+        if time.monotonic() - self.uploaded[addon_id] < self.sign_delay:
+            return False, [], None, []
+        return True, ['https://addons.example/{}.xpi'.format(addon_id)], None, ['sha256:0']
+
+    _check_validation = staticmethod(FFStore._check_validation)
+
+    def download_files(self, urls, hashes=None, folder="", target_name=""):
+        with self.lock:
+            self.downloaded.extend(urls)
+        return True
+
+
+def _run(store, filenames, **kwargs):
+    kwargs.setdefault('interval', 0.05)
+    kwargs.setdefault('first_interval', 0.01)
+    return batch.SignBatch(store, **kwargs).run(filenames)
+
+
+def test_sign_batch():
+    store = FakeStore(sign_delay=0.05)
+
+    results = _run(store, ['a-1.0.xpi', 'b-2.0.xpi', 'c-3.0.xpi'])
+
+    assert [result['status'] for result in results] == ['success'] * 3
+    assert [(result['addon_id'], result['version']) for result in results] == [('a', '1.0'), ('b', '2.0'),
+                                                                                ('c', '3.0')]
+    assert sorted(store.downloaded) == ['https://addons.example/{}.xpi'.format(addon) for addon in 'abc']
+    assert all(result['seconds'] >= 0.05 for result in results)
+
+
+def test_signing_overlaps():
+    store = FakeStore(sign_delay=0.3)
+
+    start = time.monotonic()
+    results = _run(store, ['{}-1.0.xpi'.format(addon) for addon in 'abcdef'], workers=6)
+
+    assert batch.summarize(results)['succeeded'] == 6
+    # Signing one addon takes 0.3 seconds, one after another they would take 1.8.
+    assert time.monotonic() - start < 1.2
+
+
+def test_failures_recorded():
+    store = FakeStore(broken={'a': 'upload', 'b': 'validation', 'c': 'never'})
+
+    results = _run(store, ['a-1.0.xpi', 'b-1.0.xpi', 'c-1.0.xpi', 'd-1.0.xpi'], timeout=0.2)
+
+    assert [result['status'] for result in results] == ['failure', 'failure', 'failure', 'success']
+    assert results[0]['error_code'] == 3
+    assert 'ValidationFailedError' in results[1]['error']
+    assert 'NotProcessedError' in results[2]['error']
+    assert store.polls.count('b') == 1
+    assert store.polls.count('c') > 1
+    assert store.downloaded == ['https://addons.example/d.xpi']
+
+    summary = batch.summarize(results)
+    assert (summary['succeeded'], summary['failed']) == (1, 3)
@@ -0,0 +1,342 @@
+import email
+import hashlib
+import io
+import json
+import logging
+import os
+import threading
+import zipfile
+
+import pytest
+import requests
+from flexmock import flexmock
+
+from webstore_manager.firefox_store import firefox_store
+from webstore_manager.firefox_store.firefox_store import FFStore
+from webstore_manager.util import temp_dir
+
+manifest = {'applications': {'gecko': {'id': 'addon@melkamar'}}, 'version': '1.2.3'}
+
+
+def _write_xpi(target, manifest_json):
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as archive:
+        archive.writestr('manifest.json', json.dumps(manifest_json))
+        archive.writestr('background.js', 'var a = 1;')
+
+
+def test_parse_manifest():
+    tmp_dir = os.path.join('tests', 'files', 'temp_ff')
+    with temp_dir(tmp_dir):
+        xpi = os.path.join(tmp_dir, 'addon.xpi')
+        _write_xpi(xpi, manifest)
+
+        assert FFStore.parse_manifest(xpi) == ('addon@melkamar', '1.2.3')
+        assert os.listdir(tmp_dir) == ['addon.xpi']
+
+
+def test_parse_manifest_file_object():
+    buffer = io.BytesIO()
+    _write_xpi(buffer, manifest)
+
+    assert FFStore.parse_manifest(buffer) == ('addon@melkamar', '1.2.3')
+
+
+def test_parse_manifest_cached(monkeypatch):
+    monkeypatch.setattr(firefox_store, 'MANIFEST_CACHE_SIZE', 2)
+    monkeypatch.setattr(firefox_store, '_manifest_cache', firefox_store.collections.OrderedDict())
+    tmp_dir = os.path.join('tests', 'files', 'temp_ff')
+    with temp_dir(tmp_dir):
+        names = []
+        for version in ('1.0', '2.0', '3.0'):
+            names.append(os.path.join(tmp_dir, '{}.xpi'.format(version)))
+            _write_xpi(names[-1], dict(manifest, version=version))
+
+        assert FFStore.parse_manifest(names[0]) == ('addon@melkamar', '1.0')
+        # Same size and mtime, so the archive is not read again.
+        stat = os.stat(names[0])
+        _write_xpi(names[0], dict(manifest, version='1.1'))
+        os.utime(names[0], ns=(stat.st_atime_ns, stat.st_mtime_ns))
+        assert FFStore.parse_manifest(names[0]) == ('addon@melkamar', '1.0')
+
+        for name in names:
+            FFStore.parse_manifest(name)
+        assert list(firefox_store._manifest_cache.values()) == [('addon@melkamar', '2.0'), ('addon@melkamar', '3.0')]
+
+        buffer = io.BytesIO()
+        _write_xpi(buffer, dict(manifest, version='4.0'))
+        assert FFStore.parse_manifest(buffer) == ('addon@melkamar', '4.0')
+        assert len(firefox_store._manifest_cache) == 2
+
+
+def test_parse_manifest_missing_keys():
+    buffer = io.BytesIO()
+    _write_xpi(buffer, {'version': '1.0'})
+
+    with pytest.raises(KeyError):
+        FFStore.parse_manifest(buffer)
+
+
+STATUS_URL = 'https://addons.mozilla.org/api/v3/addons/addon@melkamar/versions/1.2.3/'
+
+
+def _response(status=200, body=None, content=b''):
+    response = requests.Response()
+    response.status_code = status
+    response._content = json.dumps(body).encode() if body is not None else content
+    response.raw = io.BytesIO(response._content)
+    return response
+
+
+class BrokenStream(io.BytesIO):
+    """ Response body whose connection breaks after the given number of bytes. """
+
+    def __init__(self, content, fail_after):
+        super().__init__(content)
+        self.fail_after = fail_after
+
+    def read(self, size=-1):
+        if self.tell() >= self.fail_after:
+            if self.fail_after < len(self.getvalue()):
+                raise requests.ConnectionError("connection reset")
+            return b''
+        return super().read(min(size, self.fail_after - self.tell()))
+
+
+class FakeAMO:
+    """
+    Session serving an addon version with the given files. File downloads meet at a barrier, if set. Downloads of
+    files listed in fail_after break after the given number of bytes, once. Range responses of a server with
+    range_skew start that many bytes after the requested one.
+    """
+
+    def __init__(self, files, barrier=None, hashes=None, fail_after=None, ranges=True, range_skew=0):
+        self.files = files
+        self.barrier = barrier
+        self.hashes = hashes or {url: 'sha256:' + hashlib.sha256(data).hexdigest() for url, data in files.items()}
+        self.fail_after = dict(fail_after or {})
+        self.ranges = ranges
+        self.range_skew = range_skew
+        self.requests = []
+
+    def get(self, url, headers=None, stream=False):
+        assert headers['Authorization'].startswith('JWT ')
+        self.requests.append(('GET', url, headers.get('Range')))
+        if url == STATUS_URL:
+            return _response(body={'processed': True, 'validation_results': None,
+                                   'files': [{'download_url': name, 'hash': self.hashes[name]}
+                                             for name in self.files]})
+        if self.barrier:
+            self.barrier.wait()
+
+        assert stream
+        content = self.files[url]
+        response = _response(200)
+        if headers.get('Range') and self.ranges:
+            start = int(headers['Range'][len('bytes='):-1]) + self.range_skew
+            if start >= len(content):
+                response = _response(416)
+                response.headers['Content-Range'] = 'bytes */{}'.format(len(content))
+                return response
+            response.status_code = 206
+            response.headers['Content-Range'] = 'bytes {}-{}/{}'.format(start, len(content) - 1, len(content))
+            content = content[start:]
+        response.raw = BrokenStream(content, self.fail_after.pop(url, len(content)))
+        return response
+
+    def put(self, url, headers=None, data=None):
+        self.requests.append(('PUT', url, None))
+        self.uploaded = (headers['Content-Type'], data.read())
+        return _response(body={'guid': 'addon@melkamar'})
+
+
+def _ff_store(session):
+    store = FFStore('issuer', 'secret', session=session)
+    store.gen_jwt_token = lambda: 'token'
+    return store
+
+
+def test_download_concurrently(tmpdir):
+    files = {'https://addons.example/files/a.xpi': b'first', 'https://addons.example/files/b.xpi': b'second'}
+    session = FakeAMO(files, barrier=threading.Barrier(2, timeout=5))
+
+    assert _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == b'first'
+    assert tmpdir.join('b.xpi').read_binary() == b'second'
+    assert session.requests[0] == ('GET', STATUS_URL, None)
+
+
+def test_download_target_name(tmpdir):
+    session = FakeAMO({'https://addons.example/files/a.xpi': b'signed'})
+
+    _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir), target_name='signed.xpi')
+
+    assert tmpdir.listdir() == [tmpdir.join('signed.xpi')]
+
+
+def test_upload_uses_session():
+    session = FakeAMO({})
+    progress = []
+
+    assert _ff_store(session).upload(io.BytesIO(b'xpi'), 'addon@melkamar', '1.2.3',
+                                     progress=lambda sent, total: progress.append((sent, total)))
+    assert session.requests == [('PUT', STATUS_URL, None)]
+
+    content_type, body = session.uploaded
+    message = email.message_from_bytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    [part] = message.get_payload()
+    assert part.get_param('name', header='content-disposition') == 'upload'
+    assert part.get_filename() == 'extension.xpi'
+    assert part.get_payload(decode=True) == b'xpi'
+    assert progress[-1] == (len(body), len(body))
+
+
+FILE_URL = 'https://addons.example/files/a.xpi'
+CONTENT = bytes(range(256)) * 1024
+
+
+def test_download_resumes_interrupted(tmpdir):
+    session = FakeAMO({FILE_URL: CONTENT}, fail_after={FILE_URL: 100000})
+
+    _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+    assert [request[2] for request in session.requests[1:]] == [None, 'bytes=100000-']
+
+
+def test_download_resumes_partial_file(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(CONTENT[:5000])
+    session = FakeAMO({FILE_URL: CONTENT})
+
+    _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.listdir() == [tmpdir.join('a.xpi')]
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+    assert session.requests[1][2] == 'bytes=5000-'
+
+
+def test_download_complete_partial_file(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(CONTENT)
+
+    _ff_store(FakeAMO({FILE_URL: CONTENT})).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+
+
+def test_download_restarts_on_wrong_range(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(CONTENT[:5000])
+    session = FakeAMO({FILE_URL: CONTENT}, range_skew=100)
+
+    _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+    assert [request[2] for request in session.requests[1:]] == ['bytes=5000-', None]
+
+
+def test_download_restarts_partial_file_longer_than_content(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(CONTENT + b'stale')
+
+    _ff_store(FakeAMO({FILE_URL: CONTENT})).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+
+
+def test_download_without_hash_not_resumed_from_stale_file(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(b'x' * 5000)
+    session = FakeAMO({FILE_URL: CONTENT}, hashes={FILE_URL: None})
+
+    _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+    assert session.requests[1][2] is None
+
+
+def test_download_restarts_without_ranges(tmpdir):
+    tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX).write_binary(b'stale')
+
+    _ff_store(FakeAMO({FILE_URL: CONTENT}, ranges=False)).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+
+    assert tmpdir.join('a.xpi').read_binary() == CONTENT
+
+
+def test_download_hash_mismatch(tmpdir):
+    session = FakeAMO({FILE_URL: CONTENT}, hashes={FILE_URL: 'sha256:' + '0' * 64})
+
+    with pytest.raises(firefox_store.DownloadVerificationError):
+        _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+    assert tmpdir.listdir() == []
+
+
+def test_download_gives_up(tmpdir, monkeypatch):
+    monkeypatch.setattr(firefox_store, 'DOWNLOAD_RETRIES', 1)
+    session = FakeAMO({FILE_URL: CONTENT})
+    get = session.get
+
+    def failing_get(url, headers=None, stream=False):
+        response = get(url, headers, stream)
+        if url != STATUS_URL:
+            response.raw = BrokenStream(CONTENT, 10)
+        return response
+
+    session.get = failing_get
+    with pytest.raises(requests.ConnectionError):
+        _ff_store(session).download('addon@melkamar', '1.2.3', folder=str(tmpdir))
+    assert len(session.requests) == 3
+    assert tmpdir.listdir() == [tmpdir.join('a.xpi' + firefox_store.PARTIAL_SUFFIX)]
+
+
+VALIDATION = {
+    'success': False, 'errors': 1, 'warnings': 1,
+    'messages': [
+        {'type': 'warning', 'id': ['UNSAFE_VAR_ASSIGNMENT'], 'message': 'Unsafe assignment', 'file': 'a.js',
+         'line': 3, 'column': 7, 'description': ['Do not', 'do that.'], 'tier': 3, 'uid': 'x'},
+        {'type': 'notice', 'message': 'Just saying'},
+        {'type': 'error', 'id': 'MANIFEST_FIELD', 'message': 'Broken manifest', 'file': 'manifest.json'},
+    ],
+}
+
+
+def test_validation_results_indexed():
+    results = firefox_store.ValidationResults.parse_from_json(VALIDATION)
+
+    assert [message.message for message in results.of_type('error')] == ['Broken manifest']
+    assert [message.message for message in results.of_type('notice', 'warning')] == ['Just saying',
+                                                                                        'Unsafe assignment']
+    warning = results.of_type('warning')[0]
+    assert (warning.id, warning.description, warning.line) == ('UNSAFE_VAR_ASSIGNMENT', 'Do not do that.', 3)
+    assert not hasattr(warning, '__dict__')
+
+
+def test_validation_report():
+    results = firefox_store.ValidationResults.parse_from_json(VALIDATION)
+
+    report = results.print()
+    errors, warnings, others = report.split('---------------------')[1:]
+    assert 'Broken manifest' in errors and 'manifest.json' in errors
+    assert '[UNSAFE_VAR_ASSIGNMENT] Unsafe assignment' in warnings and 'at a.js:3:7' in warnings
+    assert 'Just saying' in others
+    assert results.print() is report
+
+
+def test_validation_report_rendered_lazily():
+    results = firefox_store.ValidationResults(True, 0, 1, [{'type': 'warning', 'message': 'Careful'}])
+    logger = firefox_store.logger
+    level = logger.level
+    try:
+        logger.setLevel(logging.ERROR)
+        flexmock(firefox_store.ValidationResults).should_receive('print').never()
+        FFStore._check_validation(results)
+    finally:
+        logger.setLevel(level)
+
+
+def test_status_parsed_once():
+    response = _response(body={'processed': True, 'validation_results': VALIDATION,
+                               'files': [{'download_url': FILE_URL, 'hash': 'sha256:abc'}]})
+    flexmock(response).should_receive('json').and_return(json.loads(response.content)).once()
+    session = flexmock(get=lambda url, headers=None: response)
+
+    processed, urls, validation_results, hashes = _ff_store(session)._get_addon_status('addon@melkamar', '1.2.3')
+
+    assert (processed, urls, hashes) == (True, [FILE_URL], ['sha256:abc'])
+    assert validation_results.errors == 1
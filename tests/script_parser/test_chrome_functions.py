@@ -4,7 +4,8 @@ import shutil
 import pytest
 from flexmock import flexmock
 
-from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager import polling
+from webstore_manager.chrome_store.chrome_store import ChromeStore, UploadResult
 from webstore_manager.script_parser import parser
 
 
@@ -15,6 +16,17 @@ def test_init():
     assert p.variables['client_id'] == 'id'
     assert p.variables['client_secret'] == 'secret'
     assert p.variables['refresh_token'] == 'ref'
+    assert p.variables['chrome_store'].token_store is not None
+
+
+def test_init_without_token_store():
+    p = parser.Parser(['chrome.init id secret ref off'])
+    p.execute()
+
+    assert p.variables['chrome_store'].token_store is None
+
+    with pytest.raises(ValueError):
+        parser.Parser(['chrome.init id secret ref maybe']).execute()
 
 
 def test_setapp():
@@ -34,7 +46,7 @@ def test_new():
 
     p.execute_line('chrome.init id secret ref')
     mock_store = flexmock(p.variables['chrome_store'])  # Mock the store, do not actually send anything
-    mock_store.should_receive('upload').with_args('fn', True).once()
+    mock_store.should_receive('upload').with_args('fn', True, chunk_size=None).once()
     p.variables['chrome_store'] = mock_store
 
     p.execute_line('chrome.new fn')
@@ -53,12 +65,23 @@ def test_upload():
 
     p.execute_line('chrome.init id secret ref')
     mock_store = flexmock(p.variables['chrome_store'])  # Mock the store, do not actually send anything
-    mock_store.should_receive('upload').with_args('fn', False).once()
+    mock_store.should_receive('upload').with_args('fn', False, chunk_size=None).once()
     p.variables['chrome_store'] = mock_store
 
     p.execute_line('chrome.update fn')
 
 
+def test_upload_chunked():
+    p = parser.Parser('foo')
+
+    p.execute_line('chrome.init id secret ref')
+    mock_store = flexmock(p.variables['chrome_store'])  # Mock the store, do not actually send anything
+    mock_store.should_receive('upload').with_args('fn', False, chunk_size=262144).once()
+    p.variables['chrome_store'] = mock_store
+
+    p.execute_line('chrome.update fn 262144')
+
+
 def test_upload_no_init():
     p = parser.Parser(['chrome.update fn'])
 
@@ -110,6 +133,57 @@ def test_check_version():
     p.execute_line('chrome.check_version 1.0.12345')
 
 
+def test_check_version_retries():
+    p = parser.Parser('foo')
+    p.execute_line('chrome.init id secret ref')
+    p.execute_line('chrome.setapp appid')
+
+    flexmock(polling.time).should_receive('sleep').times(2)
+    mock_store = flexmock(p.variables['chrome_store'])  # Mock the store, do not actually send anything
+    mock_store.should_receive('get_uploaded_version').and_return('0.9').and_return('0.9').and_return('1.0').times(3)
+    p.variables['chrome_store'] = mock_store
+
+    p.execute_line('chrome.check_version 1.0')
+
+
+def test_check_version_confirmed_by_upload():
+    p = parser.Parser('foo')
+    p.execute_line('chrome.init id secret ref')
+    p.execute_line('chrome.setapp appid')
+
+    store = p.variables['chrome_store']
+    store.last_upload = UploadResult('appid', '1.0', 'SUCCESS')
+    flexmock(store).should_receive('get_uploaded_version').never()
+
+    p.execute_line('chrome.check_version 1.0')
+
+
+def test_check_version_not_confirmed_by_upload():
+    p = parser.Parser('foo')
+    p.execute_line('chrome.init id secret ref')
+    p.execute_line('chrome.setapp appid')
+
+    store = p.variables['chrome_store']
+    store.last_upload = UploadResult('appid', '0.9', 'SUCCESS')
+    flexmock(store).should_receive('get_uploaded_version').and_return('1.0').once()
+
+    p.execute_line('chrome.check_version 1.0')
+
+
+def test_check_version_failed_upload():
+    p = parser.Parser('foo')
+    p.execute_line('chrome.init id secret ref')
+    p.execute_line('chrome.setapp appid')
+
+    flexmock(polling.time).should_receive('sleep').never()
+    store = p.variables['chrome_store']
+    store.upload_state = 'FAILURE'
+    flexmock(store).should_receive('get_uploaded_version').and_return('0.9').once()
+
+    with pytest.raises(ValueError):
+        p.execute_line('chrome.check_version 1.0')
+
+
 def test_unpack():
     zip_fn = 'tests/files/sample_zip.zip'
     target_dir = 'tests/files/tempfolder'
@@ -65,3 +65,63 @@ def test_zip():
     archive.close()
 
     os.remove(zip_fn)
+
+
+def test_zip_parallel():
+    zip_fn = os.path.join(os.getcwd(), 'testzip.zip')
+
+    if os.path.exists(zip_fn):
+        os.remove(zip_fn)
+
+    p = parser.Parser("foo")
+    p.execute_line("zip tests/files/sample_folder testzip.zip 2")
+
+    archive = zipfile.ZipFile(zip_fn, 'r')
+    assert archive.testzip() is None
+    txt = archive.read('hello').decode("utf-8")
+    assert txt.find("Sample bare content") != -1
+    archive.close()
+
+    os.remove(zip_fn)
+
+
+def test_zip_update():
+    zip_fn = os.path.join(os.getcwd(), 'testzip.zip')
+
+    if os.path.exists(zip_fn):
+        os.remove(zip_fn)
+
+    p = parser.Parser("foo")
+    p.execute_line("zip_update tests/files/sample_folder testzip.zip")
+    p.execute_line("zip_update tests/files/sample_folder testzip.zip")
+
+    archive = zipfile.ZipFile(zip_fn, 'r')
+    txt = archive.read('hello').decode("utf-8")
+    assert txt.find("Sample bare content") != -1
+    archive.close()
+
+    os.remove(zip_fn)
+
+
+def test_zip_reproducible():
+    zip_fn = os.path.join(os.getcwd(), 'testzip.zip')
+
+    p = parser.Parser("foo")
+    p.execute_line("reproducible on")
+    p.execute_line("compress hello 0")
+    p.execute_line("zip tests/files/sample_folder testzip.zip")
+
+    with open(zip_fn, 'rb') as f:
+        first = f.read()
+    os.remove(zip_fn)
+
+    p.execute_line("zip tests/files/sample_folder testzip.zip")
+    with open(zip_fn, 'rb') as f:
+        assert f.read() == first
+
+    archive = zipfile.ZipFile(zip_fn, 'r')
+    assert archive.getinfo('hello').compress_type == zipfile.ZIP_STORED
+    assert archive.getinfo('hello').date_time == (1980, 1, 1, 0, 0, 0)
+    archive.close()
+
+    os.remove(zip_fn)
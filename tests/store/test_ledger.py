@@ -0,0 +1,113 @@
+import hashlib
+import io
+import json
+
+import requests
+from flexmock import flexmock
+
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.firefox_store.firefox_store import FFStore
+from webstore_manager.store.ledger import UploadLedger, file_digest
+
+
+def _ledger(tmpdir):
+    return UploadLedger(str(tmpdir.join('ledger', 'uploads.json')))
+
+
+def test_file_digest(tmpdir):
+    path = tmpdir.join('a.zip')
+    path.write_binary(b'archive')
+    expected = hashlib.sha256(b'archive').hexdigest()
+
+    assert file_digest(str(path)) == expected
+    data = io.BytesIO(b'archive')
+    data.read()
+    assert file_digest(data) == expected
+
+
+def test_record_and_find(tmpdir):
+    ledger = _ledger(tmpdir)
+    assert ledger.find('chrome', 'item', 'abc') is None
+
+    ledger.record('chrome', 'item', '1.0', 'abc')
+
+    assert ledger.find('chrome', 'item', 'abc')['version'] == '1.0'
+    assert ledger.find('chrome', 'item', 'abc', version='1.0')
+    assert ledger.find('chrome', 'item', 'abc', version='2.0') is None
+    assert ledger.find('chrome', 'item', 'def') is None
+    assert ledger.find('chrome', 'other', 'abc') is None
+    assert ledger.find('firefox', 'item', 'abc') is None
+
+
+def test_only_last_upload_counts(tmpdir):
+    ledger = _ledger(tmpdir)
+    ledger.record('chrome', 'item', '1.0', 'abc')
+    ledger.record('chrome', 'item', '1.1', 'def')
+
+    assert ledger.find('chrome', 'item', 'abc') is None
+    assert UploadLedger(ledger.path).find('chrome', 'item', 'def')['version'] == '1.1'
+
+
+def test_forget(tmpdir):
+    ledger = _ledger(tmpdir)
+    ledger.record('chrome', 'item', '1.0', 'abc')
+    ledger.forget('chrome', 'item')
+
+    assert ledger.find('chrome', 'item', 'abc') is None
+
+
+def test_corrupted_ledger(tmpdir):
+    ledger = _ledger(tmpdir)
+    tmpdir.mkdir('ledger').join('uploads.json').write('{not json')
+
+    assert ledger.find('chrome', 'item', 'abc') is None
+    ledger.record('chrome', 'item', '1.0', 'abc')
+    assert ledger.find('chrome', 'item', 'abc')
+
+
+def _chrome_store(ledger, uploads):
+    def put(url, headers=None, data=None):
+        uploads.append(data.read())
+        response = requests.Response()
+        response.status_code = 200
+        response._content = json.dumps({'uploadState': 'SUCCESS', 'id': 'appid', 'crxVersion': '1.2.3'}).encode()
+        return response
+
+    store = ChromeStore('id', 'secret', 'refresh', app_id='appid', ledger=ledger)
+    store.session = flexmock(put=put)
+    flexmock(store).should_receive('generate_access_token').and_return('token')
+    return store
+
+
+def test_chrome_duplicate_upload_skipped(tmpdir):
+    ledger = _ledger(tmpdir)
+    uploads = []
+
+    first = _chrome_store(ledger, uploads).upload(io.BytesIO(b'archive'))
+    store = _chrome_store(ledger, uploads)
+    second = store.upload(io.BytesIO(b'archive'))
+
+    assert uploads == [b'archive']
+    assert (second.id, second.version, second.state) == (first.id, '1.2.3', 'SUCCESS')
+    assert store.last_upload is second
+    assert store.upload_state == 'SUCCESS'
+
+
+def test_chrome_changed_or_forced_upload_not_skipped(tmpdir):
+    ledger = _ledger(tmpdir)
+    uploads = []
+
+    _chrome_store(ledger, uploads).upload(io.BytesIO(b'archive'))
+    _chrome_store(ledger, uploads).upload(io.BytesIO(b'changed'))
+    _chrome_store(ledger, uploads).upload(io.BytesIO(b'changed'), force=True)
+
+    assert uploads == [b'archive', b'changed', b'changed']
+
+
+def test_firefox_duplicate_upload_skipped(tmpdir):
+    ledger = _ledger(tmpdir)
+    ledger.record(FFStore.LEDGER_NAME, 'addon@example.com', '1.0', hashlib.sha256(b'xpi').hexdigest())
+    store = FFStore('issuer', 'secret', ledger=ledger)
+    flexmock(store).should_receive('_gen_auth_headers').never()
+
+    assert store.upload(io.BytesIO(b'xpi'), 'addon@example.com', '1.0')
@@ -0,0 +1,98 @@
+import email
+import io
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+
+from webstore_manager.store.multipart import MultipartEncoder
+from webstore_manager.store.store import new_session
+
+
+def _parse(content_type, body):
+    message = email.message_from_bytes(b'Content-Type: ' + content_type.encode() + b'\r\n\r\n' + body)
+    return {part.get_param('name', header='content-disposition'): part for part in message.get_payload()}
+
+
+def test_encodes_fields_and_files():
+    data = bytes(range(256)) * 100
+    body = MultipartEncoder({'channel': 'listed', 'upload': ('a "b".xpi', io.BytesIO(data), 'application/x-xpinstall')})
+
+    encoded = body.read()
+    assert len(encoded) == len(body)
+
+    parts = _parse(body.content_type, encoded)
+    assert parts['channel'].get_payload() == 'listed'
+    assert parts['upload'].get_content_type() == 'application/x-xpinstall'
+    assert parts['upload'].get_payload(decode=True) == data
+
+
+def test_reads_in_chunks_and_seeks():
+    data = b'0123456789' * 1000
+    progress = []
+    body = MultipartEncoder({'upload': ('a.xpi', io.BytesIO(data))}, progress=lambda sent, total: progress.append(sent))
+    whole = MultipartEncoder({'upload': ('a.xpi', io.BytesIO(data))}, boundary=body.boundary).read()
+
+    chunks = list(iter(lambda: body.read(333), b''))
+    assert b''.join(chunks) == whole
+    assert max(len(chunk) for chunk in chunks) == 333
+    assert progress[-1] == len(whole)
+
+    body.seek(100)
+    assert body.read(50) == whole[100:150]
+    assert body.tell() == 150
+
+
+def test_file_sent_from_current_position():
+    data = io.BytesIO(b'headerpayload')
+    data.seek(6)
+
+    body = MultipartEncoder({'upload': ('a.xpi', data)})
+    assert _parse(body.content_type, body.read())['upload'].get_payload(decode=True) == b'payload'
+
+
+def test_changed_file_detected():
+    data = io.BytesIO(b'payload')
+    body = MultipartEncoder({'upload': ('a.xpi', data)})
+    data.truncate(3)
+
+    with pytest.raises(IOError):
+        body.read()
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    """ Records request bodies. Responds with statuses queued in server.statuses, then with 200. """
+
+    def do_PUT(self):
+        length = int(self.headers['Content-Length'])
+        self.server.bodies.append((self.headers['Content-Type'], self.rfile.read(length)))
+
+        self.send_response(self.server.statuses.pop(0) if self.server.statuses else 200)
+        self.send_header('Retry-After', '0')
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+def test_streamed_over_http_and_rewound_on_retry():
+    httpd = HTTPServer(('127.0.0.1', 0), RecordingHandler)
+    httpd.bodies = []
+    httpd.statuses = [503]
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+
+    data = b'x' * 100000
+    try:
+        body = MultipartEncoder({'upload': ('a.xpi', io.BytesIO(data))})
+        response = new_session(backoff_factor=0).put('http://127.0.0.1:{}/'.format(httpd.server_address[1]),
+                                                     data=body, headers={'Content-Type': body.content_type})
+    finally:
+        httpd.shutdown()
+        httpd.server_close()
+
+    assert response.status_code == 200
+    assert len(httpd.bodies) == 2
+    assert httpd.bodies[0] == httpd.bodies[1]
+    assert _parse(*httpd.bodies[1])['upload'].get_payload(decode=True) == data
@@ -0,0 +1,149 @@
+import threading
+
+import flexmock
+import pytest
+
+from webstore_manager.store import rate_limit, store
+from webstore_manager.store.rate_limit import FileTokenBucket, RateLimiter, TokenBucket
+
+
+class FakeClock:
+    """ Clock whose time only moves when sleeping. """
+
+    def __init__(self):
+        self.now = 1000.0
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_bucket_allows_burst_then_limits():
+    clock = FakeClock()
+    bucket = TokenBucket(2, 3, clock=clock, sleep=clock.sleep)
+
+    waits = [bucket.acquire() for _ in range(5)]
+
+    assert waits[:3] == [0, 0, 0]
+    assert waits[3] == pytest.approx(0.5)
+    assert waits[4] == pytest.approx(0.5)
+
+
+def test_bucket_refills():
+    clock = FakeClock()
+    bucket = TokenBucket(1, 2, clock=clock, sleep=clock.sleep)
+    bucket.acquire()
+    bucket.acquire()
+
+    clock.now += 10  # refills to capacity only
+    assert [bucket.acquire() for _ in range(3)] == [0, 0, pytest.approx(1)]
+
+
+def test_bucket_concurrent_reservations():
+    clock = FakeClock()
+    lock = threading.Lock()
+    waits = []
+    bucket = TokenBucket(10, 1, clock=clock, sleep=lambda seconds: None)
+
+    def acquire():
+        wait = bucket.acquire()
+        with lock:
+            waits.append(wait)
+
+    threads = [threading.Thread(target=acquire) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    # Every waiting request reserved its own future token.
+    assert sorted(waits) == [0, pytest.approx(0.1), pytest.approx(0.2), pytest.approx(0.3), pytest.approx(0.4)]
+
+
+def test_invalid_rate():
+    with pytest.raises(ValueError):
+        TokenBucket(0)
+
+
+def test_file_bucket_shared(tmpdir):
+    clock = FakeClock()
+    path = str(tmpdir.join('host.bucket'))
+    first = FileTokenBucket(path, 1, 2, clock=clock, sleep=clock.sleep)
+    second = FileTokenBucket(path, 1, 2, clock=clock, sleep=clock.sleep)
+
+    assert first.acquire() == 0
+    assert second.acquire() == 0
+    assert first.acquire() == pytest.approx(1)
+    assert second.acquire() == pytest.approx(1)
+
+
+def test_file_bucket_damaged_state(tmpdir):
+    path = tmpdir.join('host.bucket')
+    path.write_binary(b'garbage')
+    clock = FakeClock()
+
+    assert FileTokenBucket(str(path), 1, clock=clock, sleep=clock.sleep).acquire() == 0
+
+
+def test_from_specs():
+    limiter = RateLimiter.from_specs(['www.googleapis.com=5:10', '*=0.5'])
+
+    google = limiter.buckets['www.googleapis.com']
+    assert (google.rate, google.capacity) == (5, 10)
+    assert (limiter.buckets['*'].rate, limiter.buckets['*'].capacity) == (0.5, 1)
+
+
+def test_from_specs_shared(tmpdir):
+    limiter = RateLimiter.from_specs(['*=2'], state_dir=str(tmpdir.join('state')))
+
+    assert isinstance(limiter.buckets['*'], FileTokenBucket)
+    limiter.wait('https://example.com/')
+    assert tmpdir.join('state', 'any.bucket').check()
+
+
+@pytest.mark.parametrize('spec', ['www.googleapis.com', 'host=fast', 'host=1:many'])
+def test_from_specs_invalid(spec):
+    with pytest.raises(ValueError, match='Invalid rate limit'):
+        RateLimiter.from_specs([spec])
+
+
+def test_limiter_picks_bucket_by_host():
+    google = TokenBucket(1, 1, sleep=lambda seconds: None)
+    other = TokenBucket(1, 1, sleep=lambda seconds: None)
+    flexmock.flexmock(google).should_receive('acquire').and_return(0.5).twice()
+    flexmock.flexmock(other).should_receive('acquire').and_return(0).once()
+    limiter = RateLimiter({'www.googleapis.com': google, '*': other})
+
+    assert limiter.wait('https://www.googleapis.com/upload/chromewebstore/v1.1/items') == 0.5
+    assert limiter.wait('https://WWW.googleapis.com/') == 0.5
+    assert limiter.wait('https://addons.mozilla.org/api/v3/') == 0
+
+
+def test_limiter_without_buckets():
+    assert RateLimiter().wait('https://www.googleapis.com/') == 0
+
+
+def test_session_waits_for_limiter():
+    limiter = RateLimiter()
+    flexmock.flexmock(limiter).should_receive('wait').with_args('http://127.0.0.1:1/').once()
+
+    session = store.new_session(retries=0, rate_limiter=limiter)
+    adapter = session.get_adapter('http://127.0.0.1:1/')
+    assert isinstance(adapter, rate_limit.RateLimitedAdapter)
+    with pytest.raises(Exception):
+        session.get('http://127.0.0.1:1/', timeout=1)
+
+
+def test_default_rate_limiter():
+    original = store.default_rate_limiter
+    limiter = RateLimiter()
+    try:
+        store.set_default_rate_limiter(limiter)
+        session = store.Store().session
+        assert session.get_adapter('https://www.googleapis.com/').rate_limiter is limiter
+    finally:
+        store.set_default_rate_limiter(original)
@@ -0,0 +1,115 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import pytest
+import requests
+
+from webstore_manager.store.store import Store, new_session
+
+
+class FlakyHandler(BaseHTTPRequestHandler):
+    """ Responds with statuses queued in server.statuses, then with 200. """
+
+    def _respond(self):
+        self.server.methods.append(self.command)
+        time.sleep(self.server.delay)
+        length = int(self.headers.get('Content-Length') or 0)
+        self.rfile.read(length)
+
+        status = self.server.statuses.pop(0) if self.server.statuses else 200
+        self.send_response(status)
+        if status in (429, 503):
+            self.send_header('Retry-After', self.server.retry_after)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    do_GET = do_PUT = do_POST = _respond
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    httpd = HTTPServer(('127.0.0.1', 0), FlakyHandler)
+    httpd.statuses = []
+    httpd.methods = []
+    httpd.delay = 0
+    httpd.retry_after = '0'
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield httpd
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def _url(server):
+    return 'http://127.0.0.1:{}/'.format(server.server_address[1])
+
+
+def test_idempotent_request_retried(server):
+    server.statuses = [503, 502]
+    response = new_session(backoff_factor=0).get(_url(server))
+
+    assert response.status_code == 200
+    assert server.methods == ['GET'] * 3
+
+
+def test_post_not_retried(server):
+    server.statuses = [500]
+    response = new_session(backoff_factor=0).post(_url(server), data=b'data')
+
+    assert response.status_code == 500
+    assert server.methods == ['POST']
+
+
+def test_post_retried_when_rate_limited(server):
+    server.statuses = [429]
+    response = new_session(backoff_factor=0).post(_url(server), data=b'data')
+
+    assert response.status_code == 200
+    assert server.methods == ['POST', 'POST']
+
+
+def test_retries_exhausted_returns_response(server):
+    server.statuses = [503] * 10
+    response = new_session(retries=2, backoff_factor=0).put(_url(server), data=b'data')
+
+    assert response.status_code == 503
+    assert server.methods == ['PUT'] * 3
+
+
+def test_long_retry_after_not_followed(server):
+    server.statuses = [429]
+    server.retry_after = '3600'
+
+    start = time.monotonic()
+    response = new_session(backoff_factor=0, max_retry_after=60).get(_url(server))
+
+    assert response.status_code == 429
+    assert server.methods == ['GET']
+    assert time.monotonic() - start < 5
+
+
+def test_retry_after_within_limit_followed(server):
+    server.statuses = [503]
+    server.retry_after = '1'
+
+    response = new_session(backoff_factor=0, max_retry_after=1).get(_url(server))
+
+    assert response.status_code == 200
+    assert server.methods == ['GET', 'GET']
+
+
+def test_default_timeout(server):
+    server.delay = 0.5
+    with pytest.raises(requests.RequestException, match='timed out'):
+        new_session(retries=0, timeout=0.05).get(_url(server))
+
+
+def test_store_session():
+    assert Store().session.timeout is not None
+
+    session = requests.Session()
+    assert Store(session).session is session
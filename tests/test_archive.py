@@ -0,0 +1,169 @@
+import io
+import os
+import zipfile
+
+import pytest
+
+from webstore_manager import archive
+from webstore_manager.util import temp_dir
+
+sample_folder = os.path.join('tests', 'files', 'sample_folder')
+
+
+def _make_tree(path):
+    os.makedirs(os.path.join(path, 'js', 'lib'))
+    with open(os.path.join(path, 'manifest.json'), 'w') as f:
+        f.write('{"name": "Test", "version": "1.0"}')
+    for i in range(20):
+        with open(os.path.join(path, 'js', 'lib', 'file{}.js'.format(i)), 'w') as f:
+            f.write('var x{} = {};\n'.format(i, i) * (i * 50 + 1))
+    with open(os.path.join(path, 'js', 'ünicode.js'), 'w') as f:
+        f.write('// unicode name')
+    with open(os.path.join(path, 'empty'), 'w'):
+        pass
+
+
+def test_build_zip_parallel():
+    src = 'tests/files/temp_test_archive'
+    with temp_dir(src):
+        _make_tree(src)
+        buffer = io.BytesIO()
+        archive.build_zip(buffer, src, jobs=2)
+
+        with zipfile.ZipFile(buffer) as zip_file:
+            assert zip_file.testzip() is None
+            assert sorted(zip_file.namelist()) == sorted(arcname for _, arcname in archive.list_files(src))
+            for full_path, arcname in archive.list_files(src):
+                with open(full_path, 'rb') as f:
+                    assert zip_file.read(arcname) == f.read()
+
+
+def test_raw_zip_writer_file_target():
+    target = 'tests/files/temp_test_archive_out'
+    with temp_dir(target):
+        zip_name = os.path.join(target, 'out.zip')
+        compress_type, crc, size, data = archive.compress_file((os.path.join(sample_folder, 'hello'), 9))
+
+        with archive.RawZipWriter(zip_name) as writer:
+            zip_info = zipfile.ZipInfo('hello', (2017, 1, 1, 0, 0, 0))
+            zip_info.compress_type = compress_type
+            zip_info.CRC = crc
+            zip_info.file_size = size
+            writer.write_raw(zip_info, data)
+
+        with zipfile.ZipFile(zip_name) as zip_file:
+            assert zip_file.getinfo('hello').date_time == (2017, 1, 1, 0, 0, 0)
+            assert zip_file.read('hello').decode('utf-8').startswith('Sample bare content')
+
+
+@pytest.mark.parametrize(["jobs", "expected"], [(1, 1), ('3', 3), (0, os.cpu_count() or 1)])
+def test_resolve_jobs(jobs, expected):
+    assert archive.resolve_jobs(jobs) == expected
+
+
+def test_update_zip():
+    src = 'tests/files/temp_test_archive'
+    out = 'tests/files/temp_test_archive_out'
+    with temp_dir(src), temp_dir(out):
+        _make_tree(src)
+        previous = os.path.join(out, 'previous.zip')
+        archive.build_zip(previous, src, jobs=1)
+
+        with open(os.path.join(src, 'js', 'lib', 'file3.js'), 'a') as f:
+            f.write('changed')
+        with open(os.path.join(src, 'new.js'), 'w') as f:
+            f.write('new file')
+        os.remove(os.path.join(src, 'empty'))
+
+        updated = os.path.join(out, 'updated.zip')
+        reused, compressed = archive.update_zip(updated, src, previous, jobs=2)
+        assert compressed == 2
+        assert reused == len(archive.list_files(src)) - 2
+
+        with zipfile.ZipFile(updated) as zip_file:
+            assert zip_file.testzip() is None
+            assert sorted(zip_file.namelist()) == sorted(arcname for _, arcname in archive.list_files(src))
+            for full_path, arcname in archive.list_files(src):
+                with open(full_path, 'rb') as f:
+                    assert zip_file.read(arcname) == f.read()
+
+
+def test_update_zip_touched_file_reused():
+    src = 'tests/files/temp_test_archive'
+    out = 'tests/files/temp_test_archive_out'
+    with temp_dir(src), temp_dir(out):
+        _make_tree(src)
+        previous = os.path.join(out, 'previous.zip')
+        archive.build_zip(previous, src, jobs=1)
+
+        os.utime(os.path.join(src, 'manifest.json'), (1000000000, 1000000000))
+
+        reused, compressed = archive.update_zip(os.path.join(out, 'updated.zip'), src, previous)
+        assert compressed == 0
+
+
+def test_compression_policy():
+    policy = archive.CompressionPolicy.default().with_rule('assets/*', 1).with_rule('*.JS', 9)
+
+    assert policy.level('images/logo.PNG') == 0
+    assert policy.level('fonts/font.woff2') == 0
+    assert policy.level('js/app.js') == 9
+    assert policy.level('assets/data.json') == 1
+    assert policy.level('manifest.json') == archive.CompressionPolicy().default_level
+
+
+def test_build_zip_policy():
+    src = 'tests/files/temp_test_archive'
+    with temp_dir(src):
+        _make_tree(src)
+        with open(os.path.join(src, 'logo.png'), 'wb') as f:
+            f.write(b'\x00' * 1000)
+
+        buffer = io.BytesIO()
+        archive.build_zip(buffer, src, policy=archive.CompressionPolicy.default().with_rule('*.json', 0))
+
+        with zipfile.ZipFile(buffer) as zip_file:
+            assert zip_file.getinfo('logo.png').compress_type == zipfile.ZIP_STORED
+            assert zip_file.getinfo('manifest.json').compress_type == zipfile.ZIP_STORED
+            assert zip_file.getinfo('js/lib/file10.js').compress_type == zipfile.ZIP_DEFLATED
+            assert zip_file.read('logo.png') == b'\x00' * 1000
+
+
+def test_update_zip_deterministic_same_size_edit():
+    src = 'tests/files/temp_test_archive'
+    out = 'tests/files/temp_test_archive_out'
+    with temp_dir(src), temp_dir(out):
+        _make_tree(src)
+        manifest = os.path.join(src, 'manifest.json')
+        with open(manifest, 'w') as f:
+            f.write('{"version": "1.0.1"}')
+        previous = os.path.join(out, 'previous.zip')
+        archive.build_zip(previous, src, deterministic=True)
+
+        with open(manifest, 'w') as f:
+            f.write('{"version": "1.0.2"}')
+        updated = os.path.join(out, 'updated.zip')
+        reused, compressed = archive.update_zip(updated, src, previous, deterministic=True)
+
+        assert compressed == 1
+        with zipfile.ZipFile(updated) as zip_file:
+            assert zip_file.read('manifest.json') == b'{"version": "1.0.2"}'
+
+
+def test_build_zip_deterministic():
+    src = 'tests/files/temp_test_archive'
+    with temp_dir(src):
+        _make_tree(src)
+
+        first = io.BytesIO()
+        archive.build_zip(first, src, deterministic=True)
+
+        for full_path, _ in archive.list_files(src):
+            os.utime(full_path, (1500000000, 1500000000))
+        second = io.BytesIO()
+        archive.build_zip(second, src, jobs=2, deterministic=True)
+
+        assert first.getvalue() == second.getvalue()
+        with zipfile.ZipFile(first) as zip_file:
+            assert zip_file.namelist() == sorted(zip_file.namelist())
+            assert {info.date_time for info in zip_file.infolist()} == {(1980, 1, 1, 0, 0, 0)}
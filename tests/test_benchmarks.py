@@ -0,0 +1,16 @@
+import json
+import os
+import subprocess
+import sys
+
+benchmark = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks', 'packaging.py')
+
+
+def test_benchmark_parallel_jobs(tmpdir):
+    output = str(tmpdir.join('results.json'))
+    subprocess.check_call([sys.executable, benchmark, '--corpus', 'small_files', '--case', 'make_zip',
+                           '--scale', '0.01', '--repeat', '1', '--jobs', '2', '--output', output])
+
+    with open(output) as f:
+        results = json.load(f)['results']
+    assert results['small_files/make_zip']['output_bytes'] > 0
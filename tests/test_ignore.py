@@ -0,0 +1,81 @@
+import os
+
+import pytest
+
+from webstore_manager import archive
+from webstore_manager.ignore import IgnoreMatcher, IgnoreStats, walk_files
+from webstore_manager.package_cache import tree_hash
+from webstore_manager.util import temp_dir
+
+
+@pytest.mark.parametrize(["pattern", "path", "is_dir", "ignored"], [
+    ('*.map', 'js/app.js.map', False, True),
+    ('*.map', 'js/app.js', False, False),
+    ('/build', 'build', True, True),
+    ('/build', 'src/build', True, False),
+    ('tests/', 'tests', True, True),
+    ('tests/', 'tests', False, False),
+    ('docs/*.md', 'docs/readme.md', False, True),
+    ('docs/*.md', 'docs/sub/readme.md', False, False),
+    ('**/fixtures', 'a/b/fixtures', True, True),
+    ('src/**/*.test.js', 'src/a/b/c.test.js', False, True),
+    ('src/**/*.test.js', 'src/c.test.js', False, True),
+    ('*.sw[op]', '.app.js.swp', False, True),
+    ('file?.txt', 'file10.txt', False, False),
+    ('# comment', '# comment', False, False),
+    ('\\#hash', '#hash', False, True),
+    ('\\!bang', '!bang', False, True),
+    ('\\*foo', '*foo', False, True),
+    ('\\*foo', 'barfoo', False, False),
+    ('\\?', '?', False, True),
+    ('\\?', 'a', False, False),
+])
+def test_matcher(pattern, path, is_dir, ignored):
+    assert IgnoreMatcher([pattern]).is_ignored(path, is_dir) == ignored
+
+
+def test_matcher_negation():
+    matcher = IgnoreMatcher(['*.json', '!manifest.json', ''])
+    assert matcher.is_ignored('package.json')
+    assert not matcher.is_ignored('manifest.json')
+
+
+def _make_tree(path):
+    for folder in ['.git/objects', 'js', 'tests/fixtures']:
+        os.makedirs(os.path.join(path, folder))
+    for name, content in [('.git/objects/abc', 'x' * 100), ('js/app.js', 'var a;'), ('js/app.js.map', 'y' * 50),
+                          ('tests/fixtures/a.json', '{}'), ('manifest.json', '{}'),
+                          ('.webstoreignore', '.git/\n*.map\n/tests\n')]:
+        with open(os.path.join(path, name), 'w') as f:
+            f.write(content)
+
+
+def test_walk_files_prunes():
+    src = 'tests/files/temp_test_ignore'
+    with temp_dir(src):
+        _make_tree(src)
+        stats = IgnoreStats()
+
+        files = sorted(relpath.replace(os.sep, '/') for _, relpath in walk_files(src, stats=stats))
+        assert files == ['js/app.js', 'manifest.json']
+        assert stats.files == 1
+        assert stats.bytes == 50
+        assert stats.directories == 2
+        assert str(stats) == "1 files (50 bytes) and 2 directories (size not measured)"
+
+        assert sorted(arcname.replace(os.sep, '/') for _, arcname in archive.list_files(src)) == files
+
+
+def test_tree_hash_skips_ignored():
+    src = 'tests/files/temp_test_ignore'
+    with temp_dir(src):
+        _make_tree(src)
+        first = tree_hash(src)
+
+        with open(os.path.join(src, '.git', 'objects', 'abc'), 'w') as f:
+            f.write('changed')
+        assert tree_hash(src) == first
+
+        with open(os.path.join(src, '.webstoreignore'), 'a') as f:
+            f.write('js/\n')
+        assert tree_hash(src) != first
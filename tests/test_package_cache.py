@@ -0,0 +1,97 @@
+import os
+import zipfile
+
+import pytest
+
+from webstore_manager import util
+from webstore_manager.package_cache import PackageCache, tree_hash
+from webstore_manager.util import temp_dir
+
+sample_folder = os.path.join('tests', 'files', 'sample_folder')
+
+
+def _write(path, content):
+    with open(path, 'w') as f:
+        f.write(content)
+
+
+def test_tree_hash_changes():
+    src = 'tests/files/temp_test_tree_hash'
+    with temp_dir(src):
+        os.makedirs(os.path.join(src, 'sub'))
+        _write(os.path.join(src, 'sub', 'a'), 'aaa')
+        first = tree_hash(src)
+        assert tree_hash(src) == first
+
+        _write(os.path.join(src, 'sub', 'a'), 'aaaa')
+        assert tree_hash(src) != first
+
+        second = tree_hash(src)
+        _write(os.path.join(src, 'b'), '')
+        assert tree_hash(src) != second
+
+
+@pytest.mark.skipif(not hasattr(os, 'symlink') or os.name != 'posix', reason="needs symbolic links")
+def test_tree_hash_symlinks():
+    src = 'tests/files/temp_test_tree_hash'
+    outside = 'tests/files/temp_test_tree_hash_outside'
+    with temp_dir(src), temp_dir(outside):
+        os.makedirs(os.path.join(src, 'sub'))
+        _write(os.path.join(src, 'sub', 'a'), 'aaa')
+        _write(os.path.join(outside, 'big'), 'outside')
+        os.symlink('..', os.path.join(src, 'sub', 'loop'))
+        os.symlink(os.path.abspath(outside), os.path.join(src, 'outside'))
+        os.symlink('a', os.path.join(src, 'sub', 'link'))
+        first = tree_hash(src)
+
+        # Linked folders are not hashed, only where they point to.
+        _write(os.path.join(outside, 'big'), 'changed outside')
+        assert tree_hash(src) == first
+
+        # Linked files are zipped by their content, so it counts.
+        _write(os.path.join(src, 'sub', 'a'), 'bbb')
+        second = tree_hash(src)
+        assert second != first
+
+        os.remove(os.path.join(src, 'sub', 'link'))
+        os.symlink('loop/sub/a', os.path.join(src, 'sub', 'link'))
+        assert tree_hash(src) != second
+
+
+def test_make_zip_cache_hit():
+    cache_dir = 'tests/files/temp_test_cache'
+    out_dir = 'tests/files/temp_test_cache_out'
+    with temp_dir(cache_dir), temp_dir(out_dir):
+        cache = PackageCache(cache_dir)
+
+        first = util.make_zip('first.zip', sample_folder, out_dir, cache=cache)
+        assert len(os.listdir(cache_dir)) == 1
+
+        second = util.make_zip('second.zip', sample_folder, out_dir, cache=cache)
+        with open(first, 'rb') as f1, open(second, 'rb') as f2:
+            assert f1.read() == f2.read()
+
+        buffer = util.make_zip_buffer(sample_folder, cache=cache)
+        with zipfile.ZipFile(buffer) as archive:
+            assert archive.read('hello').decode('utf-8').startswith('Sample bare content')
+        buffer.close()
+
+
+def test_evict_lru():
+    cache_dir = 'tests/files/temp_test_cache'
+    with temp_dir(cache_dir):
+        cache = PackageCache(cache_dir, max_size=2500)
+        source = os.path.join(cache_dir, 'source.bin')
+        _write(source, 'x' * 1000)
+
+        first = cache.put('first', source)
+        os.utime(first, (1, 1))
+        second = cache.put('second', source)
+        os.utime(second, (2, 2))
+
+        assert cache.get('first') == first  # touching makes first the most recently used one
+        cache.put('third', source)
+
+        assert cache.get('second') is None
+        assert cache.get('first') == first
+        assert cache.get('third')
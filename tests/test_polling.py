@@ -0,0 +1,60 @@
+import random
+
+from webstore_manager.polling import Backoff, poll
+
+
+class FakeTime:
+    def __init__(self):
+        self.now = 0
+        self.sleeps = []
+
+    def clock(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
+
+
+def test_backoff_intervals():
+    intervals = Backoff(initial=1, maximum=10, multiplier=2, jitter=0).intervals()
+    assert [next(intervals) for _ in range(6)] == [1, 2, 4, 8, 10, 10]
+
+
+def test_backoff_jitter():
+    intervals = Backoff(initial=4, maximum=4, jitter=0.5, rng=random.Random(1)).intervals()
+    values = [next(intervals) for _ in range(100)]
+    assert all(2 <= value <= 4 for value in values)
+    assert len(set(values)) > 1
+
+
+def test_poll_until_done():
+    fake = FakeTime()
+    values = iter(range(10))
+    result = poll(lambda: next(values), until=lambda value: value == 3, timeout=100,
+                  backoff=Backoff(jitter=0), sleep=fake.sleep, clock=fake.clock)
+
+    assert result == 3
+    assert fake.sleeps == [1, 2, 4]
+
+
+def test_poll_stops_at_terminal_value():
+    fake = FakeTime()
+    values = iter(['waiting', 'failed', 'done'])
+    result = poll(lambda: next(values), until=lambda value: value == 'done', stop=lambda value: value == 'failed',
+                  timeout=100, sleep=fake.sleep, clock=fake.clock)
+
+    assert result == 'failed'
+    assert len(fake.sleeps) == 1
+
+
+def test_poll_deadline():
+    fake = FakeTime()
+    calls = []
+    poll(lambda: calls.append(1), until=lambda value: False, timeout=10,
+         backoff=Backoff(initial=4, maximum=4, jitter=0), sleep=fake.sleep, clock=fake.clock)
+
+    # Calls at 0, 4 and 8 seconds, the last wait is shortened to the deadline.
+    assert fake.sleeps == [4, 4, 2]
+    assert len(calls) == 4
+    assert fake.now == 10
@@ -0,0 +1,121 @@
+import os
+import time
+
+import pytest
+
+from webstore_manager.scratch import fcntl, ScratchQuotaError, ScratchSpace
+from webstore_manager.util import temp_dir
+
+base_dir = 'tests/files/temp_test_scratch'
+
+
+def _write(path, size):
+    with open(path, 'wb') as f:
+        f.write(b'x' * size)
+
+
+def test_operations_are_isolated():
+    with temp_dir(base_dir):
+        space = ScratchSpace(base_dir)
+        assert not os.path.exists(space.root)
+
+        with space.operation('first') as first, space.operation('second') as second:
+            assert first != second
+            assert os.path.dirname(first) == space.root
+            assert os.listdir(first) == []
+
+        space.wait()
+        assert not os.path.exists(first)
+        assert not os.path.exists(second)
+
+        space.cleanup()
+        assert not os.path.exists(space.root)
+
+
+def test_quota():
+    with temp_dir(base_dir):
+        space = ScratchSpace(base_dir, quota=100)
+        directory = space.allocate()
+        _write(os.path.join(directory, 'big'), 200)
+
+        with pytest.raises(ScratchQuotaError):
+            space.allocate()
+
+        # Released directories no longer count once they are removed.
+        space.release(directory)
+        space.allocate()
+        space.cleanup()
+
+
+def _old_run(name):
+    path = os.path.join(base_dir, name)
+    os.makedirs(path)
+    os.utime(path, (time.time() - 1000, time.time() - 1000))
+    return path
+
+
+def test_stale_runs_removed():
+    with temp_dir(base_dir):
+        live = ScratchSpace(base_dir)
+        live.allocate()
+        os.utime(live.root, (time.time() - 1000, time.time() - 1000))
+
+        # Killed runs leave their lock file behind, unlocked.
+        stale = _old_run('run-1-deadbeef')
+        open(os.path.join(stale, '.lock'), 'w').close()
+        unlocked = _old_run('run-2-deadbeef')
+        other = _old_run('unrelated')
+
+        space = ScratchSpace(base_dir, stale_age=100)
+        space.allocate()
+        space.wait()
+
+        assert not os.path.exists(stale)
+        assert not os.path.exists(unlocked)
+        assert os.path.exists(other)
+        if fcntl:  # the PID of a live run may be anything, its lock keeps its space
+            assert os.path.exists(live.root)
+
+        space.cleanup()
+        live.cleanup()
+
+
+def test_new_runs_without_lock_kept():
+    with temp_dir(base_dir):
+        starting = os.path.join(base_dir, 'run-1-deadbeef')
+        os.makedirs(starting)
+
+        space = ScratchSpace(base_dir)
+        space.allocate()
+        space.wait()
+
+        assert os.path.exists(starting)
+        space.cleanup()
+
+
+def test_discard():
+    with temp_dir(base_dir):
+        target = os.path.join(base_dir, 'target')
+        os.makedirs(target)
+        _write(os.path.join(target, 'file'), 10)
+
+        space = ScratchSpace(base_dir)
+        space.discard(target)
+
+        # Outside of the scratch space, nothing is left for the background.
+        assert os.listdir(base_dir) == []
+
+
+def test_discard_in_scratch_space():
+    with temp_dir(base_dir):
+        space = ScratchSpace(base_dir)
+        target = os.path.join(space.allocate(), 'target')
+        os.makedirs(target)
+        _write(os.path.join(target, 'file'), 10)
+
+        space.discard(target)
+        assert not os.path.exists(target)
+
+        space.wait()
+        assert os.listdir(os.path.dirname(target)) == []
+        space.cleanup()
@@ -1,7 +1,9 @@
 import requests
 import pytest
+import io
 import json
 import os
+import stat
 import zipfile
 
 from flexmock import flexmock
@@ -84,3 +86,84 @@ def test_unzip():
         with open(os.path.join(unzip_path, 'hello')) as f:
             txt = f.read()
             assert txt.startswith('Sample content of zip')
+
+
+def test_makezip_buffer():
+    zip_path = os.path.join(os.getcwd(), 'tests/files/sample_folder')
+
+    buffer = util.make_zip_buffer(zip_path)
+    assert buffer.tell() == 0
+
+    archive = zipfile.ZipFile(buffer, 'r')
+    txt = archive.read('hello').decode("utf-8")
+    assert txt.startswith('Sample bare content')
+    archive.close()
+    buffer.close()
+
+
+def test_open_archive_file_object():
+    zip_path = os.path.join(os.getcwd(), 'tests/files/sample_folder')
+    buffer = util.make_zip_buffer(zip_path)
+    buffer.read(10)
+
+    with util.open_archive(buffer) as f:
+        assert f is buffer
+        assert f.read(2) == b'PK'
+
+    assert not buffer.closed
+    assert util.archive_name(buffer) == 'extension.zip'
+    assert util.archive_name('tests/files/sample_zip.zip') == 'sample_zip.zip'
+    buffer.close()
+
+
+def test_zip_folder_fallback_discards_partial_output(monkeypatch):
+    zip_path = os.path.join(os.getcwd(), 'tests/files/sample_folder')
+
+    def failing_build_zip(target, *args):
+        target.write(b'partial archive')
+        raise ValueError("Too large.")
+
+    monkeypatch.setattr(util.archive, 'build_zip', failing_build_zip)
+    buffer = io.BytesIO()
+    buffer.write(b'prefix')
+    util._zip_folder(buffer, zip_path, jobs=2)
+
+    assert buffer.getvalue().startswith(b'prefixPK')
+    buffer.seek(len(b'prefix'))
+    with zipfile.ZipFile(io.BytesIO(buffer.read())) as zip_file:
+        assert zip_file.testzip() is None
+        assert 'hello' in zip_file.namelist()
+
+
+def test_makezip_previous_in_place():
+    zip_path = os.path.join(os.getcwd(), 'tests/files/sample_folder')
+    temp_path = 'tests/files/temp_test_makezip'
+    zip_name = 'testzip.zip'
+
+    with temp_dir(temp_path):
+        full_name = util.make_zip(zip_name, zip_path, dest_dir=temp_path)
+        assert util.make_zip(zip_name, zip_path, dest_dir=temp_path, previous=full_name) == full_name
+        assert os.listdir(temp_path) == [zip_name]
+
+        archive = zipfile.ZipFile(full_name, 'r')
+        txt = archive.read('hello').decode("utf-8")
+        assert txt.startswith('Sample bare content')
+        archive.close()
+
+
+def test_makezip_previous_keeps_mode():
+    zip_path = os.path.join(os.getcwd(), 'tests/files/sample_folder')
+    temp_path = 'tests/files/temp_test_makezip'
+
+    with temp_dir(temp_path):
+        previous = util.make_zip('previous.zip', zip_path, dest_dir=temp_path)
+        umask = os.umask(0o022)
+        try:
+            new_name = util.make_zip('new.zip', zip_path, dest_dir=temp_path, previous=previous)
+        finally:
+            os.umask(umask)
+        assert stat.S_IMODE(os.stat(new_name).st_mode) == 0o644
+
+        os.chmod(previous, 0o640)
+        util.make_zip('previous.zip', zip_path, dest_dir=temp_path, previous=previous)
+        assert stat.S_IMODE(os.stat(previous).st_mode) == 0o640
@@ -0,0 +1,542 @@
+import concurrent.futures
+import fnmatch
+import os
+import posixpath
+import stat
+import struct
+import time
+import zipfile
+import zlib
+
+from . import ignore, logging_helper
+
+logger = logging_helper.get_logger(__file__)
+
+# Plain (non-zip64) archives cannot hold more entries or bytes than this.
+MAX_ENTRIES = 0xFFFF
+MAX_SIZE = 0xFFFFFFFF
+
+READ_CHUNK_SIZE = 1024 * 1024
+
+_LOCAL_HEADER = struct.Struct('<IHHHHHIIIHH')
+_CENTRAL_HEADER = struct.Struct('<IHHHHHHIIIHHHHHII')
+_END_RECORD = struct.Struct('<IHHHHIIH')
+
+_LOCAL_HEADER_SIGNATURE = 0x04034b50
+_CENTRAL_HEADER_SIGNATURE = 0x02014b50
+_END_RECORD_SIGNATURE = 0x06054b50
+
+_VERSION_NEEDED = 20
+_VERSION_MADE_BY = (3 << 8) | _VERSION_NEEDED  # Unix, ZIP 2.0
+_FLAG_UTF8 = 0x800
+
+
+class RawZipWriter:
+    """
+    Minimal zip archive writer accepting already compressed member data.
+
+    Unlike zipfile.ZipFile, it does not compress anything by itself. Members are added together with their CRC and
+    sizes, which allows assembling an archive out of deflate streams produced elsewhere (in other processes or copied
+    from another archive). Zip64 is not supported, see MAX_ENTRIES and MAX_SIZE.
+
+    Use::
+
+       with RawZipWriter(target) as writer:
+           writer.write_raw(zip_info, compressed_data)
+    """
+
+    def __init__(self, target):
+        """
+        Args:
+            target(str or file): Filename or a writable binary file object to write the archive into.
+        """
+        super().__init__()
+        if hasattr(target, 'write'):
+            self.fp = target
+            self._own_fp = False
+        else:
+            self.fp = open(target, 'wb')
+            self._own_fp = True
+
+        self.offset = 0
+        self.entries = []
+
+    def write_raw(self, zip_info, data):
+        """
+        Append a member whose data is already compressed.
+
+        Args:
+            zip_info(zipfile.ZipInfo): Member info. Its CRC, file_size and compress_type must describe data.
+            data(bytes): Compressed member data as it should appear in the archive.
+
+        Returns:
+            None
+        """
+        if len(self.entries) >= MAX_ENTRIES or self.offset + len(data) > MAX_SIZE:
+            raise ValueError("Archive is too large to be written without zip64 extensions.")
+
+        zip_info.compress_size = len(data)
+        zip_info.header_offset = self.offset
+
+        name, flags = self._encode_name(zip_info.filename)
+        dos_time, dos_date = self._dos_date_time(zip_info.date_time)
+
+        header = _LOCAL_HEADER.pack(_LOCAL_HEADER_SIGNATURE, _VERSION_NEEDED, flags, zip_info.compress_type,
+                                    dos_time, dos_date, zip_info.CRC, zip_info.compress_size, zip_info.file_size,
+                                    len(name), 0)
+        self.fp.write(header)
+        self.fp.write(name)
+        self.fp.write(data)
+
+        self.offset += len(header) + len(name) + len(data)
+        self.entries.append(zip_info)
+
+    def close(self):
+        """
+        Write the central directory and close the target if it was opened by this writer.
+
+        Returns:
+            None
+        """
+        directory_start = self.offset
+        for zip_info in self.entries:
+            name, flags = self._encode_name(zip_info.filename)
+            dos_time, dos_date = self._dos_date_time(zip_info.date_time)
+
+            header = _CENTRAL_HEADER.pack(_CENTRAL_HEADER_SIGNATURE, _VERSION_MADE_BY, _VERSION_NEEDED, flags,
+                                          zip_info.compress_type, dos_time, dos_date, zip_info.CRC,
+                                          zip_info.compress_size, zip_info.file_size, len(name), 0, 0, 0, 0,
+                                          zip_info.external_attr & 0xFFFFFFFF, zip_info.header_offset)
+            self.fp.write(header)
+            self.fp.write(name)
+            self.offset += len(header) + len(name)
+
+        if directory_start > MAX_SIZE:
+            raise ValueError("Archive is too large to be written without zip64 extensions.")
+
+        self.fp.write(_END_RECORD.pack(_END_RECORD_SIGNATURE, 0, 0, len(self.entries), len(self.entries),
+                                       self.offset - directory_start, directory_start, 0))
+        self.fp.flush()
+
+        if self._own_fp:
+            self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+        elif self._own_fp:
+            self.fp.close()
+
+    @staticmethod
+    def _encode_name(filename):
+        try:
+            return filename.encode('ascii'), 0
+        except UnicodeEncodeError:
+            return filename.encode('utf-8'), _FLAG_UTF8
+
+    @staticmethod
+    def _dos_date_time(date_time):
+        year, month, day, hour, minute, second = date_time
+        dos_date = (year - 1980) << 9 | month << 5 | day
+        dos_time = hour << 11 | minute << 5 | (second // 2)
+        return dos_time, dos_date
+
+
+def read_raw_member(fp, zip_info):
+    """
+    Read the compressed data of an archive member without decompressing it.
+
+    Args:
+        fp(file): Readable binary file object of the archive.
+        zip_info(zipfile.ZipInfo): Member info as loaded by zipfile.ZipFile from the same file object.
+
+    Returns:
+        bytes: Compressed member data.
+
+    Raises:
+        zipfile.BadZipFile: if the local header of the member is corrupted.
+    """
+    fp.seek(zip_info.header_offset)
+    header = fp.read(_LOCAL_HEADER.size)
+    if len(header) != _LOCAL_HEADER.size:
+        raise zipfile.BadZipFile("Truncated local header of member {}.".format(zip_info.filename))
+
+    fields = _LOCAL_HEADER.unpack(header)
+    if fields[0] != _LOCAL_HEADER_SIGNATURE:
+        raise zipfile.BadZipFile("Bad local header signature of member {}.".format(zip_info.filename))
+
+    name_length, extra_length = fields[9], fields[10]
+    fp.seek(name_length + extra_length, os.SEEK_CUR)
+    return fp.read(zip_info.compress_size)
+
+
+def copy_info(zip_info):
+    """
+    Create a fresh ZipInfo describing the same (already compressed) data as the given one.
+
+    Args:
+        zip_info(zipfile.ZipInfo): Member info loaded from an existing archive.
+
+    Returns:
+        zipfile.ZipInfo: Member info suitable for RawZipWriter.write_raw.
+    """
+    new_info = zipfile.ZipInfo(zip_info.filename, zip_info.date_time)
+    new_info.compress_type = zip_info.compress_type
+    new_info.CRC = zip_info.CRC
+    new_info.file_size = zip_info.file_size
+    new_info.external_attr = zip_info.external_attr
+    return new_info
+
+
+def copy_raw_members(source, target):
+    """
+    Copy all members of a zip archive into a new archive without decompressing and recompressing them.
+
+    The source may be preceded by other data (such as a CRX header), the new archive will only contain the members.
+
+    Args:
+        source(file): Readable and seekable binary file object of the source archive.
+        target(str or file): Filename or a writable binary file object to write the new archive into.
+
+    Returns:
+        None
+
+    Raises:
+        zipfile.BadZipFile: if the source is not a valid zip archive.
+        ValueError: if the source contains encrypted members.
+    """
+    with zipfile.ZipFile(source) as zip_file:
+        members = zip_file.infolist()
+
+    with RawZipWriter(target) as writer:
+        for zip_info in members:
+            if zip_info.flag_bits & 0x1:
+                raise ValueError("Member {} is encrypted and cannot be copied.".format(zip_info.filename))
+            writer.write_raw(copy_info(zip_info), read_raw_member(source, zip_info))
+
+
+class CompressionPolicy:
+    """
+    Decides how each file is compressed, based on glob patterns matched against its name in the archive.
+
+    Rules are (pattern, level) pairs checked in order, the first matching one wins. Patterns without a slash are
+    matched against the base name only, and matching is case-insensitive. Level 0 means the file is stored without
+    compression, levels 1-9 are zlib deflate levels. Files not matching any rule use default_level.
+    """
+
+    # Formats that are compressed already, deflating them only wastes CPU time.
+    STORED_PATTERNS = ('*.png', '*.jpg', '*.jpeg', '*.gif', '*.webp', '*.ico',
+                       '*.woff', '*.woff2', '*.mp3', '*.mp4', '*.ogg', '*.webm', '*.wasm',
+                       '*.zip', '*.gz', '*.br', '*.xpi', '*.crx')
+
+    def __init__(self, rules=(), default_level=zlib.Z_DEFAULT_COMPRESSION):
+        """
+        Args:
+            rules(:obj:`list` of :obj:`tuple`): (pattern, level) pairs.
+            default_level(int, optional): Level of files not matching any rule.
+        """
+        super().__init__()
+        self.rules = [(pattern.lower(), int(level)) for pattern, level in rules]
+        self.default_level = int(default_level)
+
+    @classmethod
+    def default(cls):
+        """ Policy storing files of already compressed formats (see STORED_PATTERNS) and deflating the rest. """
+        return cls([(pattern, 0) for pattern in cls.STORED_PATTERNS])
+
+    def with_rule(self, pattern, level):
+        """
+        Create a new policy with the given rule taking precedence over the existing ones.
+
+        Args:
+            pattern(str): Glob pattern, e.g. ``*.js`` or ``assets/*``.
+            level(int or str): Compression level, 0 for storing without compression.
+
+        Returns:
+            CompressionPolicy: The new policy.
+        """
+        return CompressionPolicy([(pattern, level)] + self.rules, self.default_level)
+
+    def level(self, arcname):
+        """
+        Find the compression level of a file.
+
+        Args:
+            arcname(str): Name of the file in the archive.
+
+        Returns:
+            int: Compression level, 0 for storing without compression.
+        """
+        name = arcname.replace(os.sep, '/').lower()
+        base_name = posixpath.basename(name)
+        for pattern, level in self.rules:
+            if fnmatch.fnmatchcase(name if '/' in pattern else base_name, pattern):
+                return level
+        return self.default_level
+
+    def __repr__(self):
+        return 'CompressionPolicy({!r}, {!r})'.format(self.rules, self.default_level)
+
+
+def compress_file(job):
+    """
+    Compress a file as stored in zip archives. Files that do not shrink by deflating are stored instead.
+
+    Module-level and taking a single argument so that it can be mapped over in worker processes.
+
+    Args:
+        job(tuple): (filename, level) - file to compress and zlib level, 0 for storing without compression.
+
+    Returns:
+        tuple: (compress_type, crc, file_size, compressed_data)
+    """
+    filename, level = job
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -zlib.MAX_WBITS) if level else None
+    first_chunk = b''
+    chunks = []
+    crc = 0
+    size = 0
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            if not size:
+                first_chunk = chunk
+            crc = zlib.crc32(chunk, crc)
+            size += len(chunk)
+            chunks.append(compressor.compress(chunk) if compressor else chunk)
+
+    if not compressor:
+        return zipfile.ZIP_STORED, crc, size, b''.join(chunks)
+
+    chunks.append(compressor.flush())
+    data = b''.join(chunks)
+
+    # Single-chunk files that do not shrink are stored as they are (their content is still at hand).
+    if len(data) >= size == len(first_chunk):
+        return zipfile.ZIP_STORED, crc, size, first_chunk
+    return zipfile.ZIP_DEFLATED, crc, size, data
+
+
+def list_files(path):
+    """
+    List all files under a folder, except those excluded by its ignore file (see ignore.IgnoreMatcher).
+
+    Args:
+        path(str): Root folder.
+
+    Returns:
+        :obj:`list` of :obj:`tuple`: (full path, archive name) pairs in os.walk order.
+    """
+    stats = ignore.IgnoreStats()
+    members = list(ignore.walk_files(path, stats=stats))
+    if stats.files or stats.directories:
+        logger.info("Ignored {} under {}".format(stats, path))
+    return members
+
+
+def resolve_jobs(jobs):
+    """
+    Convert the user-supplied number of jobs into a number of worker processes.
+
+    Args:
+        jobs(int or str): Requested number of jobs. Zero or less means one per CPU core.
+
+    Returns:
+        int: Number of worker processes, at least 1.
+    """
+    jobs = int(jobs)  # if it was passed from the user, it will be a str
+    if jobs <= 0:
+        jobs = os.cpu_count() or 1
+    return jobs
+
+
+def fixed_date_time():
+    """
+    Timestamp of all entries of deterministic archives.
+
+    It is taken from the SOURCE_DATE_EPOCH environment variable if set (see reproducible-builds.org), otherwise it is
+    the earliest date representable in a zip archive.
+
+    Returns:
+        tuple: (year, month, day, hour, minute, second)
+    """
+    epoch = os.environ.get('SOURCE_DATE_EPOCH')
+    if epoch:
+        date_time = time.gmtime(int(epoch))[:6]
+        if date_time[0] >= 1980:
+            return date_time
+    return 1980, 1, 1, 0, 0, 0
+
+
+def _member_infos(members, deterministic):
+    """
+    Create ZipInfo objects of files to be zipped.
+
+    In deterministic mode, the entries are sorted by name and their timestamps and permissions are normalized.
+    """
+    infos = []
+    date_time = fixed_date_time() if deterministic else None
+    for full_path, arcname in members:
+        zip_info = zipfile.ZipInfo.from_file(full_path, arcname)
+        if deterministic:
+            zip_info.date_time = date_time
+            mode = 0o755 if zip_info.external_attr >> 16 & 0o111 else 0o644
+            zip_info.external_attr = (stat.S_IFREG | mode) << 16
+        infos.append((full_path, zip_info))
+
+    if deterministic:
+        infos.sort(key=lambda info: info[1].filename)
+    return infos
+
+
+def _compress_files(jobs_list, jobs):
+    """
+    Compress files by compress_file, in a process pool if more than one job is requested.
+
+    Args:
+        jobs_list(:obj:`list` of :obj:`tuple`): (filename, level) pairs to compress.
+        jobs(int): Number of worker processes.
+
+    Returns:
+        iterator: Results of compress_file, in the order of jobs_list.
+    """
+    if jobs <= 1 or len(jobs_list) <= 1:
+        yield from map(compress_file, jobs_list)
+        return
+
+    chunksize = max(1, len(jobs_list) // (jobs * 4))
+    with concurrent.futures.ProcessPoolExecutor(max_workers=jobs) as executor:
+        yield from executor.map(compress_file, jobs_list, chunksize=chunksize)
+
+
+def _check_size(path, members):
+    if len(members) > MAX_ENTRIES or sum(os.path.getsize(full_path) for full_path, _ in members) > MAX_SIZE:
+        raise ValueError("Folder {} is too large to be zipped without zip64 extensions.".format(path))
+
+
+def build_zip(target, path, jobs=1, policy=None, deterministic=False):
+    """
+    Zip a folder, optionally compressing its files concurrently in a process pool.
+
+    Every file is compressed by compress_file (in a worker process if jobs > 1), the results are then assembled in
+    order into a single archive by RawZipWriter.
+
+    Args:
+        target(str or file): Filename or a writable binary file object to write the archive into.
+        path(str): Root folder of the path to zip.
+        jobs(int, optional): Number of worker processes. Zero means one per CPU core.
+        policy(CompressionPolicy, optional): Compression of individual files. Defaults to CompressionPolicy.default.
+        deterministic(bool, optional): If true, sort entries and normalize their timestamps and permissions, so that
+                                       the same files always produce a byte-identical archive.
+
+    Returns:
+        None
+
+    Raises:
+        ValueError: if the folder is too large to be zipped without zip64 extensions.
+    """
+    jobs = resolve_jobs(jobs)
+    policy = policy or CompressionPolicy.default()
+    members = list_files(path)
+    _check_size(path, members)
+
+    logger.debug("Compressing {} files using {} processes".format(len(members), jobs))
+
+    infos = _member_infos(members, deterministic)
+    with RawZipWriter(target) as writer:
+        results = _compress_files([(full_path, policy.level(zip_info.filename)) for full_path, zip_info in infos], jobs)
+        for (_, zip_info), (compress_type, crc, size, data) in zip(infos, results):
+            zip_info.compress_type = compress_type
+            zip_info.CRC = crc
+            zip_info.file_size = size
+            writer.write_raw(zip_info, data)
+
+
+def _file_crc(filename):
+    crc = 0
+    with open(filename, 'rb') as f:
+        for chunk in iter(lambda: f.read(READ_CHUNK_SIZE), b''):
+            crc = zlib.crc32(chunk, crc)
+    return crc
+
+
+def _is_unchanged(old_info, zip_info, full_path, deterministic=False):
+    """
+    Check whether an entry of a previous archive still matches a file in the working tree.
+
+    Entries of the same size and modification time are considered unchanged. If only the modification time
+    differs, CRC of the file decides. Timestamps of deterministic archives are normalized and say nothing about the
+    files, so CRC always decides there.
+    """
+    if old_info is None or old_info.is_dir() or old_info.flag_bits & 0x1 or old_info.file_size != zip_info.file_size:
+        return False
+
+    if not deterministic:
+        # Zip archives store modification times with 2-second resolution.
+        date_time = zip_info.date_time[:5] + (zip_info.date_time[5] // 2 * 2,)
+        if old_info.date_time == date_time:
+            return True
+    return _file_crc(full_path) == old_info.CRC
+
+
+def update_zip(target, path, previous, jobs=1, policy=None, deterministic=False):
+    """
+    Zip a folder, reusing compressed data of unchanged entries of a previously built archive.
+
+    Entries of the previous archive that still match the files in the folder (see _is_unchanged) are copied without
+    decompressing them, only new and modified files are compressed. Reused entries keep the compression they had in
+    the previous archive, even if the policy changed since.
+
+    Args:
+        target(str or file): Filename or a writable binary file object to write the archive into. Must not be the
+                             previous archive.
+        path(str): Root folder of the path to zip.
+        previous(str): Filename of the previously built archive.
+        jobs(int, optional): Number of processes compressing modified files in parallel. 0 means one per CPU core.
+        policy(CompressionPolicy, optional): Compression of modified files. Defaults to CompressionPolicy.default.
+        deterministic(bool, optional): Sort entries and normalize their timestamps and permissions, see build_zip.
+
+    Returns:
+        tuple: (reused, compressed) numbers of entries.
+
+    Raises:
+        ValueError: if the folder is too large to be zipped without zip64 extensions.
+        zipfile.BadZipFile: if the previous archive is not a valid zip archive.
+    """
+    jobs = resolve_jobs(jobs)
+    policy = policy or CompressionPolicy.default()
+    members = list_files(path)
+    _check_size(path, members)
+
+    with open(previous, 'rb') as previous_fp:
+        with zipfile.ZipFile(previous_fp) as previous_zip:
+            old_infos = {zip_info.filename: zip_info for zip_info in previous_zip.infolist()}
+
+        entries = []
+        modified = []
+        for full_path, zip_info in _member_infos(members, deterministic):
+            old_info = old_infos.get(zip_info.filename)
+            if _is_unchanged(old_info, zip_info, full_path, deterministic):
+                entries.append((zip_info, old_info))
+            else:
+                entries.append((zip_info, None))
+                modified.append((full_path, policy.level(zip_info.filename)))
+
+        logger.debug("Reusing {} entries of {}, compressing {} files".format(len(entries) - len(modified), previous,
+                                                                            len(modified)))
+
+        with RawZipWriter(target) as writer:
+            results = _compress_files(modified, jobs)
+            for zip_info, old_info in entries:
+                if old_info:
+                    zip_info.compress_type = old_info.compress_type
+                    zip_info.CRC = old_info.CRC
+                    zip_info.file_size = old_info.file_size
+                    data = read_raw_member(previous_fp, old_info)
+                else:
+                    zip_info.compress_type, zip_info.CRC, zip_info.file_size, data = next(results)
+                writer.write_raw(zip_info, data)
+
+    return len(entries) - len(modified), len(modified)
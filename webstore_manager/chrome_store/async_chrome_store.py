@@ -0,0 +1,187 @@
+import asyncio
+import functools
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+
+from webstore_manager import logging_helper
+from webstore_manager.chrome_store.chrome_store import ChromeStore
+from webstore_manager.chrome_store.token_cache import AccessTokenCache
+from webstore_manager.store.store import new_session
+
+logger = logging_helper.get_logger(__file__)
+
+DEFAULT_CONCURRENCY = 16
+
+
+class ChromeStoreError(Exception):
+    """Raised when an operation of AsyncChromeStore fails. Holds the ErrorCodes value ChromeStore would exit with."""
+
+    def __init__(self, message, code=None):
+        super().__init__(message)
+        self.code = code
+
+
+class AsyncChromeStore:
+    """
+    Asyncio counterpart of ChromeStore, for working with many items from a single process.
+
+    Operations take the app_id of the item they work with, so one object serves any number of items. All of them
+    share one connection pool and one access token cache, and at most `concurrency` of them run at the same time.
+    The blocking ChromeStore operations are run on a thread pool of the same size, so their behaviour (including
+    resumable uploads and retries) is identical.
+
+    Use::
+
+       async with AsyncChromeStore(client_id, client_secret, refresh_token) as store:
+           versions = await asyncio.gather(*(store.get_uploaded_version(app_id) for app_id in app_ids))
+
+    Failures are raised as ChromeStoreError instead of exiting the program.
+    """
+
+    def __init__(self, client_id, client_secret, refresh_token, concurrency=DEFAULT_CONCURRENCY, session=None,
+                 token_cache=None, token_store=None, ledger=None):
+        """
+        Args:
+            client_id(str): Client ID of the OAuth credentials.
+            client_secret(str): Client secret of the OAuth credentials.
+            refresh_token(str): Refresh token.
+            concurrency(int, optional): Maximum number of operations in progress at the same time.
+            session(requests.Session, optional): Session shared by all operations. If none, a new one is created with
+                                                 a connection pool big enough for the concurrency.
+            token_cache(AccessTokenCache, optional): Cache of access tokens. If none, a new one is created.
+            token_store(PersistentTokenStore, optional): If set, access tokens are also stored on disk.
+            ledger(UploadLedger, optional): If set, uploads of archives uploaded already are skipped.
+        """
+        super().__init__()
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.refresh_token = refresh_token
+        self.concurrency = concurrency
+        self.session = session or new_session(pool_size=concurrency)
+        self.token_cache = token_cache or AccessTokenCache()
+        self.token_store = token_store
+        self.ledger = ledger
+
+        self._executor = ThreadPoolExecutor(max_workers=concurrency)
+        # Semaphores are bound to the loop they are first used in, every loop running operations gets its own. The
+        # thread pool keeps the limit across loops too.
+        self._semaphores = weakref.WeakKeyDictionary()
+
+    def store(self, app_id=""):
+        """
+        Create a blocking ChromeStore for an item, sharing the session and tokens of this object.
+
+        Args:
+            app_id(str, optional): ID of the item.
+
+        Returns:
+            ChromeStore: The store.
+        """
+        return ChromeStore(self.client_id, self.client_secret, self.refresh_token, app_id=app_id,
+                           session=self.session, token_cache=self.token_cache, token_store=self.token_store,
+                           ledger=self.ledger)
+
+    async def generate_access_token(self):
+        """
+        Get an access token, see ChromeStore.generate_access_token.
+
+        Returns:
+            str: Access token.
+        """
+        return await self.run(self.store().generate_access_token)
+
+    async def upload(self, filename, app_id="", new_item=False, chunk_size=None, progress=None, force=False):
+        """
+        Upload an extension, see ChromeStore.upload.
+
+        Args:
+            filename(str or file): Path to the archive or an opened binary file object containing it.
+            app_id(str, optional): ID of the item to update. Not needed for new items.
+            new_item(bool, optional): If true, this is a new extension.
+            chunk_size(int, optional): Size of resumable upload chunks in bytes.
+            progress(function, optional): Called as progress(bytes_sent, total_bytes), from a worker thread.
+            force(bool, optional): Upload even if the ledger says the archive was uploaded already.
+
+        Returns:
+            str: Item ID of the created or updated extension.
+
+        Raises:
+            ChromeStoreError: if the upload failed.
+        """
+        return await self.run(self.store(app_id).upload, filename, new_item, chunk_size, progress, force)
+
+    async def publish(self, app_id, target):
+        """
+        Publish an item, see ChromeStore.publish.
+
+        Args:
+            app_id(str): ID of the item.
+            target: ChromeStore.TARGET_PUBLIC or ChromeStore.TARGET_TRUSTED.
+
+        Returns:
+            str: Item ID.
+
+        Raises:
+            ChromeStoreError: if publishing failed.
+        """
+        return await self.run(self.store(app_id).publish, target)
+
+    async def get_uploaded_version(self, app_id):
+        """
+        Find the uploaded version of an item, see ChromeStore.get_uploaded_version.
+
+        Args:
+            app_id(str): ID of the item.
+
+        Returns:
+            str: Version as specified in the original manifest.
+
+        Raises:
+            ChromeStoreError: if the version could not be obtained.
+        """
+        return await self.run(self.store(app_id).get_uploaded_version)
+
+    def close(self):
+        """ Wait for running operations and release the thread pool and connections. Blocks, see aclose. """
+        self._executor.shutdown(wait=True)
+        self.session.close()
+
+    async def aclose(self):
+        """ Wait for running operations and release the thread pool and connections, without blocking the loop. """
+        await asyncio.get_running_loop().run_in_executor(None, self.close)
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.aclose()
+
+    async def run(self, func, *args):
+        """
+        Run a blocking function on the thread pool, counting it towards the concurrency limit.
+
+        Args:
+            func(function): Function to run.
+            *args: Its arguments.
+
+        Returns:
+            Return value of the function.
+
+        Raises:
+            ChromeStoreError: if the function exits the program.
+        """
+        loop = asyncio.get_running_loop()
+        semaphore = self._semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._semaphores[loop] = asyncio.Semaphore(self.concurrency)
+
+        async with semaphore:
+            return await loop.run_in_executor(self._executor, functools.partial(_call, func, *args))
+
+
+def _call(func, *args):
+    """ Call a ChromeStore method, turning its exit into an exception which does not bring down the event loop. """
+    try:
+        return func(*args)
+    except SystemExit as error:
+        raise ChromeStoreError("{} failed with error code {}".format(func.__name__, error.code), error.code) from None
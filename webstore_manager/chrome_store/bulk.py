@@ -0,0 +1,172 @@
+import asyncio
+import csv
+import json
+import os
+import time
+
+from webstore_manager import logging_helper, util
+from webstore_manager.chrome_store import chrome_store
+from webstore_manager.chrome_store.async_chrome_store import ChromeStoreError
+
+logger = logging_helper.get_logger(__file__)
+
+JOB_FIELDS = ('app_id', 'file', 'target')
+TARGETS = {
+    'public': chrome_store.ChromeStore.TARGET_PUBLIC,
+    'trusted': chrome_store.ChromeStore.TARGET_TRUSTED,
+}
+
+
+class InvalidJobError(ValueError):
+    """Raised when a job list cannot be used."""
+
+
+def read_jobs(filename):
+    """
+    Read a job list. It is either a JSON file (a list of objects, or an object with a "jobs" list), or a CSV file with
+    a header row. Fields of a job are app_id, file and target (public or trusted), unknown fields are ignored.
+
+    Args:
+        filename(str): Name of the job list. Files ending with .json are read as JSON, anything else as CSV.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: Jobs, with missing fields set to empty strings.
+
+    Raises:
+        InvalidJobError: if the file is not a valid job list.
+    """
+    with open(filename, newline='', encoding='utf-8') as f:
+        if filename.lower().endswith('.json'):
+            try:
+                jobs = json.load(f)
+            except ValueError as error:
+                raise InvalidJobError("Job list {} is not valid JSON: {}".format(filename, error))
+            if isinstance(jobs, dict):
+                jobs = jobs.get('jobs')
+            if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+                raise InvalidJobError("Job list {} must be a list of objects.".format(filename))
+        else:
+            jobs = list(csv.DictReader(f))
+
+    return [{field: (job.get(field) or '').strip() for field in JOB_FIELDS} for job in jobs]
+
+
+def validate_jobs(jobs, require_file=False, require_target=False):
+    """
+    Check that all jobs have the fields an operation needs.
+
+    Args:
+        jobs(:obj:`list` of :obj:`dict`): Jobs as returned by read_jobs.
+        require_file(bool, optional): Every job must have a file.
+        require_target(bool, optional): Every job must have a target.
+
+    Returns:
+        None
+
+    Raises:
+        InvalidJobError: if a job is missing a field or has an unknown target.
+    """
+    for number, job in enumerate(jobs, 1):
+        if not job['app_id']:
+            raise InvalidJobError("Job {} has no app_id.".format(number))
+        if require_file and not job['file']:
+            raise InvalidJobError("Job {} ({}) has no file.".format(number, job['app_id']))
+        if require_target and not job['target']:
+            raise InvalidJobError("Job {} ({}) has no target.".format(number, job['app_id']))
+        if job['target'] and job['target'] not in TARGETS:
+            raise InvalidJobError("Job {} ({}) has unknown target {}. Expected one of {}.".format(
+                number, job['app_id'], job['target'], ', '.join(sorted(TARGETS))))
+
+
+def _upload(store, job, chunk_size=None, force=False):
+    """ Upload (and publish, if the job has a target) a single item. Blocking. """
+    filename = job['file']
+    if os.path.splitext(filename)[1].lower() == '.crx':
+        filename = chrome_store.repack_crx_buffer(filename)
+
+    item_store = store.store(job['app_id'])
+    try:
+        item_id = item_store.upload(filename, chunk_size=chunk_size, force=force)
+    finally:
+        if util.is_file_object(filename):
+            filename.close()
+
+    if job['target']:
+        item_store.publish(TARGETS[job['target']])
+    return item_id
+
+
+def _publish(store, job):
+    """ Publish a single item. Blocking. """
+    return store.store(job['app_id']).publish(TARGETS[job['target']])
+
+
+async def _run_job(store, job, func, *args):
+    result = dict(job, status='success', item_id=None, version=None, error=None, error_code=None)
+    start = time.monotonic()
+    try:
+        item = await store.run(func, store, job, *args)
+        result['item_id'] = str(item) if item is not None else None
+        result['version'] = getattr(item, 'version', None)
+        logger.info("{} done".format(job['app_id']))
+    except ChromeStoreError as error:
+        result.update(status='failure', error=str(error), error_code=error.code)
+    except Exception as error:
+        result.update(status='failure', error="{}: {}".format(type(error).__name__, error))
+
+    if result['status'] == 'failure':
+        logger.error("{} failed: {}".format(job['app_id'], result['error']))
+    result['seconds'] = round(time.monotonic() - start, 3)
+    return result
+
+
+async def upload_many(store, jobs, chunk_size=None, force=False):
+    """
+    Upload many items concurrently. Items of jobs with a target are published after a successful upload.
+
+    Args:
+        store(AsyncChromeStore): Store to use, its concurrency limits the number of jobs in progress.
+        jobs(:obj:`list` of :obj:`dict`): Jobs as returned by read_jobs.
+        chunk_size(int, optional): Size of resumable upload chunks in bytes.
+        force(bool, optional): Upload even if the store's ledger says an archive was uploaded already.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: Result of every job, in the order of jobs. See summarize.
+    """
+    return await asyncio.gather(*(_run_job(store, job, _upload, chunk_size, force) for job in jobs))
+
+
+async def publish_many(store, jobs):
+    """
+    Publish many items concurrently.
+
+    Args:
+        store(AsyncChromeStore): Store to use, its concurrency limits the number of jobs in progress.
+        jobs(:obj:`list` of :obj:`dict`): Jobs as returned by read_jobs.
+
+    Returns:
+        :obj:`list` of :obj:`dict`: Result of every job, in the order of jobs. See summarize.
+    """
+    return await asyncio.gather(*(_run_job(store, job, _publish) for job in jobs))
+
+
+def summarize(results):
+    """
+    Build a machine-readable summary of job results.
+
+    Every result contains the job's fields (app_id, file, target), status ("success" or "failure"), item_id,
+    version (of uploads, if the Webstore reported it), error message and error_code (ErrorCodes value, if any) of
+    failures, and the duration in seconds.
+
+    Args:
+        results(:obj:`list` of :obj:`dict`): Results as returned by upload_many or publish_many.
+
+    Returns:
+        dict: Counts of succeeded and failed jobs and the list of results.
+    """
+    failed = sum(1 for result in results if result['status'] != 'success')
+    return {
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results,
+    }
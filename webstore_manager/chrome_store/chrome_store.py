@@ -1,12 +1,58 @@
 import os
+import shutil
+import struct
+import tempfile
+import time
 
 import requests
-from webstore_manager import logging_helper, util
+from webstore_manager import archive, logging_helper, util
+from webstore_manager.chrome_store.token_cache import AccessTokenCache
 from webstore_manager.constants import ErrorCodes
-from webstore_manager.store.store import Store
+from webstore_manager.store.ledger import file_digest
+from webstore_manager.store.store import Store, new_session
 
 logger = logging_helper.get_logger(__file__)
 
+CRX_MAGIC = b'Cr24'
+CRX_COPY_CHUNK_SIZE = 1024 * 1024
+
+# Chunks of a resumable upload, except the last one, must be multiples of this size.
+UPLOAD_CHUNK_ALIGNMENT = 256 * 1024
+UPLOAD_RETRIES = 5
+UPLOAD_MAX_BACKOFF = 30
+
+_END_RECORD = struct.Struct('<IHHHHIIH')
+
+
+class InvalidCrxError(ValueError):
+    """Raised when a file is not a valid .crx file."""
+
+
+class UploadResult(str):
+    """
+    Result of ChromeStore.upload. It is the item ID itself (so it can be used wherever the ID is expected), with the
+    version and upload state reported by the Webstore as attributes.
+    """
+
+    def __new__(cls, item_id, version=None, state=None):
+        """
+        Args:
+            item_id(str): ID of the uploaded item.
+            version(str, optional): Uploaded version (crxVersion), if the Webstore reported it.
+            state(str, optional): Upload state (uploadState).
+        """
+        result = super().__new__(cls, item_id)
+        result.version = version
+        result.state = state
+        return result
+
+    @property
+    def id(self):
+        return str(self)
+
+    def __repr__(self):
+        return "UploadResult(id={!r}, version={!r}, state={!r})".format(self.id, self.version, self.state)
+
 
 class ChromeStore(Store):
     """
@@ -16,9 +62,19 @@ class ChromeStore(Store):
     TARGET_PUBLIC = 0
     TARGET_TRUSTED = 1
 
+    # Name of the store in the upload ledger.
+    LEDGER_NAME = 'chrome'
+
     GOOGLE_OAUTH_TOKEN = 'https://www.googleapis.com/oauth2/v4/token'
 
-    def __init__(self, client_id, client_secret, refresh_token=None, app_id="", session=None):
+    # Upload states after which the uploaded version will not change on its own.
+    TERMINAL_UPLOAD_STATES = ('FAILURE', 'NOT_FOUND')
+
+    # Google OAuth access tokens are valid for an hour unless the server says otherwise.
+    DEFAULT_TOKEN_EXPIRY = 3600
+
+    def __init__(self, client_id, client_secret, refresh_token=None, app_id="", session=None, token_cache=None,
+                 token_store=None, ledger=None):
         """
         Args:
             client_id:
@@ -26,8 +82,19 @@ class ChromeStore(Store):
             refresh_token:
             app_id:
             session: If none, a new requests session will be created. Otherwise the supplied one will be used.
+            token_cache(AccessTokenCache, optional): Cache of access tokens, may be shared with other ChromeStore
+                                                     objects. If none, a new one will be created.
+            token_store(PersistentTokenStore, optional): If set, access tokens are also stored on disk and reused by
+                                                         other processes.
+            ledger(UploadLedger, optional): If set, completed uploads are recorded in it and uploading the same archive
+                                            again is skipped.
         """
         super().__init__(session)
+        self.token_cache = token_cache or AccessTokenCache()
+        self.token_store = token_store
+        self.ledger = ledger
+        self.upload_state = None
+        self.last_upload = None
         self.client_id = client_id
         self.client_secret = client_secret
         self.app_id = app_id
@@ -49,10 +116,7 @@ class ChromeStore(Store):
         Returns:
             None
         """
-        auth_token = self.generate_access_token()
-
-        headers = {"Authorization": "Bearer {}".format(auth_token),
-                   "x-goog-api-version": "2",
+        headers = {"x-goog-api-version": "2",
                    "Content-Length": "0"}
 
         # Note: webstore API documentation is inconsistent whether it requires publishTarget in headers or in URL
@@ -67,8 +131,9 @@ class ChromeStore(Store):
             exit(ErrorCodes.chrome_publish_bad_target)
 
         logger.debug("Making publish query to {}".format(self.publish_item_url.format(target)))
-        response = self.session.post(self.publish_item_url.format(target),
-                                     headers=headers)
+        response = self._send_authorized(lambda auth_headers: self.session.post(self.publish_item_url.format(target),
+                                                                                 headers=auth_headers),
+                                         headers)
 
         try:
             res_json = response.json()
@@ -94,42 +159,75 @@ class ChromeStore(Store):
             logger.error("Response: {}".format(response.content))
             exit(ErrorCodes.response_not_json)
 
-    def upload(self, filename, new_item=False):
+    def upload(self, filename, new_item=False, chunk_size=None, progress=None, force=False):
         """
         Uploads a zip-archived extension to the webstore; either as a completely new extension, or as a
         version update to an existing one.
 
+        If chunk_size is set, the archive is uploaded using the resumable upload protocol: in chunks of the given size,
+        and after a failed chunk the upload continues from the last byte the server received (see
+        ChromeStore._upload_resumable).
+
+        If the store has an upload ledger and the archive is identical to the last one uploaded for the item, nothing
+        is uploaded and the recorded upload is returned (unless force is set).
+
         Args:
-            filename(str): Path to the archive.
+            filename(str or file): Path to the archive or an opened binary file object containing it
+                                   (e.g. created by util.make_zip_buffer).
             new_item(bool): If true, this is a new extension. If false, this is an update to an existing one.
+            chunk_size(int, optional): Size of upload chunks in bytes, a multiple of UPLOAD_CHUNK_ALIGNMENT.
+                                       If none, the archive is sent in a single request.
+            progress(function, optional): Called as progress(bytes_sent, total_bytes) after every chunk of a
+                                          resumable upload.
+            force(bool, optional): Upload even if the ledger says the archive was uploaded already.
 
         Returns:
-            str: Item ID of the created or updated extension.
+            UploadResult: Item ID of the created or updated extension, with the uploaded version and upload state.
+                          Also saved in the last_upload field.
+
+        Raises:
+            ValueError: if chunk_size is not a positive multiple of UPLOAD_CHUNK_ALIGNMENT.
         """
+        if chunk_size is not None and (chunk_size <= 0 or chunk_size % UPLOAD_CHUNK_ALIGNMENT):
+            raise ValueError("Chunk size must be a positive multiple of {} bytes.".format(UPLOAD_CHUNK_ALIGNMENT))
+
         if new_item:
-            logger.info("Uploading a new extension - new file: {}".format(filename))
+            logger.info("Uploading a new extension - new file: {}".format(util.archive_name(filename)))
         else:
-            logger.info("Uploading an update - file: {}".format(filename))
+            logger.info("Uploading an update - file: {}".format(util.archive_name(filename)))
 
         if not new_item and not self.app_id:
             logger.error("To upload a new version of an extension, supply the app_id parameter!")
             exit(ErrorCodes.chrome_upload_no_appid)
 
-        auth_token = self.generate_access_token()
-
-        headers = {"Authorization": "Bearer {}".format(auth_token),
-                   "x-goog-api-version": "2"}
-
-        data = open(filename, 'rb')
-
-        if new_item:
-            response = self.session.post(self.new_item_url,
-                                         headers=headers,
-                                         data=data)
-        else:
-            response = self.session.put(self.update_item_url,
-                                        headers=headers,
-                                        data=data)
+        digest = file_digest(filename) if self.ledger else None
+        if digest and not new_item and not force:
+            entry = self.ledger.find(self.LEDGER_NAME, self.app_id, digest)
+            if entry:
+                logger.info("Archive was already uploaded as version {} of item {}, skipping the upload. "
+                            "Use force to upload it anyway.".format(entry['version'], self.app_id))
+                self.upload_state = 'SUCCESS'
+                self.last_upload = UploadResult(self.app_id, entry['version'], self.upload_state)
+                return self.last_upload
+
+        headers = {"x-goog-api-version": "2"}
+
+        with util.open_archive(filename) as data:
+            def send(auth_headers):
+                data.seek(0)  # may be sent twice, see _send_authorized
+                if chunk_size:
+                    url, method = (self.new_item_url, 'POST') if new_item else (self.update_item_url, 'PUT')
+                    return self._upload_resumable(url, method, auth_headers, data, chunk_size, progress)
+                elif new_item:
+                    return self.session.post(self.new_item_url,
+                                             headers=auth_headers,
+                                             data=data)
+                else:
+                    return self.session.put(self.update_item_url,
+                                            headers=auth_headers,
+                                            data=data)
+
+            response = self._send_authorized(send, headers)
 
         try:
             response.raise_for_status()
@@ -141,15 +239,19 @@ class ChromeStore(Store):
         try:
             rjson = response.json()
             state = rjson['uploadState']
+            self.upload_state = state
             if not state == 'SUCCESS':
                 logger.error("Uploading state is not SUCCESS.")
                 logger.error("Response: {}".format(rjson))
                 exit(ErrorCodes.chrome_upload_app_not_found)
             else:
                 self.app_id = rjson['id']
-                logger.info("Upload completed. Item ID: {}".format(self.app_id))
+                self.last_upload = UploadResult(self.app_id, rjson.get('crxVersion'), state)
+                if digest:
+                    self.ledger.record(self.LEDGER_NAME, self.app_id, self.last_upload.version, digest)
+                logger.info("Upload completed. Item ID: {}, version: {}".format(self.app_id, self.last_upload.version))
                 logger.info("Done.")
-                return self.app_id
+                return self.last_upload
 
         except KeyError as error:
             logger.error("Key 'uploadState' not found in returned JSON.")
@@ -157,29 +259,140 @@ class ChromeStore(Store):
             logger.error("Response: {}".format(response.json()))
             exit(ErrorCodes.chrome_upload_key_not_found)
 
+    def _upload_resumable(self, url, method, headers, data, chunk_size, progress=None):
+        """
+        Upload data using the Google resumable upload protocol.
+
+        An upload session is started first, then the data is sent in chunks. The server acknowledges every chunk but
+        the last one with "308 Resume Incomplete" and the range of bytes received so far. When a chunk fails
+        (connection error, 5xx or 429 response, or a 308 response showing no new bytes), the server is asked how many
+        bytes it has and the upload continues from there, retrying up to UPLOAD_RETRIES times in a row with exponential
+        backoff.
+
+        Args:
+            url(str): Upload endpoint.
+            method(str): HTTP method starting the upload session, POST for new items and PUT for updates.
+            headers(dict): Authorization headers.
+            data(file): Seekable binary file object positioned at its beginning.
+            chunk_size(int): Size of chunks in bytes.
+            progress(function, optional): Called as progress(bytes_sent, total_bytes) after every chunk.
+
+        Returns:
+            requests.Response: Response to the last chunk (or the last failed attempt).
+
+        Raises:
+            requests.ConnectionError, requests.Timeout: if the last retry failed to connect or made no progress.
+        """
+        data.seek(0, os.SEEK_END)
+        total = data.tell()
+        response = self._start_resumable_upload(url, method, headers, total)
+        if response.status_code == 401:  # access token rejected, see ChromeStore._send_authorized
+            return response
+        session_url = response.headers['Location']
+
+        offset = 0
+        failures = 0
+        query = total == 0  # an empty upload is finished by the status query
+        while True:
+            if query:
+                body = b''
+                content_range = 'bytes */{}'.format(total)
+            else:
+                data.seek(offset)
+                body = data.read(chunk_size)
+                content_range = 'bytes {}-{}/{}'.format(offset, offset + len(body) - 1, total)
+
+            try:
+                response = self.session.put(session_url,
+                                            headers=dict(headers, **{'Content-Range': content_range}),
+                                            data=body)
+            except (requests.ConnectionError, requests.Timeout) as error:
+                response = None
+                failure = error
+            else:
+                failure = "HTTP {}".format(response.status_code)
+
+            if response is not None and response.status_code == 308:
+                received = _received_bytes(response)
+                if received > offset or query:
+                    if received > offset:
+                        failures = 0
+                    offset = received
+                    query = False
+                    logger.debug("Uploaded {} of {} bytes".format(offset, total))
+                    if progress:
+                        progress(offset, total)
+                    continue
+
+                # The server acknowledged a chunk without receiving any of it, retry it like a failed one.
+                response = None
+                failure = requests.ConnectionError("Server did not receive the chunk {}.".format(content_range))
+
+            if response is not None and response.status_code < 500 and response.status_code != 429:
+                if response.ok and progress:
+                    progress(total, total)
+                return response
+
+            failures += 1
+            if failures > UPLOAD_RETRIES:
+                logger.error("Upload failed {} times in a row, giving up.".format(failures))
+                if response is None:
+                    raise failure
+                return response
+
+            delay = min(2 ** failures, UPLOAD_MAX_BACKOFF)
+            logger.warning("Uploading a chunk failed ({}), resuming in {} seconds.".format(failure, delay))
+            time.sleep(delay)
+            query = True
+
+    def _start_resumable_upload(self, url, method, headers, total):
+        """
+        Start a resumable upload session. Returns the response with the session URL in its Location header, or the
+        401 response if the access token was rejected.
+        """
+        session_headers = dict(headers, **{"X-Upload-Content-Type": "application/zip",
+                                           "X-Upload-Content-Length": str(total),
+                                           "Content-Length": "0"})
+        response = self.session.request(method, url, params={'uploadType': 'resumable'}, headers=session_headers)
+        if response.status_code == 401:
+            return response
+
+        try:
+            response.raise_for_status()
+        except requests.HTTPError as error:
+            logger.error(error)
+            logger.error("Response: {}".format(response.content))
+            exit(ErrorCodes.chrome_upload_generic_error)
+
+        if 'Location' not in response.headers:
+            logger.error("Upload session URL not found in response headers.")
+            logger.error("Response headers: {}".format(response.headers))
+            exit(ErrorCodes.chrome_upload_generic_error)
+        return response
+
     def get_uploaded_version(self):
         """
-        Finds version of an extension that is currently uploaded in the web store.
+        Finds version of an extension that is currently uploaded in the web store. The reported upload state is saved
+        in the upload_state field.
 
         Returns:
             str: Version as specified in the original manifest.
         """
-        auth_token = self.generate_access_token()
-
-        headers = {"Authorization": "Bearer {}".format(auth_token),
-                   "x-goog-api-version": "2",
+        headers = {"x-goog-api-version": "2",
                    "Content-Length": "0",
                    "Expect": ""}
 
         final_url = self.get_status_url.format(self.app_id)
         logger.debug("Checking status at {}".format(final_url))
-        response = self.session.get(final_url,
-                                    headers=headers)
+        response = self._send_authorized(lambda auth_headers: self.session.get(final_url,
+                                                                                headers=auth_headers),
+                                         headers)
 
         try:
             res_json = response.json()
             reported_version = res_json['crxVersion']
-            reported_state = res_json['uploadState']  # No use right now
+            reported_state = res_json['uploadState']
+            self.upload_state = reported_state
 
             logger.info("Status obtained. Item ID: {}, version: {}, state: {}".format(self.app_id, reported_version,
                                                                                       reported_state))
@@ -198,15 +411,58 @@ class ChromeStore(Store):
 
     def generate_access_token(self):
         """
-        Generate a new access token from a saved refresh token.
+        Get an access token from a saved refresh token. A new one is only requested if there is no cached token or it
+        is about to expire.
 
         Returns:
             Access token.
 
         """
-        auth_token = self.gen_access_token(self.client_id, self.client_secret, self.refresh_token, session=self.session)
+        return self.token_cache.get((self.client_id, self.refresh_token), self._refresh_access_token)
+
+    def invalidate_access_token(self):
+        """
+        Drop the current access token from the in-memory cache and the on-disk store, so that the next call of
+        generate_access_token obtains a new one.
+
+        Returns:
+            None
+        """
+        self.token_cache.invalidate((self.client_id, self.refresh_token))
+        if self.token_store:
+            self.token_store.invalidate(self.client_id, self.refresh_token)
+
+    def _send_authorized(self, send, headers):
+        """
+        Send a request with an access token. If the store rejects the token (401, e.g. it was revoked while still
+        cached), it is invalidated and the request is sent once more with a new token.
+
+        Args:
+            send(function): Called with the headers of the request, including Authorization. Returns the response.
+            headers(dict): Other headers of the request.
+
+        Returns:
+            requests.Response: Response to the last attempt.
+        """
+        response = send(dict(headers, Authorization="Bearer {}".format(self.generate_access_token())))
+        if response.status_code != 401:
+            return response
+
+        logger.warning("Access token was rejected, requesting a new one.")
+        self.invalidate_access_token()
+        return send(dict(headers, Authorization="Bearer {}".format(self.generate_access_token())))
+
+    def _refresh_access_token(self):
+        if self.token_store:
+            return self.token_store.get(self.client_id, self.client_secret, self.refresh_token,
+                                        self._request_access_token)
+        return self._request_access_token()
+
+    def _request_access_token(self):
+        auth_token, expires_in = self.refresh_access_token(self.client_id, self.client_secret, self.refresh_token,
+                                                           session=self.session)
         logger.info("Obtained an auth token: {}".format(auth_token))
-        return auth_token
+        return auth_token, expires_in
 
     def authenticate(self, code):
         """
@@ -242,7 +498,7 @@ class ChromeStore(Store):
         logger.debug("    Client secret: {}".format(client_secret))
         logger.debug("    Code:          {}".format(code))
 
-        session = session or requests.Session()
+        session = session or new_session()
         response = session.post(ChromeStore.GOOGLE_OAUTH_TOKEN,
                                 data={
                                     "client_id": client_id,
@@ -275,7 +531,17 @@ class ChromeStore(Store):
         Returns:
             str: New user token valid (by default) for 1 hour.
         """
-        session = session or requests.Session()
+        return ChromeStore.refresh_access_token(client_id, client_secret, refresh_token, session)[0]
+
+    @staticmethod
+    def refresh_access_token(client_id, client_secret, refresh_token, session=None):
+        """
+        Use refresh token to generate a new client access token, see gen_access_token.
+
+        Returns:
+            str, int: New user token and number of seconds it expires in.
+        """
+        session = session or new_session()
         response = session.post(ChromeStore.GOOGLE_OAUTH_TOKEN,
                                 data={"client_id": client_id,
                                       "client_secret": client_secret,
@@ -293,7 +559,111 @@ class ChromeStore(Store):
             exit(ErrorCodes.response_error)
 
         res_json = response.json()
-        return res_json['access_token']
+        return res_json['access_token'], int(res_json.get('expires_in', ChromeStore.DEFAULT_TOKEN_EXPIRY))
+
+
+def _received_bytes(response):
+    """ Number of bytes received by the server according to a "308 Resume Incomplete" response. """
+    received = response.headers.get('Range')  # e.g. "bytes=0-524287", missing if nothing was received
+    if not received:
+        return 0
+    return int(received.rsplit('-', 1)[1]) + 1
+
+
+def crx_payload_offset(crx_file):
+    """
+    Parse the header of a .crx file and find where the embedded zip archive starts.
+
+    Both CRX2 (public key and signature) and CRX3 (protobuf header) formats are supported.
+
+    Args:
+        crx_file(file): Readable binary file object of the .crx file.
+
+    Returns:
+        int: Offset of the zip archive from the beginning of the file.
+
+    Raises:
+        InvalidCrxError: if the file is not a CRX2 or CRX3 file, or its header does not fit in the file.
+    """
+    file_size = crx_file.seek(0, os.SEEK_END)
+    crx_file.seek(0)
+    header = crx_file.read(12)
+    if len(header) < 12 or header[:4] != CRX_MAGIC:
+        raise InvalidCrxError("File does not start with the CRX magic number.")
+
+    version, length = struct.unpack('<II', header[4:])
+    if version == 2:
+        signature_length = crx_file.read(4)
+        if len(signature_length) < 4:
+            raise InvalidCrxError("Truncated CRX2 header.")
+        offset = 16 + length + struct.unpack('<I', signature_length)[0]
+    elif version == 3:
+        offset = 12 + length
+    else:
+        raise InvalidCrxError("Unsupported CRX version: {}".format(version))
+
+    if offset > file_size:
+        raise InvalidCrxError("CRX{} header is {} bytes long, but the file only has {} bytes.".format(
+            version, offset, file_size))
+    return offset
+
+
+def crx_to_zip(filename, target):
+    """
+    Convert a .crx file into a zip archive without extracting or recompressing anything.
+
+    The zip archive embedded in the .crx file is copied byte by byte. Should its central directory use offsets
+    relative to the beginning of the .crx file instead of the archive, its members are copied one by one (still
+    compressed) into a new archive instead.
+
+    Args:
+        filename(str): A .crx Chrome Extension file.
+        target(str or file): Filename or a writable binary file object to write the zip into.
+
+    Returns:
+        None
+
+    Raises:
+        InvalidCrxError: if the file is not a CRX2 or CRX3 file.
+    """
+    with open(filename, 'rb') as crx_file:
+        offset = crx_payload_offset(crx_file)
+        logger.debug("Zip archive in {} starts at offset {}".format(filename, offset))
+
+        if util.is_file_object(target):
+            _copy_crx_payload(crx_file, offset, target)
+        else:
+            with open(target, 'wb') as target_file:
+                _copy_crx_payload(crx_file, offset, target_file)
+
+
+def _zip_is_relocatable(crx_file, offset):
+    """
+    Check whether the central directory of the embedded zip archive uses offsets relative to the archive itself,
+    i.e. whether the archive stays valid when cut out of the .crx file.
+    """
+    crx_file.seek(0, os.SEEK_END)
+    file_size = crx_file.tell()
+    tail_size = min(file_size - offset, _END_RECORD.size + 0xFFFF)  # end record plus maximum comment length
+    crx_file.seek(file_size - tail_size)
+    tail = crx_file.read(tail_size)
+
+    position = tail.rfind(b'PK\x05\x06')
+    if position < 0 or len(tail) - position < _END_RECORD.size:
+        return False
+
+    directory_size, directory_offset = _END_RECORD.unpack(tail[position:position + _END_RECORD.size])[5:7]
+    directory_position = file_size - tail_size + position - directory_size
+    return directory_position - offset == directory_offset
+
+
+def _copy_crx_payload(crx_file, offset, target):
+    if _zip_is_relocatable(crx_file, offset):
+        crx_file.seek(offset)
+        shutil.copyfileobj(crx_file, target, CRX_COPY_CHUNK_SIZE)
+    else:
+        logger.debug("Zip archive is not relocatable, copying its members.")
+        archive.copy_raw_members(crx_file, target)
 
 
 def repack_crx(filename, target_dir=""):
@@ -302,20 +672,31 @@ def repack_crx(filename, target_dir=""):
 
     Args:
         filename(str): A .crx Chrome Extension file.
-        target_dir(str, optional): If set, zip file will be created in the given directory (instead of temporary dir).
+        target_dir(str, optional): If set, zip file will be created in the given directory (instead of a new directory
+                                   in util.scratch_space, removed at exit).
 
     Returns:
         str: Filename of the newly created zip file. (full path)
     """
-    temp_dir = util.build_dir
-
-    util.unzip(filename, temp_dir)
-
     fn_noext = os.path.basename(os.path.splitext(filename)[0])
-    zip_new_name = fn_noext + ".zip"
+    full_name = os.path.join(target_dir or util.scratch_space.allocate('repack'), fn_noext + ".zip")
 
-    if not target_dir:
-        full_name = util.make_zip(zip_new_name, temp_dir, util.build_dir)
-    else:
-        full_name = util.make_zip(zip_new_name, temp_dir, target_dir)
+    logger.info("Creating zipfile {}".format(full_name))
+    crx_to_zip(filename, full_name)
     return full_name
+
+
+def repack_crx_buffer(filename):
+    """
+    Repacks the given .crx file into a zip archive held in a spooled temporary file (see util.make_zip_buffer).
+
+    Args:
+        filename(str): A .crx Chrome Extension file.
+
+    Returns:
+        tempfile.SpooledTemporaryFile: The zip archive, rewound to its beginning.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=util.spool_max_size)
+    crx_to_zip(filename, buffer)
+    buffer.seek(0)
+    return buffer
@@ -1,14 +1,41 @@
+import asyncio
+import json
+
 import click
 
-from . import chrome_store
+from . import bulk, chrome_store
+from .async_chrome_store import AsyncChromeStore, DEFAULT_CONCURRENCY
+from .token_store import PersistentTokenStore
 from webstore_manager import logging_helper, util, constants
+from webstore_manager.store.ledger import UploadLedger
 
 logger = logging_helper.get_logger(__file__)
 
 
 @click.group()
-def chrome():
-    pass
+@click.option('--token-store/--no-token-store', default=True,
+              help="Reuse access tokens stored on disk by previous invocations (default), or always request new ones. "
+                   "Stored tokens are not encrypted, only readable by your user.")
+@click.pass_context
+def chrome(ctx, token_store):
+    ctx.obj = {'token_store': PersistentTokenStore() if token_store else None,
+               'ledger': UploadLedger()}
+
+
+def _log_progress(sent, total):
+    logger.info("Uploaded {} of {} bytes".format(sent, total))
+
+
+chunk_size_option = click.option('--chunk-size', type=int, default=None,
+                                 help="Upload in resumable chunks of this many bytes (a multiple of 262144).")
+force_option = click.option('--force', is_flag=True,
+                            help="Upload even if the same file was the last one uploaded for the item.")
+
+
+def _new_store(*args, **kwargs):
+    """ Create a ChromeStore using the token store and upload ledger of the chrome command group. """
+    obj = click.get_current_context().obj or {}
+    return chrome_store.ChromeStore(*args, token_store=obj.get('token_store'), ledger=obj.get('ledger'), **kwargs)
 
 
 @chrome.command('init', short_help="initialize API key. Run this first.")
@@ -44,7 +71,9 @@ def gen_token(client_id, client_secret, refresh_token):
 @click.argument('app_id', required=True)
 @click.argument('filename', required=True)
 @click.option('-t', '--filetype', default='crx', type=click.Choice(['crx', 'zip']))
-def upload(client_id, client_secret, refresh_token, app_id, filename, filetype):
+@chunk_size_option
+@force_option
+def upload(client_id, client_secret, refresh_token, app_id, filename, filetype, chunk_size, force):
     logger.debug("upload with parameters:")
     logger.debug("  client_id: {}".format(client_id))
     logger.debug("  client_secret: {}".format(client_secret))
@@ -54,10 +83,10 @@ def upload(client_id, client_secret, refresh_token, app_id, filename, filetype):
     logger.debug("  filetype: {}".format(filetype))
 
     if filetype == 'crx':
-        filename = chrome_store.repack_crx(filename)
+        filename = chrome_store.repack_crx_buffer(filename)
 
-    store = chrome_store.ChromeStore(client_id, client_secret, refresh_token, app_id=app_id)
-    app_id = store.upload(filename)
+    store = _new_store(client_id, client_secret, refresh_token, app_id=app_id)
+    app_id = store.upload(filename, chunk_size=chunk_size, progress=_log_progress, force=force)
     print(app_id)
 
 
@@ -67,7 +96,8 @@ def upload(client_id, client_secret, refresh_token, app_id, filename, filetype):
 @click.argument('refresh_token', required=True)
 @click.argument('filename', required=True)
 @click.option('-t', '--filetype', default='crx', type=click.Choice(['crx', 'zip']))
-def create(client_id, client_secret, refresh_token, filename, filetype):
+@chunk_size_option
+def create(client_id, client_secret, refresh_token, filename, filetype, chunk_size):
     logger.debug("creating with parameters:")
     logger.debug("  client_id: {}".format(client_id))
     logger.debug("  client_secret: {}".format(client_secret))
@@ -76,10 +106,10 @@ def create(client_id, client_secret, refresh_token, filename, filetype):
     logger.debug("  filetype: {}".format(filetype))
 
     if filetype == 'crx':
-        filename = chrome_store.repack_crx(filename)
+        filename = chrome_store.repack_crx_buffer(filename)
 
-    store = chrome_store.ChromeStore(client_id, client_secret, refresh_token)
-    app_id = store.upload(filename, True)
+    store = _new_store(client_id, client_secret, refresh_token)
+    app_id = store.upload(filename, True, chunk_size=chunk_size, progress=_log_progress)
     print(app_id)
 
 
@@ -96,7 +126,7 @@ def publish(client_id, client_secret, refresh_token, app_id, target):
     logger.debug("app_id: {}".format(app_id))
     logger.debug("target: {}".format(target))
 
-    store = chrome_store.ChromeStore(client_id, client_secret, refresh_token, app_id=app_id)
+    store = _new_store(client_id, client_secret, refresh_token, app_id=app_id)
     if target == 'public':
         target = chrome_store.ChromeStore.TARGET_PUBLIC
     elif target == 'trusted':
@@ -107,6 +137,79 @@ def publish(client_id, client_secret, refresh_token, app_id, target):
     store.publish(target)
 
 
+bulk_options = [
+    click.argument('client_id', required=True),
+    click.argument('client_secret', required=True),
+    click.argument('refresh_token', required=True),
+    click.argument('jobs_file', required=True),
+    click.option('-j', '--jobs', 'concurrency', type=int, default=DEFAULT_CONCURRENCY,
+                 help="Number of items processed at the same time."),
+    click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True),
+                 help="Write the JSON summary into this file instead of the standard output."),
+]
+
+
+def _run_bulk(client_id, client_secret, refresh_token, concurrency, output, operation, *args):
+    """ Run a bulk operation, print its summary and exit with an error if any job failed. """
+    obj = click.get_current_context().obj or {}
+    store = AsyncChromeStore(client_id, client_secret, refresh_token, concurrency=concurrency,
+                             token_store=obj.get('token_store'), ledger=obj.get('ledger'))
+
+    loop = asyncio.new_event_loop()
+    try:
+        results = loop.run_until_complete(operation(store, *args))
+    finally:
+        loop.close()
+        store.close()
+
+    summary = bulk.summarize(results)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+    logger.info("{} succeeded, {} failed".format(summary['succeeded'], summary['failed']))
+    if summary['failed']:
+        exit(constants.ErrorCodes.bulk_job_failed)
+
+
+def _load_jobs(jobs_file, **requirements):
+    try:
+        jobs = bulk.read_jobs(jobs_file)
+        bulk.validate_jobs(jobs, **requirements)
+    except (OSError, bulk.InvalidJobError) as error:
+        logger.error(error)
+        exit(constants.ErrorCodes.bulk_invalid_jobs)
+    return jobs
+
+
+@chrome.command('upload-many', short_help="upload new versions of many extensions listed in a file.")
+@util.custom_options(bulk_options)
+@chunk_size_option
+@force_option
+def upload_many(client_id, client_secret, refresh_token, jobs_file, concurrency, output, chunk_size, force):
+    jobs = _load_jobs(jobs_file, require_file=True)
+    _run_bulk(client_id, client_secret, refresh_token, concurrency, output, bulk.upload_many, jobs, chunk_size,
+              force)
+
+
+@chrome.command('publish-many', short_help="publish many extensions listed in a file.")
+@util.custom_options(bulk_options)
+@click.option('--target', type=click.Choice(sorted(bulk.TARGETS)),
+              help="Target of jobs that do not specify their own.")
+def publish_many(client_id, client_secret, refresh_token, jobs_file, concurrency, output, target):
+    jobs = _load_jobs(jobs_file)
+    for job in jobs:
+        job['target'] = job['target'] or target or ''
+    try:
+        bulk.validate_jobs(jobs, require_target=True)
+    except bulk.InvalidJobError as error:
+        logger.error(error)
+        exit(constants.ErrorCodes.bulk_invalid_jobs)
+    _run_bulk(client_id, client_secret, refresh_token, concurrency, output, bulk.publish_many, jobs)
+
+
 @chrome.command('repack', short_help="create a zip from .crx archive")
 @click.argument('filename', required=True)
 def repack(filename):
@@ -0,0 +1,87 @@
+import threading
+import time
+
+from webstore_manager import logging_helper
+
+logger = logging_helper.get_logger(__file__)
+
+# Tokens are refreshed this many seconds before they expire, so that they do not expire during a request.
+DEFAULT_REFRESH_MARGIN = 60
+
+
+class AccessTokenCache:
+    """
+    Thread-safe in-memory cache of OAuth access tokens.
+
+    Tokens are cached under a key (e.g. client ID and refresh token) until shortly before they expire. When several
+    threads need a token that is missing or expired, only one of them obtains a new one while the others wait for it.
+    The cache may be shared by several ChromeStore objects.
+    """
+
+    def __init__(self, refresh_margin=DEFAULT_REFRESH_MARGIN, clock=time.monotonic):
+        """
+        Args:
+            refresh_margin(int, optional): Number of seconds before expiry when a token is considered expired.
+            clock(function, optional): Source of current time in seconds.
+        """
+        super().__init__()
+        self.refresh_margin = refresh_margin
+        self.clock = clock
+        self._tokens = {}  # key -> (access token, expiry time)
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get(self, key, fetch):
+        """
+        Get a valid access token, obtaining a new one if there is none cached or it is about to expire.
+
+        Args:
+            key(hashable): Identification of the token.
+            fetch(function): Called without arguments to obtain a new token. Returns a tuple
+                             (access token, number of seconds it expires in).
+
+        Returns:
+            str: Access token.
+        """
+        token = self._lookup(key)
+        if token:
+            return token
+
+        with self._key_lock(key):
+            token = self._lookup(key)  # another thread may have refreshed it while this one waited
+            if token:
+                return token
+
+            token, expires_in = fetch()
+            with self._lock:
+                self._tokens[key] = token, self.clock() + expires_in
+            logger.debug("Cached access token for {} seconds".format(expires_in))
+            return token
+
+    def invalidate(self, key):
+        """
+        Drop a cached token, e.g. when the server rejected it.
+
+        Args:
+            key(hashable): Identification of the token.
+
+        Returns:
+            None
+        """
+        with self._lock:
+            self._tokens.pop(key, None)
+
+    def _lookup(self, key):
+        with self._lock:
+            try:
+                token, expires_at = self._tokens[key]
+            except KeyError:
+                return None
+
+        if self.clock() < expires_at - self.refresh_margin:
+            return token
+        return None
+
+    def _key_lock(self, key):
+        with self._lock:
+            return self._locks.setdefault(key, threading.Lock())
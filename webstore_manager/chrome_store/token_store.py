@@ -0,0 +1,128 @@
+import hashlib
+import hmac
+import json
+import os
+import tempfile
+import time
+
+import appdirs
+
+from webstore_manager import logging_helper, util
+from webstore_manager.chrome_store.token_cache import DEFAULT_REFRESH_MARGIN
+
+logger = logging_helper.get_logger(__file__)
+
+default_token_dir = os.path.join(appdirs.user_cache_dir("webstore_manager", "melkamar"), "tokens")
+
+
+class PersistentTokenStore:
+    """
+    On-disk store of OAuth access tokens, shared by all processes of the user.
+
+    Tokens are stored in plain text under a hash of the client ID and the refresh token. They are not encrypted, they
+    are only protected by file permissions: the folder is accessible by the user only (0700) and so are the entries
+    (0600). Encryption was left out on purpose - its key would have to come from the credentials, which whoever can
+    read the cache usually has as well, and the standard library offers no vetted cipher to do it with. Every entry
+    contains an HMAC of the credentials keyed by the client secret, so a token is never handed out to someone using
+    a different secret.
+    Access to an entry is serialized by a lock file, so when several processes need a new token at the same time,
+    only one of them exchanges the refresh token and the others reuse its result.
+    """
+
+    def __init__(self, directory=None, refresh_margin=DEFAULT_REFRESH_MARGIN):
+        """
+        Args:
+            directory(str, optional): Folder to store tokens in. Defaults to a folder in the user cache dir.
+            refresh_margin(int, optional): Number of seconds before expiry when a stored token is not reused anymore.
+        """
+        super().__init__()
+        self.directory = directory or default_token_dir
+        self.refresh_margin = refresh_margin
+
+    def get(self, client_id, client_secret, refresh_token, fetch):
+        """
+        Get a stored access token, or obtain and store a new one if there is none or it is about to expire.
+
+        Args:
+            client_id(str): Client ID of the OAuth credentials.
+            client_secret(str): Client secret of the OAuth credentials.
+            refresh_token(str): Refresh token the access token is obtained from.
+            fetch(function): Called without arguments to obtain a new token. Returns a tuple
+                             (access token, number of seconds it expires in).
+
+        Returns:
+            str, int: Access token and number of seconds it expires in.
+        """
+        os.makedirs(self.directory, mode=0o700, exist_ok=True)
+        os.chmod(self.directory, 0o700)
+        entry = self._entry_path(client_id, refresh_token)
+
+        with util.locked_file(entry + '.lock'):
+            stored = self._read(entry, _credentials_mac(client_id, client_secret, refresh_token))
+            now = time.time()
+            if stored and stored['expires_at'] - self.refresh_margin > now:
+                logger.debug("Reusing stored access token")
+                return stored['access_token'], int(stored['expires_at'] - now)
+
+            access_token, expires_in = fetch()
+            self._write(entry, {'access_token': access_token,
+                                'expires_at': now + expires_in,
+                                'credentials': _credentials_mac(client_id, client_secret, refresh_token)})
+            return access_token, expires_in
+
+    def invalidate(self, client_id, refresh_token):
+        """
+        Remove a stored token, e.g. when the server rejected it.
+
+        Args:
+            client_id(str): Client ID of the OAuth credentials.
+            refresh_token(str): Refresh token the access token was obtained from.
+
+        Returns:
+            None
+        """
+        try:
+            os.remove(self._entry_path(client_id, refresh_token))
+        except FileNotFoundError:
+            pass
+
+    def _entry_path(self, client_id, refresh_token):
+        digest = hashlib.sha256('{}\0{}'.format(client_id, refresh_token).encode()).hexdigest()
+        return os.path.join(self.directory, digest + '.token')
+
+    @staticmethod
+    def _read(entry, credentials):
+        try:
+            with open(entry, 'r') as f:
+                stored = json.load(f)
+            stored['expires_at'] = float(stored['expires_at'])
+            matches = hmac.compare_digest(stored['credentials'], credentials)
+        except FileNotFoundError:
+            return None
+        except (ValueError, KeyError, TypeError):
+            logger.warning("Stored access token {} is corrupted, ignoring it.".format(entry))
+            return None
+
+        if not matches:
+            logger.debug("Stored access token belongs to a different client secret, ignoring it.")
+            return None
+        return stored
+
+    def _write(self, entry, token):
+        data = json.dumps(token).encode()
+
+        # mkstemp creates the file readable and writable by the user only.
+        handle, temp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                f.write(data)
+            os.replace(temp_name, entry)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+
+def _credentials_mac(client_id, client_secret, refresh_token):
+    """ Fingerprint of the credentials, which cannot be computed without the client secret. """
+    message = '{}\0{}'.format(client_id, refresh_token).encode()
+    return hmac.new(client_secret.encode(), message, hashlib.sha256).hexdigest()
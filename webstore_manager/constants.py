@@ -13,3 +13,5 @@ class ErrorCodes:
     chrome_publish_bad_target = 8
     chrome_publish_bad_status = 9
     response_not_json = 10
+    bulk_job_failed = 11
+    bulk_invalid_jobs = 12
@@ -0,0 +1,197 @@
+import heapq
+import queue
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from webstore_manager import logging_helper, polling
+from webstore_manager.firefox_store.firefox_store import NotProcessedError
+
+logger = logging_helper.get_logger(__file__)
+
+DEFAULT_WORKERS = 4
+# Seconds an addon may take to be validated and signed after its upload.
+DEFAULT_TIMEOUT = 600
+# Status of an addon is polled after FIRST_POLL_INTERVAL seconds, then in intervals growing up to DEFAULT_INTERVAL.
+DEFAULT_INTERVAL = 30
+FIRST_POLL_INTERVAL = 5
+
+_UPLOADING, _SIGNING, _DOWNLOADING, _DONE = 'uploading', 'signing', 'downloading', 'done'
+
+
+class _Job:
+    """ Progress of a single addon through the pipeline. """
+
+    def __init__(self, number, filename, clock):
+        self.number = number
+        self.stage = _UPLOADING
+        self.start = clock()
+        self.deadline = None
+        self.intervals = None
+        self.result = {'file': filename, 'addon_id': None, 'version': None, 'status': 'success', 'error': None,
+                       'error_code': None}
+
+
+class SignBatch:
+    """
+    Pipeline signing many addons at once.
+
+    Every addon goes through three stages: upload, waiting for the store to validate and sign it, and download of the
+    signed files. Uploads and downloads run on thread pools, so one addon is uploaded while others are still being
+    signed. Status of all addons waiting for signing is polled by a single scheduler, each addon in its own growing
+    intervals (see polling.Backoff), so the whole batch takes about as long as the slowest addon instead of the sum
+    of all of them.
+
+    A failure of one addon does not stop the others, it is recorded in its result.
+    """
+
+    def __init__(self, store, folder="", workers=DEFAULT_WORKERS, timeout=DEFAULT_TIMEOUT, interval=DEFAULT_INTERVAL,
+                 first_interval=FIRST_POLL_INTERVAL, force=False, clock=time.monotonic):
+        """
+        Args:
+            store(FFStore): Store to use. Its session should have a connection pool big enough for the workers.
+            folder(str, optional): Folder to download signed files into. Defaults to the current working directory.
+            workers(int, optional): Maximum number of uploads, and separately of downloads, running at the same time.
+            timeout(float, optional): Seconds an addon may take to be signed after its upload.
+            interval(float, optional): Longest interval between status polls of an addon, in seconds.
+            first_interval(float, optional): Interval between the upload and the first status poll, in seconds.
+            force(bool, optional): Upload even if the store's ledger says a file was uploaded already.
+            clock(function, optional): Source of current time in seconds.
+        """
+        super().__init__()
+        self.store = store
+        self.folder = folder
+        self.workers = workers
+        self.timeout = timeout
+        self.interval = interval
+        self.first_interval = min(first_interval, interval)
+        self.force = force
+        self.clock = clock
+
+    def run(self, filenames):
+        """
+        Sign addons and download the signed files.
+
+        Args:
+            filenames(:obj:`list` of :obj:`str`): Files to sign. ID and version of every addon are parsed from its
+                                                 manifest.
+
+        Returns:
+            :obj:`list` of :obj:`dict`: Result of every file, in the order of filenames. See summarize.
+        """
+        jobs = [_Job(number, filename, self.clock) for number, filename in enumerate(filenames)]
+        events = queue.Queue()  # jobs whose upload or download finished
+        polls = []  # heap of (time of the next poll, job number)
+
+        with ThreadPoolExecutor(max_workers=self.workers) as uploads, \
+                ThreadPoolExecutor(max_workers=self.workers) as downloads:
+            for job in jobs:
+                uploads.submit(self._in_worker, events, job, self._upload, job)
+
+            remaining = len(jobs)
+            while remaining:
+                wait = max(0, polls[0][0] - self.clock()) if polls else None
+                try:
+                    job = events.get(timeout=wait)
+                except queue.Empty:
+                    pass
+                else:
+                    if job.stage == _UPLOADING:
+                        job.stage = _SIGNING
+                        job.deadline = self.clock() + self.timeout
+                        job.intervals = polling.Backoff(self.first_interval, self.interval).intervals()
+                        self._schedule(polls, job)
+                    else:
+                        self._finish(job)
+                        remaining -= 1
+
+                while polls and polls[0][0] <= self.clock():
+                    job = jobs[heapq.heappop(polls)[1]]
+                    urls, hashes = self._poll(job)
+                    if urls:
+                        job.stage = _DOWNLOADING
+                        downloads.submit(self._in_worker, events, job, self.store.download_files, urls, hashes,
+                                         self.folder)
+                        continue
+                    if job.stage != _DONE and self.clock() >= job.deadline:
+                        self._fail(job, NotProcessedError("Addon was not processed in {} seconds.".format(
+                            self.timeout)))
+                    if job.stage == _DONE:
+                        self._finish(job)
+                        remaining -= 1
+                    else:
+                        self._schedule(polls, job)
+
+        return [job.result for job in jobs]
+
+    def _upload(self, job):
+        addon_id, version = self.store.parse_manifest(job.result['file'])
+        job.result.update(addon_id=addon_id, version=version)
+        if not self.store.upload(job.result['file'], addon_id, version, force=self.force):
+            raise ValueError("File {} could not be uploaded.".format(job.result['file']))
+        logger.info("{} {} uploaded, waiting for signing".format(addon_id, version))
+
+    def _poll(self, job):
+        """ Poll status of a job. Returns URLs and hashes of signed files, if they are ready. """
+        try:
+            processed, urls, validation_results, hashes = self.store._get_addon_status(job.result['addon_id'],
+                                                                                      job.result['version'])
+            self.store._check_validation(validation_results)
+        except (Exception, SystemExit) as error:
+            self._fail(job, error)
+            return None, None
+
+        # The store may report an addon as processed before listing its files.
+        if processed and urls:
+            logger.info("{} {} signed, downloading".format(job.result['addon_id'], job.result['version']))
+            return urls, hashes
+        return None, None
+
+    def _schedule(self, polls, job):
+        heapq.heappush(polls, (min(self.clock() + next(job.intervals), job.deadline), job.number))
+
+    def _in_worker(self, events, job, func, *args):
+        """ Run a stage of a job on a worker thread and report its end. """
+        try:
+            func(*args)
+        except (Exception, SystemExit) as error:
+            self._fail(job, error)
+        events.put(job)
+
+    @staticmethod
+    def _fail(job, error):
+        if isinstance(error, SystemExit):
+            job.result.update(error="Store operation failed with error code {}.".format(error.code),
+                              error_code=error.code)
+        else:
+            job.result['error'] = "{}: {}".format(type(error).__name__, error)
+        job.result['status'] = 'failure'
+        job.stage = _DONE
+
+    def _finish(self, job):
+        job.stage = _DONE
+        job.result['seconds'] = round(self.clock() - job.start, 3)
+        if job.result['status'] == 'failure':
+            logger.error("{} failed: {}".format(job.result['file'], job.result['error']))
+        else:
+            logger.info("{} done".format(job.result['file']))
+
+
+def summarize(results):
+    """
+    Build a machine-readable summary of signing results.
+
+    Every result contains the file, addon_id and version of the addon, status ("success" or "failure"), error message
+    and error_code (ErrorCodes value, if any) of failures, and the duration in seconds.
+
+    Args:
+        results(:obj:`list` of :obj:`dict`): Results as returned by SignBatch.run.
+
+    Returns:
+        dict: Counts of succeeded and failed addons and the list of results.
+    """
+    failed = sum(1 for result in results if result['status'] != 'success')
+    return {
+        'succeeded': len(results) - failed,
+        'failed': failed,
+        'results': results,
+    }
@@ -1,6 +1,10 @@
+import json
+
 import click
-from . import firefox_store
-from webstore_manager import logging_helper
+from . import batch, firefox_store
+from webstore_manager import constants, logging_helper
+from webstore_manager.store.ledger import UploadLedger
+from webstore_manager.store.store import new_session
 from webstore_manager.util import custom_options
 
 logger = logging_helper.get_logger(__file__)
@@ -10,7 +14,9 @@ _upload_options = [
     click.option('--addon-id', 'addon_id', required=False,
                  help="ID of the extension. If not provided, it will be parsed from the file."),
     click.option('--version', required=False,
-                 help="Version of the extension. If not provided, it will be parsed from the file.")
+                 help="Version of the extension. If not provided, it will be parsed from the file."),
+    click.option('--force', is_flag=True,
+                 help="Upload even if the same file was the last one uploaded as this version of the extension."),
 ]
 
 _download_options = [
@@ -41,14 +47,26 @@ def firefox():
     pass
 
 
+def _progress_logger():
+    """ Create an upload progress callback logging every ten percent of the upload. """
+    logged = [-1]
+
+    def log(sent, total):
+        step = sent * 10 // total if total else 10
+        if step > logged[0]:
+            logged[0] = step
+            logger.info("Uploaded {} of {} bytes".format(sent, total))
+    return log
+
+
 @firefox.command('upload', short_help="Upload a xpi extension on Mozilla store.")
 @custom_options(_jwt_options)
 @custom_options(_upload_options)
 @click.pass_context
-def upload(ctx, jwt_issuer, jwt_secret, filename, addon_id, version):
-    store = firefox_store.FFStore(jwt_issuer, jwt_secret)
+def upload(ctx, jwt_issuer, jwt_secret, filename, addon_id, version, force):
+    store = firefox_store.FFStore(jwt_issuer, jwt_secret, ledger=UploadLedger())
 
-    store.upload(filename, addon_id, version)
+    store.upload(filename, addon_id, version, force=force, progress=_progress_logger())
 
 
 @firefox.command('download', short_help="Download a xpi extension on Mozilla store.")
@@ -67,8 +85,8 @@ def download(ctx, jwt_issuer, jwt_secret, addon_id, version, interval, attempts,
 @custom_options(_upload_options)
 @custom_options(_download_options)
 @click.pass_context
-def sign(ctx, jwt_issuer, jwt_secret, addon_id, version, filename, interval, attempts, folder, target_name):
-    store = firefox_store.FFStore(jwt_issuer, jwt_secret)
+def sign(ctx, jwt_issuer, jwt_secret, addon_id, version, filename, force, interval, attempts, folder, target_name):
+    store = firefox_store.FFStore(jwt_issuer, jwt_secret, ledger=UploadLedger())
 
     if not addon_id or not version:
         parsed_id, parsed_version = store.parse_manifest(filename)
@@ -77,10 +95,43 @@ def sign(ctx, jwt_issuer, jwt_secret, addon_id, version, filename, interval, att
         if not version:
             version = parsed_version
 
-    store.upload(filename, addon_id, version)
+    store.upload(filename, addon_id, version, force=force, progress=_progress_logger())
     store.download(addon_id, version, folder, attempts, interval, target_name=target_name)
 
 
+@firefox.command('sign-batch', short_help="Sign many xpi extensions on Mozilla store and download the signed files.")
+@custom_options(_jwt_options)
+@click.argument('filenames', nargs=-1, required=True)
+@click.option('--folder', help="Target folder for the downloads.")
+@click.option('--timeout', type=float, default=batch.DEFAULT_TIMEOUT,
+              help="Seconds every extension may take to be signed after its upload.")
+@click.option('--interval', type=float, default=batch.DEFAULT_INTERVAL,
+              help="Longest interval in seconds between polls of the status of an extension.")
+@click.option('-j', '--jobs', 'workers', type=int, default=batch.DEFAULT_WORKERS,
+              help="Number of uploads, and of downloads, running at the same time.")
+@click.option('-o', '--output', type=click.Path(dir_okay=False, writable=True),
+              help="Write the JSON summary into this file instead of the standard output.")
+@click.option('--force', is_flag=True, help="Upload even files which were the last ones uploaded already.")
+@click.pass_context
+def sign_batch(ctx, jwt_issuer, jwt_secret, filenames, folder, timeout, interval, workers, output, force):
+    session = new_session(pool_size=workers * (firefox_store.DOWNLOAD_WORKERS + 1))
+    store = firefox_store.FFStore(jwt_issuer, jwt_secret, session=session, ledger=UploadLedger())
+
+    results = batch.SignBatch(store, folder, workers=workers, timeout=timeout, interval=interval,
+                              force=force).run(filenames)
+
+    summary = batch.summarize(results)
+    if output:
+        with open(output, 'w') as f:
+            json.dump(summary, f, indent=2)
+    else:
+        print(json.dumps(summary, indent=2))
+
+    logger.info("{} succeeded, {} failed".format(summary['succeeded'], summary['failed']))
+    if summary['failed']:
+        exit(constants.ErrorCodes.bulk_job_failed)
+
+
 @firefox.command('gen-token', short_help="Generate a JWT token used to authenticate in Mozilla store.")
 @custom_options(_jwt_options)
 @click.pass_context
@@ -1,34 +1,137 @@
+import collections
+import hashlib
+import json
+import logging
+import mmap
 import os
 import random
+import threading
 import time
 import urllib.parse
-import json
-from pprint import pformat
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
 
 import jwt
 import requests
 
 from webstore_manager import logging_helper, util
+from webstore_manager.store.ledger import file_digest
+from webstore_manager.store.multipart import MultipartEncoder
 from webstore_manager.store.store import Store
 
 logger = logging_helper.get_logger(__file__)
 
+# Parsed (id, version) of archives on disk, see FFStore.parse_manifest. Least recently used entries are dropped once
+# there are more than MANIFEST_CACHE_SIZE.
+MANIFEST_CACHE_SIZE = 256
+_manifest_cache = collections.OrderedDict()
+_manifest_cache_lock = threading.Lock()
+
+# Maximum number of files of an addon downloaded at the same time.
+DOWNLOAD_WORKERS = 4
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+# Number of times an interrupted download is resumed before giving up.
+DOWNLOAD_RETRIES = 3
+# Suffix of files being downloaded. They are renamed to their final name once complete and verified.
+PARTIAL_SUFFIX = '.part'
+
+
+class ValidationMessage:
+    """ A single message of the addon validator. Only the fields needed for reports are kept. """
+
+    __slots__ = ('type', 'id', 'message', 'description', 'file', 'line', 'column')
+
+    def __init__(self, type, id=None, message=None, description=None, file=None, line=None, column=None):
+        """
+        Args:
+            type(str): Type of the message - "error", "warning" or "notice".
+            id(str, optional): Identifier of the check, e.g. "UNSAFE_VAR_ASSIGNMENT".
+            message(str, optional): Short message.
+            description(str, optional): Longer explanation.
+            file(str, optional): File of the addon the message concerns.
+            line(int, optional): Line in the file.
+            column(int, optional): Column in the line.
+        """
+        self.type = type
+        self.id = id
+        self.message = message
+        self.description = description
+        self.file = file
+        self.line = line
+        self.column = column
+
+    @classmethod
+    def from_json(cls, message):
+        """
+        Args:
+            message(dict): Message as obtained from Mozilla. Unknown fields are dropped.
+
+        Returns:
+            ValidationMessage: The message.
+        """
+        description = message.get('description')
+        if isinstance(description, list):
+            description = ' '.join(description)
+        identifier = message.get('id')
+        if isinstance(identifier, list):
+            identifier = '/'.join(identifier)
+        return cls(message.get('type'), identifier, message.get('message'), description, message.get('file'),
+                   message.get('line'), message.get('column'))
+
+    def render(self):
+        location = ':'.join(str(part) for part in (self.file, self.line, self.column) if part is not None)
+        lines = ['[{}] {}'.format(self.id, self.message)]
+        if location:
+            lines.append('    at {}'.format(location))
+        if self.description:
+            lines.append('    {}'.format(self.description))
+        return '\n'.join(lines)
+
 
 class ValidationResults:
+    """
+    Results of validation of an addon. Messages are indexed by their type when the results are created, and the
+    report is only rendered (once) when it is logged at an enabled level.
+    """
+
+    __slots__ = ('success', 'errors', 'warnings', 'messages', '_by_type', '_report')
+
     def __init__(self, success, errors, warnings, messages):
         """
 
         Args:
             success: boolean
-            messages: List of JSON as obtained from mozilla.
+            errors(int): Number of errors.
+            warnings(int): Number of warnings.
+            messages: List of JSON as obtained from mozilla, or of ValidationMessage objects.
         """
         self.warnings = warnings
         self.errors = errors
-        self.messages = messages
         self.success = success
+        self.messages = tuple(message if isinstance(message, ValidationMessage) else
+                              ValidationMessage.from_json(message) for message in messages)
+        self._report = None
+
+        self._by_type = {}
+        for message in self.messages:
+            self._by_type.setdefault(message.type, []).append(message)
+
+    def of_type(self, *types):
+        """
+        Args:
+            *types(str): Message types, e.g. "error".
+
+        Returns:
+            :obj:`list` of :obj:`ValidationMessage`: Messages of the given types, in their original order within
+                                                      a type.
+        """
+        return [message for message_type in types for message in self._by_type.get(message_type, ())]
 
     def print(self):
-        return """Errors: {errors}
+        if self._report is None:
+            other_types = [message_type for message_type in self._by_type if message_type not in ('error', 'warning')]
+            self._report = """Errors: {errors}
 Warnings: {warnings}
 
 ---------------------
@@ -44,10 +147,25 @@ Warnings: {warnings}
 {other_messages}
 """.format(errors=self.errors,
            warnings=self.warnings,
-           error_messages="\n".join(pformat(msg) for msg in self.messages if msg['type'] == 'error'),
-           warning_messages="\n".join(pformat(msg) for msg in self.messages if msg['type'] == 'warning'),
-           other_messages="\n".join(pformat(msg) for msg in self.messages if msg['type'] not in ('error', 'warning')),
+           error_messages="\n".join(message.render() for message in self.of_type('error')),
+           warning_messages="\n".join(message.render() for message in self.of_type('warning')),
+           other_messages="\n".join(message.render() for message in self.of_type(*other_types)),
            )
+        return self._report
+
+    def log(self, log, level):
+        """
+        Log the report, rendering it only if the level is enabled.
+
+        Args:
+            log(logging.Logger): Logger to use.
+            level(int): Logging level.
+
+        Returns:
+            None
+        """
+        if log.isEnabledFor(level):
+            log.log(level, self.print())
 
     @staticmethod
     def parse_from_json(json_str):
@@ -61,6 +179,26 @@ Warnings: {warnings}
         return ValidationResults(success, errors, warnings, messages)
 
 
+class _MappedFile:
+    """ Minimal read-only file object over a memory-mapped file, as required by zipfile. """
+
+    def __init__(self, data):
+        self.data = data
+
+    def read(self, size=-1):
+        return self.data.read(size)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.data.seek(offset, whence)
+        return self.data.tell()
+
+    def tell(self):
+        return self.data.tell()
+
+    def seekable(self):
+        return True
+
+
 class NotProcessedError(Exception):
     """Raised if the extension is not signed and attempts timed out."""
 
@@ -69,6 +207,10 @@ class ValidationFailedError(Exception):
     """Raised when FF validation fails."""
 
 
+class DownloadVerificationError(Exception):
+    """Raised when a downloaded file does not match the hash reported by the store."""
+
+
 class FFStore(Store):
     """
     Class representing Mozilla Add-on store.
@@ -76,16 +218,22 @@ class FFStore(Store):
     Provides methods for interacting with it - authenticating and signing extensions.
     """
 
-    def __init__(self, jwt_issuer, jwt_secret, session=None):
+    # Name of the store in the upload ledger.
+    LEDGER_NAME = 'firefox'
+
+    def __init__(self, jwt_issuer, jwt_secret, session=None, ledger=None):
         """
         Args:
             jwt_issuer(str): JWT Issuer field obtained in Mozilla's Addon Developer Hub from Manage API keys section.
             jwt_secret(str): JWT Secret field obtained in Mozilla's Addon Developer Hub from Manage API keys section.
             session: If none, a new requests session will be created. Otherwise the supplied one will be used.
+            ledger(UploadLedger, optional): If set, completed uploads are recorded in it and uploading the same archive
+                                            again is skipped.
         """
         super().__init__(session)
         self.jwt_issuer = jwt_issuer
         self.jwt_secret = jwt_secret
+        self.ledger = ledger
 
     def _gen_auth_headers(self):
         """
@@ -123,8 +271,13 @@ class FFStore(Store):
         """
         Parse extension ID and version from a zipped extension archive.
 
+        Only the manifest.json entry is read from the archive, nothing is extracted. Files on disk are memory-mapped
+        where possible. Results for files on disk are cached (keyed by path, size and mtime), so repeated calls for
+        the same archive do not read it again. File objects are not cached, telling whether their content changed
+        would cost more than reading the manifest.
+
         Args:
-            filename(str): Name of the WebExtension archive.
+            filename(str or file): Name of the WebExtension archive or an opened binary file object containing it.
 
         Returns:
             tuple: (id, version)
@@ -132,23 +285,53 @@ class FFStore(Store):
         Raises:
             KeyError: if ID or Version cannot be parsed from the file.
         """
+        key = None if util.is_file_object(filename) else FFStore._manifest_cache_key(filename)
+        if key is not None:
+            with _manifest_cache_lock:
+                if key in _manifest_cache:
+                    _manifest_cache.move_to_end(key)
+                    return _manifest_cache[key]
 
-        temp_dir = os.path.join(util.build_dir, os.path.basename(filename))
+        with FFStore._map_archive(filename) as data, zipfile.ZipFile(data) as archive:
+            manifest_json = json.loads(archive.read('manifest.json').decode('utf-8-sig'))
 
-        # Extract archive
-        util.unzip(filename, temp_dir)
+        try:
+            result = manifest_json['applications']['gecko']['id'], manifest_json['version']
+        except KeyError as err:
+            raise KeyError('Could not find applications.gecko.id and/or version keys in the manifest.json file.') \
+                from err
+
+        if key is not None:
+            with _manifest_cache_lock:
+                _manifest_cache[key] = result
+                while len(_manifest_cache) > MANIFEST_CACHE_SIZE:
+                    _manifest_cache.popitem(last=False)
+        return result
+
+    @staticmethod
+    def _manifest_cache_key(filename):
+        stat = os.stat(filename)
+        return os.path.realpath(filename), stat.st_size, stat.st_mtime_ns
+
+    @staticmethod
+    @contextmanager
+    def _map_archive(filename):
+        """ Memory-map an archive on disk if possible. File objects and unmappable files are yielded as opened. """
+        with util.open_archive(filename) as f:
+            if util.is_file_object(filename):  # might be in memory, do not force it to disk by asking for fileno
+                yield f
+                return
 
-        # Read manifest.json manifest and parse
-        with open(os.path.join(temp_dir, "manifest.json")) as f:
-            manifest_json = json.load(f)
-            # ID
             try:
-                id = manifest_json['applications']['gecko']['id']
-                version = manifest_json['version']
-                return id, version
-            except KeyError as err:
-                raise KeyError('Could not find applications.gecko.id and/or version keys in the manifest.json file.') \
-                    from err
+                data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):  # e.g. empty files cannot be mapped
+                yield f
+                return
+
+            try:
+                yield _MappedFile(data)
+            finally:
+                data.close()
 
     def _get_addon_status(self, addon_id, addon_version):
         """
@@ -165,39 +348,48 @@ class FFStore(Store):
                urls(:obj:`list` of :obj:`str`): list of URLs from which to download the files associated with the
                                                 extension. Will be empty if processed is False.
                validation_results:               of validation messages in format:
+               hashes(:obj:`list` of :obj:`str`): hashes of the files as reported by the store (e.g. "sha256:<hex>"),
+                                                in the order of urls. None where no hash was reported.
 
         """
         url = 'https://addons.mozilla.org/api/v3/addons/{}/versions/{}/'.format(addon_id, addon_version)
 
         headers = self._gen_auth_headers()
-        response = requests.get(url,
-                                headers=headers)
+        response = self.session.get(url,
+                                    headers=headers)
 
         try:
             util.handle_requests_response_status(response)
         except requests.HTTPError:
             exit(3)
 
-        logger.debug('Addon status json: {}'.format(response.json()))
+        # Responses of addons with many validation messages are big, parse and format them only once.
+        data = response.json()
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug('Addon status json: {}'.format(data))
         try:
-            validation_results = ValidationResults.parse_from_json(response.json()['validation_results'])
+            validation_results = ValidationResults.parse_from_json(data['validation_results'])
         except KeyError:
             validation_results = None
 
-        processed = util.read_json_key(response.json(), 'processed')
+        processed = util.read_json_key(data, 'processed')
 
         urls = []
+        hashes = []
         if processed:
-            files = util.read_json_key(response.json(), 'files')
+            files = util.read_json_key(data, 'files')
             urls = [util.read_json_key(file, 'download_url') for file in files]
+            hashes = [file.get('hash') for file in files]
 
-        return processed, urls, validation_results
+        return processed, urls, validation_results, hashes
 
     def download(self, addon_id, addon_version, folder="", attempts=1, interval=10, target_name=""):
         """
         Downloads an extension from the store. In case the extension is not processed (signed etc.) yet,
         the store will be polled several times to try and download it.
 
+        Files are streamed to disk and verified against the hashes reported by the store, see _download_file.
+
         Args:
             addon_id(str): ID of the addon as specified in its install.rdf manifest under <em:id>.
             addon_version(str): Version of the addon as specified in its install.rdf manifest under <em:version>.
@@ -207,6 +399,9 @@ class FFStore(Store):
 
         Returns:
             bool: True if extension was downloaded correctly, False otherwise.
+
+        Raises:
+            DownloadVerificationError: if a downloaded file does not match its hash.
         """
         logger.info(
             "Downloading extension. ID: {}, version: {}. Polling every {} seconds up to {} times.".format(addon_id,
@@ -216,18 +411,11 @@ class FFStore(Store):
 
         processed = False
         urls = []
+        hashes = []
         for attempt_nr in range(0, attempts):
-            processed, urls, validation_results = self._get_addon_status(addon_id, addon_version)
-
-            if validation_results is not None:
-                if not validation_results.success:
-                    logger.error('Validation ended with errors!')
-                    logger.error(validation_results.print())
-                    raise ValidationFailedError
-                else:
-                    if validation_results.warnings or validation_results.errors:
-                        logger.warning('Validation succeeded but with warnings!')
-                        logger.warning(validation_results.print())
+            processed, urls, validation_results, hashes = self._get_addon_status(addon_id, addon_version)
+
+            self._check_validation(validation_results)
 
             # Check both processed flag and if urls is not empty.
             # FF store may sometimes return processed=True but empty URL list, which is only filled up at the next call.
@@ -247,6 +435,50 @@ class FFStore(Store):
         else:
             logger.debug("Addon processed, proceed with download. Obtained URLs: {}".format(urls))
 
+        return self.download_files(urls, hashes, folder, target_name)
+
+    @staticmethod
+    def _check_validation(validation_results):
+        """
+        Log results of validation of an addon, if there are any.
+
+        Args:
+            validation_results(ValidationResults): Results, may be None.
+
+        Returns:
+            None
+
+        Raises:
+            ValidationFailedError: if the validation failed.
+        """
+        if validation_results is not None:
+            if not validation_results.success:
+                logger.error('Validation ended with errors!')
+                validation_results.log(logger, logging.ERROR)
+                raise ValidationFailedError("Validation ended with errors.")
+            else:
+                if validation_results.warnings or validation_results.errors:
+                    logger.warning('Validation succeeded but with warnings!')
+                    validation_results.log(logger, logging.WARNING)
+
+    def download_files(self, urls, hashes=None, folder="", target_name=""):
+        """
+        Download signed files of a processed addon, concurrently. See _download_file.
+
+        Args:
+            urls(:obj:`list` of :obj:`str`): URLs of the files.
+            hashes(:obj:`list` of :obj:`str`, optional): Hashes of the files reported by the store, in the order of
+                                                       urls.
+            folder(str, optional): Destination folder. Defaults to the current working directory.
+            target_name(str, optional): Name to save the file as, if there is a single one.
+
+        Returns:
+            bool: True if the files were downloaded.
+
+        Raises:
+            DownloadVerificationError: if a downloaded file does not match its hash.
+        """
+        hashes = hashes or [None] * len(urls)
         if not folder:
             folder = os.getcwd()
 
@@ -254,40 +486,137 @@ class FFStore(Store):
         if not os.path.exists(folder):
             os.makedirs(folder, exist_ok=True)
 
-        headers = self._gen_auth_headers()
-        for url in urls:
-            logger.debug("Downloading file from url: {}".format(url))
-            response = requests.get(url,
-                                    headers=headers)
-
-            if len(urls) == 1 and target_name:
-                logger.warn("Target name provided and a single file is being downloaded. Ignoring URL name and saving "
-                            "as: {}.".format(target_name))
-                filename = target_name
-            else:
-                filename = os.path.basename(urllib.parse.urlparse(url).path)
+        if len(urls) == 1 and target_name:
+            logger.warn("Target name provided and a single file is being downloaded. Ignoring URL name and saving "
+                        "as: {}.".format(target_name))
+            filenames = [target_name]
+        else:
+            filenames = [os.path.basename(urllib.parse.urlparse(url).path) for url in urls]
 
-            full_path = os.path.join(folder, filename)
-            logger.info("Writing into file {}".format(full_path))
-            with open(full_path, 'wb') as f:
-                f.write(response.content)
+        # Files are downloaded concurrently over the pooled connections of the session.
+        with ThreadPoolExecutor(max_workers=min(len(urls), DOWNLOAD_WORKERS)) as executor:
+            list(executor.map(self._download_file, urls, [os.path.join(folder, name) for name in filenames], hashes))
 
         return True
 
-    def upload(self, filename, addon_id, addon_version):
+    def _download_file(self, url, full_path, expected_hash=None):
+        """
+        Download a single file.
+
+        The file is streamed into full_path + PARTIAL_SUFFIX and hashed on the way. If the connection breaks, the
+        download continues where it stopped using an HTTP Range request, up to DOWNLOAD_RETRIES times. A partial file
+        left behind by a previous attempt is resumed the same way if the store reported a hash of the file, otherwise it
+        is downloaded again. A range response is only used if the server confirms it continues at the requested byte
+        (Content-Range). Only a complete file matching the expected hash is
+        renamed to full_path, so full_path never contains a partial or corrupted file.
+
+        Args:
+            url(str): URL of the file.
+            full_path(str): Path to save the file as.
+            expected_hash(str, optional): Hash reported by the store, as "<algorithm>:<hex digest>".
+
+        Returns:
+            None
+
+        Raises:
+            DownloadVerificationError: if the downloaded file does not match the expected hash.
+        """
+        algorithm, _, expected_digest = (expected_hash or 'sha256:').partition(':')
+        partial_path = full_path + PARTIAL_SUFFIX
+        if not expected_digest and os.path.exists(partial_path):
+            # Without a hash, nothing would tell a file of a different version spliced onto the partial one.
+            logger.debug("Removing partial file {} which cannot be verified".format(partial_path))
+            os.remove(partial_path)
+
+        logger.debug("Downloading file from url: {}".format(url))
+        for attempt in range(DOWNLOAD_RETRIES + 1):
+            try:
+                digest = self._stream_file(url, partial_path, algorithm)
+                break
+            except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as error:
+                if attempt == DOWNLOAD_RETRIES:
+                    raise
+                logger.warning("Download of {} interrupted ({}), resuming.".format(url, error))
+
+        if not expected_digest:
+            logger.warning("Store reported no hash of {}, it is not verified.".format(url))
+        elif digest.hexdigest() != expected_digest.lower():
+            os.remove(partial_path)
+            raise DownloadVerificationError("File downloaded from {} does not match its {} hash {}.".format(
+                url, algorithm, expected_digest))
+
+        logger.info("Writing into file {}".format(full_path))
+        os.replace(partial_path, full_path)
+
+    def _stream_file(self, url, partial_path, algorithm):
+        """
+        Stream a file into a partial file, continuing after its current end if the server supports ranges.
+
+        Returns:
+            hashlib object: Hash of the whole partial file.
+        """
+        try:
+            offset = os.path.getsize(partial_path)
+        except FileNotFoundError:
+            offset = 0
+
+        headers = self._gen_auth_headers()
+        if offset:
+            headers['Range'] = 'bytes={}-'.format(offset)
+
+        digest = hashlib.new(algorithm)
+        with self.session.get(url, headers=headers, stream=True) as response:
+            # 416 to a resumed download means there is nothing left to send, the partial file is complete.
+            resumed = offset and response.status_code in (206, 416)
+            if resumed and not _continues_at(response, offset):
+                logger.warning("Server did not continue download of {} at byte {}, starting over.".format(url, offset))
+                os.remove(partial_path)
+                return self._stream_file(url, partial_path, algorithm)
+
+            if not resumed:
+                try:
+                    response.raise_for_status()
+                except requests.HTTPError as error:
+                    logger.error(error)
+                    exit(3)
+
+            if resumed:
+                logger.debug("Resuming download of {} at byte {}".format(url, offset))
+                with open(partial_path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(DOWNLOAD_CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                if response.status_code == 416:
+                    return digest
+
+            # Without a range response the whole file is sent (a new download, or the server does not support ranges).
+            with open(partial_path, 'ab' if resumed else 'wb') as f:
+                for chunk in response.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    f.write(chunk)
+                    digest.update(chunk)
+        return digest
+
+    def upload(self, filename, addon_id, addon_version, force=False, progress=None):
         """
         Upload a xpi extension to the store and automatically sign it.
 
         Note that the extension will not be signed instantaneously. Some automatic checks are performed and it takes
         a while.
 
+        If the store has an upload ledger and the same archive was the last one uploaded as this version of the addon,
+        nothing is uploaded (unless force is set) - the version is already being signed or signed.
+
+        The archive is streamed from disk as it is sent (see MultipartEncoder), it is never read into memory whole.
+
         Args:
-            filename(str): Filename of the extension on the disk.
+            filename(str or file): Filename of the extension on the disk or an opened binary file object
+                                   containing it (e.g. created by util.make_zip_buffer).
             addon_id(str): ID of the addon as specified in its install.rdf manifest under <em:id>.
             addon_version(str): Version of the addon as specified in its install.rdf manifest under <em:version>.
+            force(bool, optional): Upload even if the ledger says the archive was uploaded already.
+            progress(function, optional): Called as progress(bytes_sent, total_bytes) while uploading.
 
         Returns:
-            bool: True if upload was successful, False otherwise.
+            bool: True if upload was successful (or skipped), False otherwise.
         """
         # If no version was specified, try parsing it from the file.
         if not addon_version:
@@ -301,22 +630,33 @@ class FFStore(Store):
             addon_id = parsed_id
             addon_version = parsed_version
 
-        logger.info("Uploading file {}. ID: {}, version: {}.".format(filename, addon_id, addon_version))
+        upload_name = util.archive_name(filename, default="extension.xpi")
+
+        digest = file_digest(filename) if self.ledger else None
+        if digest and not force and self.ledger.find(self.LEDGER_NAME, addon_id, digest, addon_version):
+            logger.info("File {} was already uploaded as version {} of {}, skipping the upload. "
+                        "Use force to upload it anyway.".format(upload_name, addon_version, addon_id))
+            return True
+
+        logger.info("Uploading file {}. ID: {}, version: {}.".format(upload_name, addon_id, addon_version))
 
         url = 'https://addons.mozilla.org/api/v3/addons/{}/versions/{}/'.format(addon_id, addon_version)
 
         headers = self._gen_auth_headers()
-        files = {'upload': open(filename, 'rb')}
 
-        logger.debug("""
-        URL: {}
-        Headers: {}
-        Files: {}
-        """.format(url, headers, files))
+        with util.open_archive(filename) as data:
+            body = MultipartEncoder({'upload': (upload_name, data)}, progress=progress)
+            headers['Content-Type'] = body.content_type
 
-        response = requests.put(url,
-                                headers=headers,
-                                files=files)
+            logger.debug("""
+            URL: {}
+            Headers: {}
+            File: {} ({} bytes of request body)
+            """.format(url, headers, upload_name, len(body)))
+
+            response = self.session.put(url,
+                                        headers=headers,
+                                        data=body)
 
         try:
             response.raise_for_status()
@@ -325,20 +665,33 @@ class FFStore(Store):
             logger.error("Response: {}".format(response.json()))
             exit(3)
 
+        res_json = response.json()
         try:
             # Check if returned info is what we expect (guid should match the addon ID)
-            res_json = response.json()
             guid = res_json['guid']
             if guid != addon_id:
                 logger.error("Returned guid is not equal to addon ID.")
-                logger.error(response.json())
+                logger.error(res_json)
                 exit(5)
         except KeyError as error:
             logger.error("Key 'guid' not found in returned JSON.")
             logger.error(error)
             exit(4)
 
-        logger.debug("Response json: {}".format(response.json()))
-        logger.info("File {} uploaded for signing.".format(filename))
+        logger.debug("Response json: {}".format(res_json))
+        logger.info("File {} uploaded for signing.".format(upload_name))
 
+        if digest:
+            self.ledger.record(self.LEDGER_NAME, addon_id, addon_version, digest)
         return True
+
+
+def _continues_at(response, offset):
+    """ Check that a range response (206 or 416) continues a download at the given byte, per its Content-Range. """
+    unit, _, content_range = response.headers.get('Content-Range', '').partition(' ')
+    if unit != 'bytes':
+        return False
+    span, _, total = content_range.partition('/')
+    if response.status_code == 416:
+        return span == '*' and total == str(offset)
+    return span.partition('-')[0] == str(offset)
@@ -0,0 +1,194 @@
+import os
+import re
+
+from . import logging_helper
+
+logger = logging_helper.get_logger(__file__)
+
+IGNORE_FILE = '.webstoreignore'
+
+
+class IgnoreMatcher:
+    """
+    Matcher of paths excluded from packaging, using the syntax of .gitignore files.
+
+    Supported are comments, negation (``!``), directory-only patterns (trailing ``/``), patterns anchored to the root
+    folder (leading or middle ``/``), wildcards ``*``, ``?``, ``[...]`` and ``**``. As in git, the last matching pattern
+    decides, and files cannot be re-included if their parent folder is excluded.
+    """
+
+    def __init__(self, lines):
+        """
+        Args:
+            lines(:obj:`list` of :obj:`str`): Lines of an ignore file.
+        """
+        super().__init__()
+        self.patterns = []
+        for line in lines:
+            compiled = self._compile(line)
+            if compiled:
+                self.patterns.append(compiled)
+
+    @classmethod
+    def for_folder(cls, path):
+        """
+        Load the ignore file of a folder.
+
+        Args:
+            path(str): Root folder to be packaged.
+
+        Returns:
+            IgnoreMatcher: Matcher of the folder's ignore file, None if there is no such file.
+        """
+        ignore_file = os.path.join(path, IGNORE_FILE)
+        if not os.path.isfile(ignore_file):
+            return None
+
+        logger.debug("Using ignore file {}".format(ignore_file))
+        with open(ignore_file, encoding='utf-8') as f:
+            return cls(f.read().splitlines())
+
+    def is_ignored(self, relpath, is_dir=False):
+        """
+        Check whether a path is excluded.
+
+        Args:
+            relpath(str): Path relative to the root folder.
+            is_dir(bool, optional): True if the path is a folder.
+
+        Returns:
+            bool: True if the path is excluded from packaging.
+        """
+        relpath = relpath.replace(os.sep, '/')
+        ignored = False
+        for regex, negated, dir_only in self.patterns:
+            if dir_only and not is_dir:
+                continue
+            if regex.match(relpath):
+                ignored = not negated
+        return ignored
+
+    @staticmethod
+    def _compile(line):
+        """ Compile a line of an ignore file into (regex, negated, dir_only), None for blank lines and comments. """
+        line = line.rstrip('\n\r')
+        if not line.endswith('\\ '):
+            line = line.rstrip(' ')
+        if not line or line.startswith('#'):
+            return None
+
+        negated = line.startswith('!')
+        if negated:
+            line = line[1:]
+        elif line.startswith(('\\!', '\\#')):  # escaped leading ! or #, other escapes are handled by _translate
+            line = line[1:]
+
+        dir_only = line.endswith('/')
+        line = line.rstrip('/')
+        anchored = '/' in line
+        line = line.lstrip('/')
+        if not line:
+            return None
+
+        regex = IgnoreMatcher._translate(line)
+        if not anchored:
+            regex = '(?:.*/)?' + regex
+        return re.compile('^' + regex + '$', re.DOTALL), negated, dir_only
+
+    @staticmethod
+    def _translate(pattern):
+        """ Translate a gitignore glob into a regular expression matching paths separated by '/'. """
+        result = []
+        i = 0
+        length = len(pattern)
+        while i < length:
+            char = pattern[i]
+            if pattern.startswith('**/', i):
+                result.append('(?:.*/)?')
+                i += 3
+                continue
+            elif pattern.startswith('**', i):
+                result.append('.*')
+                i += 2
+                continue
+            elif char == '*':
+                result.append('[^/]*')
+            elif char == '?':
+                result.append('[^/]')
+            elif char == '[':
+                end = pattern.find(']', i + 2)
+                if end < 0:
+                    result.append(re.escape(char))
+                else:
+                    content = pattern[i + 1:end]
+                    if content.startswith('!'):
+                        content = '^' + content[1:]
+                    result.append('[' + content.replace('\\', '\\\\') + ']')
+                    i = end
+            elif char == '\\' and i + 1 < length:
+                i += 1
+                result.append(re.escape(pattern[i]))
+            else:
+                result.append(re.escape(char))
+            i += 1
+        return ''.join(result)
+
+
+class IgnoreStats:
+    """
+    Counts of what was left out of packaging by an IgnoreMatcher.
+
+    Excluded folders are not walked, so bytes only count excluded files outside of them.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.files = 0
+        self.bytes = 0
+        self.directories = 0
+
+    def __str__(self):
+        return "{} files ({} bytes) and {} directories (size not measured)".format(self.files, self.bytes,
+                                                                                    self.directories)
+
+
+def walk_files(path, matcher=None, stats=None):
+    """
+    List files under a folder, leaving out those excluded by an ignore matcher.
+
+    Excluded folders are pruned from the walk, so their contents are never listed. Stats count the folders themselves,
+    their size is not measured.
+    The ignore file itself is always excluded.
+
+    Args:
+        path(str): Root folder.
+        matcher(IgnoreMatcher, optional): Matcher to use. Defaults to the folder's own ignore file, if any.
+        stats(IgnoreStats, optional): If set, it is updated with numbers of excluded files, bytes and folders.
+
+    Returns:
+        iterator: (full path, relative path) pairs in os.walk order.
+    """
+    if matcher is None:
+        matcher = IgnoreMatcher.for_folder(path)
+
+    for root, dirs, files in os.walk(path):
+        rel_root = os.path.relpath(root, path)
+        rel_root = '' if rel_root == os.curdir else rel_root
+
+        if matcher:
+            kept = [d for d in dirs if not matcher.is_ignored(os.path.join(rel_root, d), is_dir=True)]
+            if stats:
+                stats.directories += len(dirs) - len(kept)
+            dirs[:] = kept
+
+        for file in files:
+            full_path = os.path.join(root, file)
+            relpath = os.path.join(rel_root, file)
+            if not rel_root and file == IGNORE_FILE:
+                continue
+            if matcher and matcher.is_ignored(relpath):
+                if stats:
+                    stats.files += 1
+                    stats.bytes += os.path.getsize(full_path)
+                continue
+            yield full_path, relpath
@@ -4,6 +4,8 @@ from . import logging_helper, util
 from .chrome_store import commands as chrome_commands
 from .firefox_store import commands as firefox_commands
 from .script_parser.parser import Parser
+from .store import store
+from .store.rate_limit import RateLimiter
 
 logger = logging_helper.get_logger(__file__)
 
@@ -11,11 +13,22 @@ logger = logging_helper.get_logger(__file__)
 @click.group()
 @click.option('-v', '--verbose', count=True,
               help="Much verbosity. May be repeated multiple times. More v's, more info!")
-def main(verbose):
+@click.option('--rate-limit', multiple=True, metavar='HOST=RATE[:BURST]',
+              help="Limit requests to HOST to RATE per second, allowing bursts of BURST requests. HOST * applies to "
+                   "all other hosts. May be repeated.")
+@click.option('--rate-limit-state', type=click.Path(file_okay=False), envvar='WEBSTORE_RATE_LIMIT_STATE',
+              help="Folder to keep rate limit state in. Processes using the same folder share their limits.")
+def main(verbose, rate_limit, rate_limit_state):
     logging_helper.set_level(30 - verbose * 10)
 
+    if rate_limit:
+        try:
+            store.set_default_rate_limiter(RateLimiter.from_specs(rate_limit, rate_limit_state))
+        except ValueError as error:
+            raise click.BadParameter(str(error), param_hint='--rate-limit')
+
     logger.info("Logging into file: {}".format(logging_helper.log_file))
-    logger.debug("Using temporary directory: {}".format(util.build_dir))
+    logger.debug("Using temporary directory: {}".format(util.scratch_space.root))
 
 
 @main.command('script')
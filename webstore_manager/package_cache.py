@@ -0,0 +1,199 @@
+import hashlib
+import os
+import shutil
+import tempfile
+
+import appdirs
+
+from . import ignore, logging_helper
+
+logger = logging_helper.get_logger(__file__)
+
+default_cache_dir = os.path.join(appdirs.user_cache_dir("webstore_manager", "melkamar"), "packages")
+DEFAULT_MAX_SIZE = 512 * 1024 * 1024
+
+_COPY_CHUNK_SIZE = 1024 * 1024
+
+
+def tree_hash(path, hash_contents=False, matcher=None, relpath=''):
+    """
+    Compute a Merkle hash of a file or a folder tree.
+
+    A file is hashed by its size and modification time (and optionally content). A folder is hashed by the names and
+    hashes of its children, so a change anywhere in the tree changes the hash of every folder above it. Files and
+    folders excluded by the folder's ignore file are left out (the ignore file itself is not). Symbolic links are hashed
+    by their target, links to folders are not followed.
+
+    Args:
+        path(str): File or folder to hash.
+        hash_contents(bool, optional): If true, hash file contents too. Slower, but does not rely on mtimes.
+        matcher(ignore.IgnoreMatcher, optional): Matcher of excluded paths. Defaults to the folder's ignore file.
+        relpath(str, optional): Path relative to the root folder, used internally when recursing.
+
+    Returns:
+        bytes: SHA-256 digest.
+    """
+    digest = hashlib.sha256()
+
+    if not os.path.isdir(path):
+        stat = os.stat(path)
+        digest.update('{}:{}'.format(stat.st_size, stat.st_mtime_ns).encode())
+        if hash_contents:
+            with open(path, 'rb') as f:
+                for chunk in iter(lambda: f.read(_COPY_CHUNK_SIZE), b''):
+                    digest.update(chunk)
+        return digest.digest()
+
+    if not relpath and matcher is None:
+        matcher = ignore.IgnoreMatcher.for_folder(path)
+
+    for entry in sorted(os.scandir(path), key=lambda e: e.name):
+        is_dir = entry.is_dir()
+        entry_relpath = os.path.join(relpath, entry.name)
+        if matcher and matcher.is_ignored(entry_relpath, is_dir):
+            continue
+
+        name = entry.name.encode('utf-8', 'surrogateescape') + b'\0'
+        if entry.is_symlink():
+            # Like when zipping, linked folders are not descended into (so link loops end), linked files are read.
+            target = os.readlink(entry.path).encode('utf-8', 'surrogateescape') + b'\0'
+            digest.update(b'l' + name + target)
+            if entry.is_file():
+                digest.update(tree_hash(entry.path, hash_contents, matcher, entry_relpath))
+            continue
+
+        tag = b'd' if is_dir else b'f'
+        digest.update(tag + name)
+        digest.update(tree_hash(entry.path, hash_contents, matcher, entry_relpath))
+    return digest.digest()
+
+
+class PackageCache:
+    """
+    Content-addressed cache of built archives.
+
+    Archives are stored under a key derived from the Merkle hash of their input (see tree_hash) and the parameters
+    they were built with. The cache directory is kept under max_size bytes by evicting least recently used archives.
+    """
+
+    def __init__(self, directory=None, max_size=DEFAULT_MAX_SIZE, hash_contents=False):
+        """
+        Args:
+            directory(str, optional): Folder to store cached archives in. Defaults to a folder in the user cache dir.
+            max_size(int, optional): Size cap of the cache directory in bytes.
+            hash_contents(bool, optional): Hash file contents, not only sizes and mtimes, when computing keys.
+        """
+        super().__init__()
+        self.directory = directory or default_cache_dir
+        self.max_size = int(max_size)
+        self.hash_contents = hash_contents
+        os.makedirs(self.directory, exist_ok=True)
+
+    def key(self, path, *params):
+        """
+        Compute a cache key of an input file or folder.
+
+        Args:
+            path(str): Input of the packaging step.
+            *params: Any other values influencing the built archive.
+
+        Returns:
+            str: Hex digest usable as a key.
+        """
+        digest = hashlib.sha256(tree_hash(path, self.hash_contents))
+        digest.update(repr(params).encode())
+        return digest.hexdigest()
+
+    def _entry_path(self, key):
+        return os.path.join(self.directory, key + '.zip')
+
+    def get(self, key):
+        """
+        Look up an archive in the cache and mark it as recently used.
+
+        Args:
+            key(str): Key as returned by PackageCache.key.
+
+        Returns:
+            str: Filename of the cached archive, None if it is not cached.
+        """
+        entry = self._entry_path(key)
+        try:
+            os.utime(entry)
+        except FileNotFoundError:
+            logger.debug("Package cache miss: {}".format(key))
+            return None
+
+        logger.info("Package cache hit: {}".format(key))
+        return entry
+
+    def put(self, key, source):
+        """
+        Store an archive in the cache and evict old entries if the cache grew over its size cap.
+
+        Args:
+            key(str): Key as returned by PackageCache.key.
+            source(str or file): Filename or a readable binary file object of the archive. File objects are read from
+                                 their beginning and rewound afterwards.
+
+        Returns:
+            str: Filename of the cached archive.
+        """
+        entry = self._entry_path(key)
+
+        # Write into a temporary file first so that concurrent runs never see a partially written archive.
+        handle, temp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        try:
+            with os.fdopen(handle, 'wb') as f:
+                if hasattr(source, 'read'):
+                    source.seek(0)
+                    shutil.copyfileobj(source, f, _COPY_CHUNK_SIZE)
+                    source.seek(0)
+                else:
+                    with open(source, 'rb') as src:
+                        shutil.copyfileobj(src, f, _COPY_CHUNK_SIZE)
+            os.replace(temp_name, entry)
+        except BaseException:
+            os.remove(temp_name)
+            raise
+
+        logger.debug("Stored archive in package cache: {}".format(entry))
+        self.evict(keep=entry)
+        return entry
+
+    def evict(self, keep=None):
+        """
+        Remove least recently used archives until the cache fits into its size cap.
+
+        Args:
+            keep(str, optional): Filename of an entry that must not be evicted.
+
+        Returns:
+            int: Number of bytes freed.
+        """
+        entries = []
+        total = 0
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith('.zip'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:  # removed by a concurrent run
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+            total += stat.st_size
+
+        freed = 0
+        for _, size, path in sorted(entries):
+            if total - freed <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            freed += size
+            logger.debug("Evicted {} from package cache".format(path))
+
+        return freed
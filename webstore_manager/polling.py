@@ -0,0 +1,86 @@
+import random
+import time
+
+from . import logging_helper
+
+logger = logging_helper.get_logger(__file__)
+
+
+class Backoff:
+    """
+    Exponentially growing intervals between attempts, capped at a maximum and randomized by jitter so that many
+    clients polling at the same time spread out.
+    """
+
+    def __init__(self, initial=1, maximum=30, multiplier=2, jitter=0.5, rng=None):
+        """
+        Args:
+            initial(float, optional): First interval in seconds.
+            maximum(float, optional): Cap of intervals in seconds.
+            multiplier(float, optional): Every interval is this many times longer than the previous one.
+            jitter(float, optional): Fraction of an interval which is random, 0 disables jitter. An interval d is
+                                     shortened to a random value between d * (1 - jitter) and d.
+            rng(random.Random, optional): Source of randomness.
+        """
+        super().__init__()
+        self.initial = initial
+        self.maximum = maximum
+        self.multiplier = multiplier
+        self.jitter = jitter
+        self.rng = rng or random.Random()
+
+    def intervals(self):
+        """
+        Generate intervals between attempts, infinitely.
+
+        Returns:
+            iterator: Intervals in seconds.
+        """
+        interval = self.initial
+        while True:
+            capped = min(interval, self.maximum)
+            yield capped * (1 - self.jitter * self.rng.random())
+            interval = capped * self.multiplier
+
+
+def poll(func, until, timeout, backoff=None, stop=None, sleep=None, clock=time.monotonic):
+    """
+    Call a function repeatedly until its result satisfies a condition, waiting for a growing interval between calls.
+
+    The function is always called at least once. Waiting never exceeds the deadline given by timeout, so the last
+    attempt is made right before the deadline at the latest.
+
+    Args:
+        func(function): Called without arguments, returns the polled value.
+        until(function): Called with the value, returns true when polling is done.
+        timeout(float): Overall deadline in seconds since the first call.
+        backoff(Backoff, optional): Intervals between calls. Defaults to Backoff().
+        stop(function, optional): Called with the value, returns true if the value is terminal and further polling
+                                  is pointless (e.g. an operation failed).
+        sleep(function, optional): Waits for the given number of seconds. Defaults to time.sleep.
+        clock(function, optional): Source of current time in seconds.
+
+    Returns:
+        Last value returned by func. Whether it satisfies until (or stop), or the deadline passed, is up to the caller
+        to check.
+    """
+    backoff = backoff or Backoff()
+    sleep = sleep or time.sleep
+    deadline = clock() + timeout
+
+    for attempt, interval in enumerate(backoff.intervals(), 1):
+        value = func()
+        if until(value):
+            return value
+        if stop and stop(value):
+            logger.debug("Polling stopped at a terminal value after {} attempts".format(attempt))
+            return value
+
+        remaining = deadline - clock()
+        if remaining <= 0:
+            logger.debug("Polling deadline passed after {} attempts".format(attempt))
+            return value
+
+        interval = min(interval, remaining)
+        logger.debug("Attempt {} not done, next one in {:.1f} seconds".format(attempt, interval))
+        sleep(interval)
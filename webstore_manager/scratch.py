@@ -0,0 +1,267 @@
+import os
+import queue
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from . import logging_helper
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging_helper.get_logger(__file__)
+
+DEFAULT_QUOTA = 2 * 1024 * 1024 * 1024
+DEFAULT_STALE_AGE = 24 * 60 * 60
+
+_RUN_PREFIX = 'run-'
+# Held locked by a run for as long as it uses its scratch space.
+_LOCK_NAME = '.lock'
+
+
+class ScratchQuotaError(Exception):
+    """Raised when the scratch space is over its quota even after all released directories were removed."""
+
+
+class ScratchSpace:
+    """
+    Temporary working space of a single run of the program.
+
+    Every operation gets its own subdirectory (see ScratchSpace.operation and ScratchSpace.allocate), so concurrent
+    runs and consecutive operations never collide. Released directories are removed by a background thread, off the
+    critical path of the command. Leftovers of previous runs that did not clean up after themselves (e.g. were killed)
+    are removed in the background as well. A run holds a lock of its scratch space while it lives, so a space is
+    only removed when nobody holds its lock anymore (or, where file locks are not available, when it is too old).
+
+    The root directory of the run is only created when first needed.
+    """
+
+    def __init__(self, base_dir=None, quota=DEFAULT_QUOTA, stale_age=DEFAULT_STALE_AGE):
+        """
+        Args:
+            base_dir(str, optional): Directory shared by all runs. Defaults to a folder in the system temp dir.
+            quota(int, optional): Maximum size of this run's scratch space in bytes.
+            stale_age(int, optional): Scratch spaces of other runs older than this (in seconds) are removed.
+        """
+        super().__init__()
+        self.base_dir = base_dir or os.path.join(tempfile.gettempdir(), 'webstore_manager')
+        self.root = os.path.join(self.base_dir, '{}{}-{}'.format(_RUN_PREFIX, os.getpid(), uuid.uuid4().hex[:8]))
+        self.quota = quota
+        self.stale_age = stale_age
+
+        self._lock = threading.RLock()
+        self._queue = queue.Queue()
+        self._worker = None
+        self._created = False
+        self._lock_file = None
+
+    def allocate(self, name="op"):
+        """
+        Create a new, empty directory for an operation. It is removed by ScratchSpace.release or at the end of the run.
+
+        Args:
+            name(str, optional): Prefix of the directory name, for easier debugging.
+
+        Returns:
+            str: Path of the directory.
+
+        Raises:
+            ScratchQuotaError: if the scratch space is over its quota.
+        """
+        with self._lock:
+            if not self._created:
+                os.makedirs(self.root, exist_ok=True)
+                self._lock_file = _try_lock(os.path.join(self.root, _LOCK_NAME))
+                self._created = True
+                self._submit(self._remove_stale)
+
+        self._check_quota()
+        path = tempfile.mkdtemp(prefix=name + '-', dir=self.root)
+        logger.debug("Allocated scratch directory {}".format(path))
+        return path
+
+    def release(self, path):
+        """
+        Schedule removal of a directory allocated by ScratchSpace.allocate. Returns immediately.
+
+        Args:
+            path(str): Path of the directory.
+
+        Returns:
+            None
+        """
+        self._submit(shutil.rmtree, path, True)
+
+    def discard(self, path):
+        """
+        Remove a directory. Directories inside the scratch space of this run are renamed away and removed in the
+        background, so that the path can be reused right away. Anything else is removed before returning - a
+        background removal could be interrupted and leave a renamed copy of the user's directory behind.
+
+        Args:
+            path(str): Path of the directory.
+
+        Returns:
+            None
+        """
+        path = os.path.abspath(path)
+        if not _is_inside(path, os.path.abspath(self.root)):
+            shutil.rmtree(path)
+            return
+
+        doomed = '{}.{}.deleted'.format(path, uuid.uuid4().hex[:8])
+        try:
+            os.rename(path, doomed)
+        except OSError:  # e.g. a file is in use on Windows, remove it in place
+            shutil.rmtree(path)
+            return
+        self._submit(shutil.rmtree, doomed, True)
+
+    @contextmanager
+    def operation(self, name="op"):
+        """
+        Context managed function providing a directory for the span of the context.
+
+        Use::
+
+           with scratch_space.operation('unzip') as directory:
+               pass
+
+        Args:
+            name(str, optional): Prefix of the directory name, for easier debugging.
+
+        Returns:
+            str: Path of the directory.
+        """
+        path = self.allocate(name)
+        try:
+            yield path
+        finally:
+            self.release(path)
+
+    def usage(self):
+        """
+        Compute the size of this run's scratch space.
+
+        Returns:
+            int: Size in bytes.
+        """
+        total = 0
+        for root, dirs, files in os.walk(self.root):
+            for file in files:
+                try:
+                    total += os.lstat(os.path.join(root, file)).st_size
+                except FileNotFoundError:  # removed in the background meanwhile
+                    pass
+        return total
+
+    def wait(self):
+        """
+        Block until all scheduled removals are done.
+
+        Returns:
+            None
+        """
+        if self._worker:
+            self._queue.join()
+
+    def cleanup(self):
+        """
+        Remove the whole scratch space of this run. Called at exit.
+
+        Returns:
+            None
+        """
+        self.wait()
+        if self._created:
+            logger.debug("Cleaning scratch space {}".format(self.root))
+            shutil.rmtree(self.root, ignore_errors=True)
+            if self._lock_file:
+                self._lock_file.close()
+                self._lock_file = None
+            self._created = False
+
+    def _check_quota(self):
+        if self.usage() <= self.quota:
+            return
+
+        # Directories released but not yet removed still count, give the background removal a chance first.
+        self.wait()
+        usage = self.usage()
+        if usage > self.quota:
+            raise ScratchQuotaError("Scratch space {} uses {} bytes, over its quota of {} bytes.".format(
+                self.root, usage, self.quota))
+
+    def _submit(self, func, *args):
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._work, name="scratch-cleanup", daemon=True)
+                self._worker.start()
+        self._queue.put((func, args))
+
+    def _work(self):
+        while True:
+            func, args = self._queue.get()
+            try:
+                func(*args)
+            except Exception as error:
+                logger.warning("Scratch space cleanup failed: {}".format(error))
+            finally:
+                self._queue.task_done()
+
+    def _remove_stale(self):
+        """ Remove scratch spaces of runs that are not running anymore. """
+        now = time.time()
+        for entry in os.scandir(self.base_dir):
+            if not entry.name.startswith(_RUN_PREFIX) or entry.path == self.root:
+                continue
+
+            try:
+                age = now - entry.stat().st_mtime
+            except OSError:
+                continue
+
+            # Process IDs say nothing about runs in other containers, the lock of the run decides. A space without a
+            # lock may be just being created, or comes from a system without file locks - only its age counts then.
+            lock = _try_lock(os.path.join(entry.path, _LOCK_NAME), create=False)
+            if lock is False or (lock is None and age <= self.stale_age):
+                continue
+
+            logger.debug("Removing stale scratch space {}".format(entry.path))
+            shutil.rmtree(entry.path, ignore_errors=True)
+            if lock:
+                lock.close()
+
+
+def _is_inside(path, directory):
+    try:
+        return os.path.commonpath([path, directory]) == directory
+    except ValueError:  # different drives on Windows
+        return False
+
+
+def _try_lock(lock_name, create=True):
+    """
+    Lock a file without blocking. The lock is held until the returned file is closed.
+
+    Returns:
+        The open lock file, False if somebody else holds the lock, or None if the file does not exist or file locks
+        are not available.
+    """
+    if not fcntl:
+        return None
+    try:
+        f = open(lock_name, 'a+b' if create else 'r+b')
+    except FileNotFoundError:
+        return None
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        return False
+    return f
@@ -1,9 +1,9 @@
 import re
 import os
-import time
 
 from webstore_manager.chrome_store import chrome_store
-from webstore_manager import logging_helper, util
+from webstore_manager.chrome_store.token_store import PersistentTokenStore
+from webstore_manager import archive, logging_helper, package_cache, polling, util
 
 logger = logging_helper.get_logger(__file__)
 
@@ -17,13 +17,15 @@ class ChromeFunctions:
             raise InvalidStateException('You must run chrome.new function before uploading an extension.')
 
     @staticmethod
-    def init(parser, client_id, client_secret, refresh_token):
+    def init(parser, client_id, client_secret, refresh_token, token_store='on'):
+        if token_store not in ('on', 'off'):
+            raise ValueError('Unknown value {}. Expected one of on, off.'.format(token_store))
         parser.variables['client_id'] = client_id
         parser.variables['client_secret'] = client_secret
         parser.variables['refresh_token'] = refresh_token
-        parser.variables['chrome_store'] = chrome_store.ChromeStore(client_id,
-                                                                    client_secret,
-                                                                    refresh_token)
+        parser.variables['chrome_store'] = chrome_store.ChromeStore(
+            client_id, client_secret, refresh_token,
+            token_store=PersistentTokenStore() if token_store == 'on' else None)
 
     @staticmethod
     def set_app(parser, app_id):
@@ -33,14 +35,14 @@ class ChromeFunctions:
         store.update_item_url = "https://www.googleapis.com/upload/chromewebstore/v1.1/items/{}".format(app_id)
 
     @staticmethod
-    def new(parser, filename):
+    def new(parser, filename, chunk_size=None):
         store = ChromeFunctions.read_store(parser)
-        store.upload(filename, True)
+        store.upload(filename, True, chunk_size=int(chunk_size) if chunk_size else None)
 
     @staticmethod
-    def update(parser, filename):
+    def update(parser, filename, chunk_size=None):
         store = ChromeFunctions.read_store(parser)
-        store.upload(filename, False)
+        store.upload(filename, False, chunk_size=int(chunk_size) if chunk_size else None)
 
     @staticmethod
     def publish(parser, target):
@@ -53,28 +55,35 @@ class ChromeFunctions:
             raise ValueError('Unknown value {}. Expected one of public, trusted.'.format(target))
 
     @staticmethod
-    def check_version(parser, expected_version, timeout=30):
+    def check_version(parser, expected_version, timeout=30, interval=1, max_interval=10):
         store = ChromeFunctions.read_store(parser)
-        version = ''
-        timeout = int(timeout)  # if it was passed from the user, it will be a str
+        # if they were passed from the user, they will be strings
+        timeout, interval, max_interval = float(timeout), float(interval), float(max_interval)
 
-        correct = False
-        start = time.time()
-        while time.time() - start < timeout:
-            version = store.get_uploaded_version()
-            if version == expected_version:
-                correct = True
-                break
-
-            logger.warn(
-                "Expecting version {}, but obtained {}. Will keep retrying for {} seconds.".format(expected_version,
-                                                                                                   version, timeout))
-            time.sleep(5)
+        upload = store.last_upload
+        if upload and upload.id == store.app_id and upload.state == 'SUCCESS' and upload.version == expected_version:
+            logger.info("Version {} confirmed by the upload response.".format(expected_version))
+            return
 
-        if correct:
-            pass
-        else:
-            raise ValueError("Expected version {}. Server reports {}.".format(expected_version, version))
+        def status():
+            version = store.get_uploaded_version()
+            if version != expected_version:
+                logger.warning("Expecting version {}, but obtained {} (state {}).".format(expected_version, version,
+                                                                                        store.upload_state))
+            return version, store.upload_state
+
+        version, state = polling.poll(status,
+                                      until=lambda result: result[0] == expected_version,
+                                      stop=lambda result: result[1] in chrome_store.ChromeStore.TERMINAL_UPLOAD_STATES,
+                                      timeout=timeout,
+                                      backoff=polling.Backoff(interval, max_interval))
+
+        if version == expected_version:
+            return
+        if state in chrome_store.ChromeStore.TERMINAL_UPLOAD_STATES:
+            raise ValueError("Expected version {}. Server reports {} with upload state {}.".format(expected_version,
+                                                                                                  version, state))
+        raise ValueError("Expected version {}. Server reports {}.".format(expected_version, version))
 
     @staticmethod
     def unpack(parser, archive, target):
@@ -102,8 +111,44 @@ class GenericFunctions:
             raise IndexError("No folder left on stack to pop into.")
 
     @staticmethod
-    def zip(parser, folder, zipname):
-        util.make_zip(zipname, os.path.join(os.getcwd(), folder), os.getcwd())
+    def _zip_options(parser):
+        """ Options of zip functions as set by other script functions (cache, compress, reproducible). """
+        return {
+            'cache': parser.variables.get('package_cache'),
+            'policy': parser.variables.get('compression_policy'),
+            'deterministic': parser.variables.get('reproducible', False),
+        }
+
+    @staticmethod
+    def zip(parser, folder, zipname, jobs=1):
+        util.make_zip(zipname, os.path.join(os.getcwd(), folder), os.getcwd(), jobs=int(jobs),
+                      **GenericFunctions._zip_options(parser))
+
+    @staticmethod
+    def zip_update(parser, folder, zipname, jobs=1):
+        zip_path = os.path.join(os.getcwd(), zipname)
+        util.make_zip(zipname, os.path.join(os.getcwd(), folder), os.getcwd(), jobs=int(jobs), previous=zip_path,
+                      **GenericFunctions._zip_options(parser))
+
+    @staticmethod
+    def compress(parser, pattern, level):
+        policy = parser.variables.get('compression_policy') or archive.CompressionPolicy.default()
+        parser.variables['compression_policy'] = policy.with_rule(pattern, int(level))
+
+    @staticmethod
+    def reproducible(parser, state):
+        if state not in ('on', 'off'):
+            raise ValueError('Unknown value {}. Expected one of on, off.'.format(state))
+        parser.variables['reproducible'] = state == 'on'
+
+    @staticmethod
+    def cache(parser, state, max_size=package_cache.DEFAULT_MAX_SIZE):
+        if state == 'on':
+            parser.variables['package_cache'] = package_cache.PackageCache(max_size=int(max_size))
+        elif state == 'off':
+            parser.variables.pop('package_cache', None)
+        else:
+            raise ValueError('Unknown value {}. Expected one of on, off.'.format(state))
 
 
 class Parser:
@@ -122,7 +167,11 @@ class Parser:
         'chrome.publish': ChromeFunctions.publish,
         'chrome.check_version': ChromeFunctions.check_version,
         'chrome.unpack': ChromeFunctions.unpack,
-        'zip': GenericFunctions.zip
+        'zip': GenericFunctions.zip,
+        'zip_update': GenericFunctions.zip_update,
+        'cache': GenericFunctions.cache,
+        'compress': GenericFunctions.compress,
+        'reproducible': GenericFunctions.reproducible
     }
 
     def __init__(self, script=None, script_fn=None):
@@ -0,0 +1,136 @@
+import hashlib
+import json
+import os
+import tempfile
+import time
+
+import appdirs
+
+from webstore_manager import logging_helper, util
+
+logger = logging_helper.get_logger(__file__)
+
+default_ledger_path = os.path.join(appdirs.user_data_dir("webstore_manager", "melkamar"), "uploads.json")
+
+_HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_digest(filename):
+    """
+    Compute SHA-256 of an archive.
+
+    Args:
+        filename(str or file): Name of the archive or an opened binary file object containing it. File objects are
+                               read from the beginning.
+
+    Returns:
+        str: Hex digest.
+    """
+    digest = hashlib.sha256()
+    with util.open_archive(filename) as f:
+        for chunk in iter(lambda: f.read(_HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class UploadLedger:
+    """
+    Local record of the last completed upload of every item, so that uploading the very same archive again (e.g. when
+    a failed CI job is retried) can be skipped.
+
+    The ledger is a JSON file shared by all processes of the user, updated under a file lock. For every store and item
+    ID it keeps the version and SHA-256 of the last archive uploaded. Only the last upload counts - after uploading
+    archives A, B and A again, the second upload of A is not a duplicate.
+    """
+
+    def __init__(self, path=None):
+        """
+        Args:
+            path(str, optional): Ledger file. Defaults to a file in the user data dir.
+        """
+        super().__init__()
+        self.path = path or default_ledger_path
+
+    def find(self, store, item_id, sha256, version=None):
+        """
+        Find the last upload of an item if it was the same archive.
+
+        Args:
+            store(str): Name of the store, e.g. "chrome".
+            item_id(str): ID of the item in the store.
+            sha256(str): Hex digest of the archive, see file_digest.
+            version(str, optional): If set, the recorded version must be equal too.
+
+        Returns:
+            dict: Recorded upload (version, sha256 and time of the upload), or None if the last upload of the item
+                  was a different archive or there is none.
+        """
+        entry = self._load().get(self._key(store, item_id))
+        if not entry or entry['sha256'] != sha256:
+            return None
+        if version is not None and entry['version'] != version:
+            return None
+        return entry
+
+    def record(self, store, item_id, version, sha256):
+        """
+        Record a completed upload.
+
+        Args:
+            store(str): Name of the store, e.g. "chrome".
+            item_id(str): ID of the item in the store.
+            version(str): Uploaded version, None if unknown.
+            sha256(str): Hex digest of the archive, see file_digest.
+
+        Returns:
+            None
+        """
+        self._update(self._key(store, item_id), {'version': version, 'sha256': sha256, 'uploaded': time.time()})
+
+    def forget(self, store, item_id):
+        """
+        Remove the record of an item, so its next upload is never skipped.
+
+        Args:
+            store(str): Name of the store, e.g. "chrome".
+            item_id(str): ID of the item in the store.
+
+        Returns:
+            None
+        """
+        self._update(self._key(store, item_id), None)
+
+    @staticmethod
+    def _key(store, item_id):
+        return '{}:{}'.format(store, item_id)
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                entries = json.load(f)
+        except FileNotFoundError:
+            return {}
+        except ValueError:
+            logger.warning("Upload ledger {} is corrupted, ignoring it.".format(self.path))
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def _update(self, key, entry):
+        directory = os.path.dirname(self.path) or '.'
+        os.makedirs(directory, exist_ok=True)
+
+        with util.locked_file(self.path + '.lock'):
+            entries = self._load()
+            if entry is None:
+                entries.pop(key, None)
+            else:
+                entries[key] = entry
+
+            handle, temp_name = tempfile.mkstemp(dir=directory, suffix='.tmp')
+            try:
+                with os.fdopen(handle, 'w', encoding='utf-8') as f:
+                    json.dump(entries, f, indent=1, sort_keys=True)
+                os.replace(temp_name, self.path)
+            except BaseException:
+                os.remove(temp_name)
+                raise
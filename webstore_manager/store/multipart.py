@@ -0,0 +1,132 @@
+import io
+import os
+import uuid
+
+_CRLF = b'\r\n'
+
+
+class MultipartEncoder(io.RawIOBase):
+    """
+    Streaming multipart/form-data request body.
+
+    Requests sends file-like bodies in chunks, so the files of the form are read piece by piece while sending instead
+    of building the whole body in memory first. The body knows its length (sent as Content-Length) and supports tell
+    and seek, so urllib3 can rewind it when retrying a request.
+
+    Files are only read, never closed - that is left to whoever opened them.
+
+    Use::
+
+        with open('extension.xpi', 'rb') as f:
+            body = MultipartEncoder({'upload': ('extension.xpi', f)})
+            session.put(url, data=body, headers={'Content-Type': body.content_type})
+    """
+
+    def __init__(self, fields, progress=None, boundary=None):
+        """
+        Args:
+            fields(dict): Form fields. Values are either strings, or tuples (filename, binary file object) or
+                          (filename, binary file object, content type) for files. Files are sent from their current
+                          position to their end.
+            progress(function, optional): Called as progress(bytes_sent, total_bytes) whenever a part of the body is
+                                          read.
+            boundary(str, optional): Boundary of the parts. Random if not set.
+        """
+        super().__init__()
+        self.boundary = boundary or uuid.uuid4().hex
+        self.progress = progress
+
+        # Segments of the body: (offset in the body, length, bytes or (file object, offset in the file)).
+        self._segments = []
+        self._length = 0
+        self._position = 0
+
+        for name, value in fields.items():
+            if isinstance(value, tuple):
+                filename, fileobj = value[:2]
+                content_type = value[2] if len(value) > 2 else 'application/octet-stream'
+                self._add(self._part_header(name, filename, content_type))
+                start = fileobj.tell()
+                size = fileobj.seek(0, os.SEEK_END) - start
+                fileobj.seek(start)
+                self._add((fileobj, start), size)
+            else:
+                self._add(self._part_header(name))
+                self._add(value.encode('utf-8') if isinstance(value, str) else value)
+            self._add(_CRLF)
+        self._add('--{}--'.format(self.boundary).encode() + _CRLF)
+
+    @property
+    def content_type(self):
+        """ Value of the Content-Type header of the body. """
+        return 'multipart/form-data; boundary={}'.format(self.boundary)
+
+    def _part_header(self, name, filename=None, content_type=None):
+        disposition = 'form-data; name="{}"'.format(name)
+        if filename is not None:
+            disposition += '; filename="{}"'.format(filename.replace('"', '%22'))
+        lines = ['--{}'.format(self.boundary), 'Content-Disposition: {}'.format(disposition)]
+        if content_type:
+            lines.append('Content-Type: {}'.format(content_type))
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('utf-8')
+
+    def _add(self, data, size=None):
+        size = len(data) if size is None else size
+        self._segments.append((self._length, size, data))
+        self._length += size
+
+    def __len__(self):
+        return self._length
+
+    def readable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        if whence == os.SEEK_CUR:
+            offset += self._position
+        elif whence == os.SEEK_END:
+            offset += self._length
+        if offset < 0:
+            raise ValueError("Negative seek position {}".format(offset))
+        self._position = offset
+        return self._position
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self._length - self._position
+
+        chunks = []
+        for start, length, data in self._segments:
+            if size <= 0:
+                break
+            if start + length <= self._position:
+                continue
+
+            skip = self._position - start
+            count = min(size, length - skip)
+            if isinstance(data, bytes):
+                chunk = data[skip:skip + count]
+            else:
+                fileobj, file_start = data
+                fileobj.seek(file_start + skip)
+                chunk = fileobj.read(count)
+                if len(chunk) != count:
+                    raise IOError("File changed while being uploaded.")
+            chunks.append(chunk)
+            self._position += count
+            size -= count
+
+        if chunks and self.progress:
+            self.progress(self._position, self._length)
+        return b''.join(chunks)
+
+    def readinto(self, buffer):
+        data = self.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
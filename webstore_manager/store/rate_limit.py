@@ -0,0 +1,215 @@
+import os
+import struct
+import threading
+import time
+import urllib.parse
+
+from requests.adapters import HTTPAdapter
+
+from webstore_manager import logging_helper, util
+
+logger = logging_helper.get_logger(__file__)
+
+# Host pattern matching any host without a limit of its own.
+ANY_HOST = '*'
+
+_STATE = struct.Struct('<dd')  # tokens, time of the last update
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket limiting the rate of requests of this process.
+
+    The bucket holds up to capacity tokens and is refilled by rate tokens per second. Every request takes a token.
+    A request that finds the bucket empty reserves a future token and waits for it, so waiting requests are served
+    in order and the rate is never exceeded.
+    """
+
+    def __init__(self, rate, capacity=None, clock=time.monotonic, sleep=time.sleep):
+        """
+        Args:
+            rate(float): Tokens added per second, i.e. the sustained request rate.
+            capacity(float, optional): Size of the bucket, i.e. how many requests may be sent in a burst.
+                                       Defaults to max(1, rate).
+            clock(function, optional): Source of current time in seconds.
+            sleep(function, optional): Waits for the given number of seconds.
+        """
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("Rate must be positive, got {}.".format(rate))
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.clock = clock
+        self.sleep = sleep
+
+        self._tokens = self.capacity
+        self._updated = clock()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+
+        Returns:
+            float: Number of seconds waited.
+        """
+        with self._lock:
+            now = self.clock()
+            self._tokens, wait = _take(self._tokens, self._updated, now, self.rate, self.capacity)
+            self._updated = now
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+
+class FileTokenBucket:
+    """
+    Token bucket shared by all processes using the same state file, see TokenBucket.
+
+    The state (number of tokens and time of its update) is kept in a small file and updated under a file lock, so
+    parallel jobs together stay within the rate.
+    """
+
+    def __init__(self, path, rate, capacity=None, clock=time.time, sleep=time.sleep):
+        """
+        Args:
+            path(str): State file. Created if it does not exist.
+            rate(float): Tokens added per second, i.e. the sustained request rate.
+            capacity(float, optional): Size of the bucket. Defaults to max(1, rate).
+            clock(function, optional): Source of current time in seconds, comparable between processes.
+            sleep(function, optional): Waits for the given number of seconds.
+        """
+        super().__init__()
+        if rate <= 0:
+            raise ValueError("Rate must be positive, got {}.".format(rate))
+        self.path = path
+        self.rate = float(rate)
+        self.capacity = float(capacity) if capacity else max(1.0, self.rate)
+        self.clock = clock
+        self.sleep = sleep
+
+    def acquire(self):
+        """
+        Take a token, waiting until one is available.
+
+        Returns:
+            float: Number of seconds waited.
+        """
+        with util.locked_file(self.path + '.lock'):
+            now = self.clock()
+            tokens, updated = self._read(now)
+            tokens, wait = _take(tokens, updated, now, self.rate, self.capacity)
+            self._write(tokens, now)
+
+        if wait > 0:
+            self.sleep(wait)
+        return wait
+
+    def _read(self, now):
+        try:
+            with open(self.path, 'rb') as f:
+                return _STATE.unpack(f.read(_STATE.size))
+        except (FileNotFoundError, struct.error):  # new or damaged state, start with a full bucket
+            return self.capacity, now
+
+    def _write(self, tokens, now):
+        with open(self.path, 'wb') as f:
+            f.write(_STATE.pack(tokens, now))
+
+
+def _take(tokens, updated, now, rate, capacity):
+    """ Refill a bucket and take a token from it. Returns the new number of tokens and the time to wait. """
+    tokens = min(capacity, tokens + max(0.0, now - updated) * rate) - 1
+    wait = -tokens / rate if tokens < 0 else 0.0
+    return tokens, wait
+
+
+class RateLimiter:
+    """
+    Set of token buckets, one per host. Hosts without a bucket of their own use the ANY_HOST bucket, if there is
+    one, otherwise they are not limited.
+    """
+
+    def __init__(self, buckets=None):
+        """
+        Args:
+            buckets(dict, optional): Buckets (TokenBucket or FileTokenBucket) keyed by host name or ANY_HOST.
+        """
+        super().__init__()
+        self.buckets = dict(buckets or {})
+
+    @classmethod
+    def from_specs(cls, specs, state_dir=None):
+        """
+        Create a limiter from textual specifications of the form ``host=rate[:capacity]``, e.g.
+        ``www.googleapis.com=5:10`` (5 requests per second, bursts of up to 10) or ``*=2``.
+
+        Args:
+            specs(:obj:`list` of :obj:`str`): Specifications.
+            state_dir(str, optional): If set, buckets are FileTokenBucket objects with state in this folder, shared
+                                      by all processes using the same folder.
+
+        Returns:
+            RateLimiter: The limiter.
+
+        Raises:
+            ValueError: if a specification is malformed.
+        """
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+        buckets = {}
+        for spec in specs:
+            try:
+                host, limit = spec.split('=', 1)
+                rate, _, capacity = limit.partition(':')
+                rate = float(rate)
+                capacity = float(capacity) if capacity else None
+            except ValueError:
+                raise ValueError("Invalid rate limit '{}', expected host=rate[:capacity].".format(spec))
+
+            host = host.strip().lower()
+            if state_dir:
+                name = 'any' if host == ANY_HOST else host
+                buckets[host] = FileTokenBucket(os.path.join(state_dir, name + '.bucket'), rate, capacity)
+            else:
+                buckets[host] = TokenBucket(rate, capacity)
+        return cls(buckets)
+
+    def wait(self, url):
+        """
+        Wait until a request to the given URL may be sent.
+
+        Args:
+            url(str): URL of the request.
+
+        Returns:
+            float: Number of seconds waited.
+        """
+        host = (urllib.parse.urlsplit(url).hostname or '').lower()
+        bucket = self.buckets.get(host) or self.buckets.get(ANY_HOST)
+        if not bucket:
+            return 0.0
+
+        waited = bucket.acquire()
+        if waited:
+            logger.debug("Rate limit of {} delayed a request by {:.2f} seconds".format(host, waited))
+        return waited
+
+
+class RateLimitedAdapter(HTTPAdapter):
+    """ HTTPAdapter waiting for a RateLimiter before sending every request. """
+
+    def __init__(self, rate_limiter, **kwargs):
+        """
+        Args:
+            rate_limiter(RateLimiter): Limiter to wait for.
+            **kwargs: Arguments of HTTPAdapter.
+        """
+        self.rate_limiter = rate_limiter
+        super().__init__(**kwargs)
+
+    def send(self, request, **kwargs):
+        self.rate_limiter.wait(request.url)
+        return super().send(request, **kwargs)
@@ -1,4 +1,137 @@
 import requests
+from urllib3.exceptions import MaxRetryError, ResponseError
+from urllib3.util.retry import Retry
+
+from webstore_manager import logging_helper
+from .rate_limit import RateLimitedAdapter, RateLimiter
+
+logger = logging_helper.get_logger(__file__)
+
+# Number of connections kept alive per host, and number of hosts to keep pools for.
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_CONNECTIONS = 4
+DEFAULT_RETRIES = 3
+# Waits between retries grow as backoff_factor * 2 ** (retry number - 1) seconds, unless the server sends Retry-After.
+DEFAULT_BACKOFF_FACTOR = 0.5
+# Longest wait in seconds a server may ask for with Retry-After. Requests asked to wait longer are not retried.
+DEFAULT_MAX_RETRY_AFTER = 60
+# Connect and read timeout in seconds.
+DEFAULT_TIMEOUT = (10, 120)
+
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+IDEMPOTENT_METHODS = frozenset(['HEAD', 'GET', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
+
+# Rate limiter of sessions created without one of their own. Does not limit anything unless configured, see
+# set_default_rate_limiter.
+default_rate_limiter = RateLimiter()
+
+
+class StoreRetry(Retry):
+    """
+    Retry policy of store sessions.
+
+    Failed connections are retried for any request, as nothing was sent yet. Read errors and error responses are only
+    retried for idempotent methods, with the exception of 429 Too Many Requests - the server refused to process the
+    request at all, so it is safe to repeat it. Retry-After headers are honoured up to max_retry_after seconds - if a
+    server asks to wait longer, the request is not retried and its response is returned (or, with raise_on_status,
+    MaxRetryError is raised).
+    """
+
+    def __init__(self, max_retry_after=DEFAULT_MAX_RETRY_AFTER, **kwargs):
+        """
+        Args:
+            max_retry_after(float, optional): Longest Retry-After to wait for, in seconds. None means no limit.
+            **kwargs: Arguments of urllib3's Retry.
+        """
+        super().__init__(**kwargs)
+        self.max_retry_after = max_retry_after
+
+    def new(self, **kw):
+        kw.setdefault('max_retry_after', self.max_retry_after)
+        return super().new(**kw)
+
+    def increment(self, method=None, url=None, response=None, error=None, _pool=None, _stacktrace=None):
+        if response is not None and self.respect_retry_after_header and self.max_retry_after is not None:
+            retry_after = self.get_retry_after(response)
+            if retry_after is not None and retry_after > self.max_retry_after:
+                message = "Server asked to retry {} after {} seconds, longer than the limit of {} seconds.".format(
+                    url, retry_after, self.max_retry_after)
+                logger.error(message)
+                raise MaxRetryError(_pool, url, ResponseError(message))
+        return super().increment(method, url, response, error, _pool, _stacktrace)
+
+    def is_retry(self, method, status_code, has_retry_after=False):
+        if status_code == 429:
+            return True
+        return super().is_retry(method, status_code, has_retry_after)
+
+
+class TimeoutSession(requests.Session):
+    """ Session applying a default timeout to requests that do not specify their own. """
+
+    def __init__(self, timeout=DEFAULT_TIMEOUT):
+        """
+        Args:
+            timeout(float or tuple): Timeout in seconds, or a (connect, read) tuple. None means no timeout.
+        """
+        super().__init__()
+        self.timeout = timeout
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        return super().request(method, url, **kwargs)
+
+
+def new_session(pool_size=DEFAULT_POOL_SIZE, pool_connections=DEFAULT_POOL_CONNECTIONS, retries=DEFAULT_RETRIES,
+                backoff_factor=DEFAULT_BACKOFF_FACTOR, timeout=DEFAULT_TIMEOUT, rate_limiter=None,
+                max_retry_after=DEFAULT_MAX_RETRY_AFTER):
+    """
+    Create a requests session tuned for talking to the stores: pooled keep-alive connections, retries of transient
+    failures with exponential backoff (see StoreRetry), a default timeout of every request and a per-host limit of the
+    request rate (see RateLimiter). Retries are paced by the backoff, not by the rate limiter.
+
+    Args:
+        pool_size(int, optional): Maximum number of connections kept alive per host. Should be at least the number of
+                                  threads using the session concurrently.
+        pool_connections(int, optional): Number of hosts to keep connection pools for.
+        retries(int, optional): Maximum number of retries of a request. 0 disables retrying.
+        backoff_factor(float, optional): Base of the exponential backoff between retries, in seconds.
+        timeout(float or tuple, optional): Timeout in seconds, or a (connect, read) tuple. None means no timeout.
+        rate_limiter(RateLimiter, optional): Limiter of the request rate. Defaults to default_rate_limiter.
+        max_retry_after(float, optional): Longest Retry-After the server may ask for, in seconds. Requests asked to
+                                          wait longer are not retried. None means no limit.
+
+    Returns:
+        requests.Session: The new session.
+    """
+    retry = StoreRetry(max_retry_after=max_retry_after,
+                       total=retries,
+                       backoff_factor=backoff_factor,
+                       status_forcelist=RETRY_STATUSES,
+                       allowed_methods=IDEMPOTENT_METHODS,
+                       respect_retry_after_header=True,
+                       raise_on_status=False)  # return the last error response, stores report it themselves
+    adapter = RateLimitedAdapter(rate_limiter or default_rate_limiter,
+                                 pool_connections=pool_connections, pool_maxsize=pool_size, max_retries=retry)
+
+    session = TimeoutSession(timeout)
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+def set_default_rate_limiter(rate_limiter):
+    """
+    Set the rate limiter of sessions created afterwards without one of their own, e.g. by stores.
+
+    Args:
+        rate_limiter(RateLimiter): The limiter.
+
+    Returns:
+        None
+    """
+    global default_rate_limiter
+    default_rate_limiter = rate_limiter
 
 
 class Store:
@@ -12,7 +145,7 @@ class Store:
 
         Args:
             session(requests.Session): If supplied, this session will be used for all internet communication.
-             If none, a new session if created.
+             If none, a new session is created by new_session.
         """
         super().__init__()
-        self.session = session or requests.Session()
+        self.session = session or new_session()
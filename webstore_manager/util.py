@@ -4,24 +4,115 @@ import tempfile
 import zipfile
 import requests
 import shutil
+import stat
 from contextlib import contextmanager
 
-from . import logging_helper
+from . import archive, logging_helper, scratch
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
 
 logger = logging_helper.get_logger(__file__)
 
-build_dir = tempfile.mkdtemp()
+# Temporary files of this run. Every operation should allocate its own directory there, see scratch.ScratchSpace.
+scratch_space = scratch.ScratchSpace()
 work_dir = os.getcwd()
-# logger.debug("Using temporary directory: {}".format(build_dir))
+
+# Archives built in memory are kept there until they grow over this size (in bytes), then they spill to disk.
+spool_max_size = 32 * 1024 * 1024
 
 
-def make_zip(zip_name, path, dest_dir=None):
+def _zip_folder(target, path, jobs=1, policy=None, deterministic=False):
+    """
+    Write all files under the given folder into a new zip archive.
+
+    Args:
+        target(str or file): Filename or a writable binary file object to write the archive into.
+        path(str): Root folder of the path to zip.
+        jobs(int, optional): Number of processes compressing files in parallel. 1 means serial compression in this
+                             process, 0 means one process per CPU core.
+        policy(archive.CompressionPolicy, optional): Compression of individual files.
+                                                     Defaults to archive.CompressionPolicy.default().
+        deterministic(bool, optional): If true, the same files always produce a byte-identical archive.
+
+    Returns:
+        None
+    """
+    policy = policy or archive.CompressionPolicy.default()
+
+    if deterministic or archive.resolve_jobs(jobs) > 1:
+        start = target.tell() if is_file_object(target) else None
+        try:
+            archive.build_zip(target, path, jobs, policy, deterministic)
+            return
+        except ValueError as error:
+            logger.warning("{} Falling back to serial compression.".format(error))
+            if start is not None:  # drop whatever was written before the failure, a named file is recreated anyway
+                target.seek(start)
+                target.truncate()
+
+    with zipfile.ZipFile(target, 'w', zipfile.ZIP_DEFLATED) as zip_handle:
+        for full_path, arcname in archive.list_files(path):
+            level = policy.level(arcname)
+            if level:
+                zip_handle.write(full_path, arcname, zipfile.ZIP_DEFLATED, level)
+            else:
+                zip_handle.write(full_path, arcname, zipfile.ZIP_STORED)
+
+
+def _update_zip(zip_name, path, previous, jobs=1, policy=None, deterministic=False):
+    """
+    Zip a folder reusing unchanged entries of a previous archive (see archive.update_zip). Falls back to zipping the
+    whole folder if the previous archive cannot be used.
+    """
+    # Write next to the target and replace it at the end, the previous archive may be the target itself.
+    handle, temp_name = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(zip_name)), suffix='.tmp')
+    os.close(handle)
+    try:
+        try:
+            reused, compressed = archive.update_zip(temp_name, path, previous, jobs, policy, deterministic)
+            logger.debug("Reused {} entries, compressed {} files".format(reused, compressed))
+        except (ValueError, zipfile.BadZipFile) as error:
+            logger.warning("{} Zipping the whole folder instead.".format(error))
+            _zip_folder(temp_name, path, jobs, policy, deterministic)
+        # mkstemp creates the file readable by the user only, keep the permissions a plain write would have.
+        os.chmod(temp_name, _file_mode(zip_name))
+        os.replace(temp_name, zip_name)
+    except BaseException:
+        os.remove(temp_name)
+        raise
+
+
+def _file_mode(filename):
+    """ Permissions of an existing file, or the default permissions of a new file if it does not exist. """
+    try:
+        return stat.S_IMODE(os.stat(filename).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+
+def make_zip(zip_name, path, dest_dir=None, jobs=1, cache=None, previous=None, policy=None, deterministic=False):
     """
 
     Args:
         zip_name(str): Name of the new zip archive.
         path(str): Root folder of the path to zip.
         dest_dir(str, optional): If set, place the created zip to this directory.
+        jobs(int, optional): Number of processes compressing files in parallel. 0 means one per CPU core.
+        cache(package_cache.PackageCache, optional): If set, reuse an archive previously built from an unchanged
+                                                     folder, and store newly built archives there.
+        previous(str, optional): If set and the file exists, it is an archive previously built from the same folder.
+                                 Compressed data of its unchanged entries is reused. May be the same file as the
+                                 new zip archive.
+        policy(archive.CompressionPolicy, optional): Compression of individual files. By default, files of already
+                                                     compressed formats (images, fonts, media) are only stored.
+        deterministic(bool, optional): If true, entries are sorted and get fixed timestamps and permissions, so that
+                                       the same files always produce a byte-identical archive.
 
     Returns:
         Name of the created zip archive.
@@ -30,24 +121,121 @@ def make_zip(zip_name, path, dest_dir=None):
     if dest_dir:
         zip_name = os.path.join(dest_dir, zip_name)
 
-    logger.info("Creating zipfile {}".format(zip_name))
-    zip_handle = zipfile.ZipFile(zip_name, 'w', zipfile.ZIP_DEFLATED)
+    if cache:
+        key = cache.key(path, policy, deterministic)
+        cached = cache.get(key)
+        if cached:
+            logger.info("Reusing cached zipfile for {}".format(zip_name))
+            shutil.copyfile(cached, zip_name)
+            return zip_name
+
+    if previous and os.path.exists(previous):
+        logger.info("Updating zipfile {} from {}".format(zip_name, previous))
+        _update_zip(zip_name, path, previous, jobs, policy, deterministic)
+    else:
+        logger.info("Creating zipfile {}".format(zip_name))
+        _zip_folder(zip_name, path, jobs, policy, deterministic)
+
+    if cache:
+        cache.put(key, zip_name)
+    return zip_name
+
 
-    orig_cwd = os.getcwd()
+def make_zip_buffer(path, max_size=None, jobs=1, cache=None, policy=None, deterministic=False):
+    """
+    Zip a folder into a spooled temporary file instead of a named file on disk.
 
-    os.chdir(path)
-    for root, dirs, files in os.walk('.'):
-        for file in files:
-            zip_handle.write(os.path.join(root, file))
+    The archive is kept in memory and only rolled over to a (nameless) temporary file once it grows over max_size
+    bytes, so small and medium extensions never touch the disk.
 
-    os.chdir(orig_cwd)
-    return zip_name
+    Args:
+        path(str): Root folder of the path to zip.
+        max_size(int, optional): Spill threshold in bytes. Defaults to util.spool_max_size.
+        jobs(int, optional): Number of processes compressing files in parallel. 0 means one per CPU core.
+        cache(package_cache.PackageCache, optional): If set, reuse an archive previously built from an unchanged
+                                                     folder, and store newly built archives there.
+        policy(archive.CompressionPolicy, optional): Compression of individual files, see make_zip.
+        deterministic(bool, optional): If true, the same files always produce a byte-identical archive.
+
+    Returns:
+        file: The archive, rewound to its beginning. A tempfile.SpooledTemporaryFile, or the opened cached archive
+              on a cache hit.
+    """
+    if max_size is None:
+        max_size = spool_max_size
+
+    if cache:
+        key = cache.key(path, policy, deterministic)
+        cached = cache.get(key)
+        if cached:
+            return open(cached, 'rb')
+
+    logger.info("Creating in-memory zipfile of {}".format(path))
+    buffer = tempfile.SpooledTemporaryFile(max_size=max_size)
+    _zip_folder(buffer, path, jobs, policy, deterministic)
+    buffer.seek(0)
+
+    if cache:
+        cache.put(key, buffer)
+    return buffer
+
+
+def is_file_object(archive):
+    """
+    Check whether the given archive is an opened file object rather than a filename.
+
+    Args:
+        archive(str or file): Filename or a file object.
+
+    Returns:
+        bool: True if archive is a file-like object.
+    """
+    return hasattr(archive, 'read')
+
+
+def archive_name(archive, default="extension.zip"):
+    """
+    Get a printable name of an archive given either as a filename or a file object.
+
+    Args:
+        archive(str or file): Filename or a file object.
+        default(str, optional): Name to use if the file object has no name of its own.
+
+    Returns:
+        str: Base name of the archive.
+    """
+    if is_file_object(archive):
+        name = getattr(archive, 'name', None)
+        if not isinstance(name, str):
+            return default
+        archive = name
+    return os.path.basename(archive)
+
+
+@contextmanager
+def open_archive(archive):
+    """
+    Context managed function yielding a readable binary file object of an archive.
+
+    Filenames are opened and closed again on exit. File objects are rewound and yielded as they are, closing them
+    is left to the caller.
+
+    Args:
+        archive(str or file): Filename or a file object of the archive.
+
+    Returns:
+        file: Binary file object positioned at the beginning of the archive.
+    """
+    if is_file_object(archive):
+        archive.seek(0)
+        yield archive
+    else:
+        with open(archive, 'rb') as handle:
+            yield handle
 
 
 def clean():
-    # logger.debug("Cleaning temporary directory: {}".format(build_dir))
-    # shutil.rmtree(build_dir, ignore_errors=True)
-    pass
+    scratch_space.cleanup()
 
 
 def handle_requests_response_status(response: requests.Response):
@@ -125,7 +313,7 @@ def unzip(filename, dest_dir):
 
     """
     if os.path.exists(dest_dir):
-        shutil.rmtree(dest_dir)
+        scratch_space.discard(dest_dir)
     os.mkdir(dest_dir)
 
     zip_file = zipfile.ZipFile(filename)
@@ -180,4 +368,36 @@ def temp_dir(directory):
     shutil.rmtree(directory, ignore_errors=True)
 
 
+@contextmanager
+def locked_file(lock_name):
+    """
+    Context managed exclusive lock of a file, shared by all processes. Blocks until the lock is obtained.
+
+    Use::
+
+       with locked_file(filename + '.lock'):
+           pass
+
+    Args:
+        lock_name(str): Name of the lock file. It is created if it does not exist.
+
+    Returns:
+        None
+    """
+    with open(lock_name, 'a+b') as f:
+        if fcntl:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+        try:
+            yield
+        finally:
+            if fcntl:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
 atexit.register(clean)